@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+Table allocation benchmark
+
+Replays the same stream of walk-in parties against one restaurant floor
+twice: once the way the booking form used to work (each party picks any
+free table that fits, no combining) and once with booking.choose_tables
+(smallest fitting table, else the tightest combination). Reports parties
+turned away and seat utilisation for each, then times book_party() against
+a real database to show the allocator is cheap enough for the booking path.
+
+Usage:
+    python allocation_benchmark.py [--days 200] [--demand 1.2] [--seed 7]
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+
+import app as booking_app
+import booking
+import db
+
+# table_number, capacity, combine_group
+FLOOR = [
+    ('T1', 2, None), ('T2', 2, None), ('T3', 2, 'window'), ('T4', 2, 'window'),
+    ('T5', 4, 'hall'), ('T6', 4, 'hall'), ('T7', 4, 'hall'), ('T8', 4, None), ('T9', 4, None),
+    ('T10', 6, 'terrace'), ('T11', 6, 'terrace'), ('T12', 8, None),
+]
+
+# Non-overlapping service slots
+SLOTS = ['12:00', '13:30', '19:00', '20:30']
+
+# Party size -> relative frequency
+PARTY_SIZES = {1: 5, 2: 35, 3: 12, 4: 20, 5: 7, 6: 8, 7: 3, 8: 4, 10: 4, 12: 2}
+
+def parties_for_slot(rng, demand):
+    """Random parties whose guests add up to roughly ``demand`` times the floor's seats"""
+    seats = sum(capacity for _, capacity, _ in FLOOR)
+    sizes, weights = list(PARTY_SIZES), list(PARTY_SIZES.values())
+    parties, guests = [], 0
+    while guests < seats * demand:
+        party = rng.choices(sizes, weights)[0]
+        parties.append(party)
+        guests += party
+    return parties
+
+def pick_any_fitting(rng, free, party):
+    fitting = [table for table in free if table['capacity'] >= party]
+    return [rng.choice(fitting)] if fitting else []
+
+def simulate(policy, days, demand, seed):
+    """Seat every slot's parties in arrival order; return totals"""
+    demand_rng, choice_rng = random.Random(seed), random.Random(seed + 1)
+    floor = [{'id': number, 'table_number': name, 'capacity': capacity, 'combine_group': group}
+             for number, (name, capacity, group) in enumerate(FLOOR, 1)]
+    totals = {'parties': 0, 'seated': 0, 'guests': 0, 'guests_seated': 0, 'seats_used': 0, 'combined': 0}
+    for _ in range(days * len(SLOTS)):
+        free = list(floor)
+        for party in parties_for_slot(demand_rng, demand):
+            totals['parties'] += 1
+            totals['guests'] += party
+            if policy == 'any':
+                tables = pick_any_fitting(choice_rng, free, party)
+            else:
+                tables = booking.choose_tables(free, party)
+            if tables:
+                totals['seated'] += 1
+                totals['guests_seated'] += party
+                totals['seats_used'] += sum(table['capacity'] for table in tables)
+                totals['combined'] += len(tables) > 1
+                free = [table for table in free if table not in tables]
+    totals['seats_offered'] = days * len(SLOTS) * sum(capacity for _, capacity, _ in FLOOR)
+    return totals
+
+def time_book_party(requests, seed):
+    """Time booking.book_party() on a temporary database; return latencies in seconds"""
+    path = os.path.join(tempfile.mkdtemp(prefix='booking-alloc-'), 'alloc.db')
+    booking_app.app.config['DATABASE'] = path
+    booking_app.init_db()
+    booking_app.populate_sample_data()
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO users (username, password, email, phone) VALUES ('bench', 'password123', 'b@email.com', '0')")
+    conn.executemany('INSERT INTO restaurant_tables (restaurant_id, table_number, capacity, combine_group) VALUES (1, ?, ?, ?)',
+                     FLOOR)
+    conn.commit()
+    conn.close()
+
+    rng = random.Random(seed)
+    sizes, weights = list(PARTY_SIZES), list(PARTY_SIZES.values())
+    conn = booking_app.get_db_connection()
+    latencies = []
+    for i in range(requests):
+        slot = booking.parse_time(SLOTS[i % len(SLOTS)])
+        booking_date = '2030-%02d-%02d' % (1 + i // 2000 % 12, 1 + i // 80 % 25)
+        started = time.perf_counter()
+        booking.book_party(conn, 1, 1, booking_date, slot, rng.choices(sizes, weights)[0])
+        conn.commit()
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+    db.reset_pools()
+    return sorted(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare table allocation policies')
+    parser.add_argument('--days', type=int, default=200)
+    parser.add_argument('--demand', type=float, default=1.2, help='guests per slot as a multiple of seats')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--requests', type=int, default=2000, help='book_party() calls to time')
+    args = parser.parse_args()
+
+    print("🍽️ Restaurant Booking System - Table Allocation Benchmark")
+    print("=" * 50)
+    print(f"{'policy':<22}{'turned away':>12}{'utilisation':>13}{'fit':>8}{'combined':>10}")
+    for policy, label in [('any', 'party picks a table'), ('best', 'best-fit allocator')]:
+        totals = simulate(policy, args.days, args.demand, args.seed)
+        turned_away = 1 - totals['seated'] / totals['parties']
+        utilisation = totals['guests_seated'] / totals['seats_offered']
+        fit = totals['guests_seated'] / totals['seats_used']
+        print(f"{label:<22}{turned_away:>11.1%}{utilisation:>13.1%}{fit:>8.1%}{totals['combined']:>10}")
+    print("utilisation = guests seated / seats on offer; fit = guests seated / seats at their tables")
+
+    latencies = time_book_party(args.requests, args.seed)
+    print(f"\n⏱️  book_party(): p50 {latencies[len(latencies) // 2] * 1e6:.0f} µs, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1e6:.0f} µs over {len(latencies)} bookings")
+
+if __name__ == '__main__':
+    main()
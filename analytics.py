@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Occupancy and demand analytics
+
+The admin analytics page reads two rollup tables (migration
+``analytics_rollups``) and never the raw bookings or ratings:
+
+    booking_hourly   restaurant x date x hour: parties starting in the hour,
+                     their covers, and table-minutes held in the hour
+    rating_daily     restaurant x day: rating count and criterion sums
+
+Triggers keep both current as bookings and ratings are written, whatever
+writes them. rebuild() recomputes them from the raw tables with NumPy,
+e.g. after a bulk load or to check the triggers:
+
+    python analytics.py --rebuild [--database restaurant_booking.db]
+"""
+
+import argparse
+import sqlite3
+import time
+from datetime import date, timedelta
+
+import migrations
+
+# Bookings that count as demand; cancelled and no-show ones do not
+COUNTED_STATUSES = ('confirmed', 'seated', 'completed')
+
+# Hours of the day rollups cover; slots running past midnight land in hours 24 and up
+ROLLUP_HOURS = 48
+
+_EPOCH = date(1970, 1, 1)
+_EPOCH_DAY = "CAST(julianday(%s) - 2440587.5 AS INTEGER)"
+
+
+def _ratio(part, whole):
+    return part / whole if whole else None
+
+
+def report(conn, restaurant_id, date_from, date_to):
+    """Covers per hour, utilisation, party size and rating trend for one restaurant, ``date_from``..``date_to``"""
+    days = (date.fromisoformat(date_to) - date.fromisoformat(date_from)).days + 1
+    tables = conn.execute('SELECT COUNT(*) FROM restaurant_tables WHERE restaurant_id = ? AND is_available = 1',
+                          (restaurant_id,)).fetchone()[0]
+
+    hours = []
+    for row in conn.execute('''
+        SELECT hour, SUM(parties), SUM(covers), SUM(table_minutes)
+        FROM booking_hourly
+        WHERE restaurant_id = ? AND booking_date BETWEEN ? AND ?
+        GROUP BY hour
+        ORDER BY hour
+    ''', (restaurant_id, date_from, date_to)):
+        hour, parties, covers, table_minutes = row
+        hours.append({'hour': hour, 'parties': parties, 'covers': covers,
+                      'avg_party_size': _ratio(covers, parties),
+                      'utilisation': _ratio(table_minutes, tables * 60 * days)})
+
+    trend = {}
+    for row in conn.execute('''
+        SELECT booking_date, SUM(parties), SUM(covers), SUM(table_minutes)
+        FROM booking_hourly
+        WHERE restaurant_id = ? AND booking_date BETWEEN ? AND ?
+        GROUP BY booking_date
+    ''', (restaurant_id, date_from, date_to)):
+        trend[row[0]] = {'date': row[0], 'parties': row[1], 'covers': row[2], 'table_hours': row[3] / 60,
+                         'avg_party_size': _ratio(row[2], row[1]), 'rating_count': 0, 'avg_rating': None}
+    for row in conn.execute('''
+        SELECT rating_date, rating_count, overall_sum
+        FROM rating_daily
+        WHERE restaurant_id = ? AND rating_date BETWEEN ? AND ?
+    ''', (restaurant_id, date_from, date_to)):
+        day = trend.setdefault(row[0], {'date': row[0], 'parties': 0, 'covers': 0, 'table_hours': 0,
+                                        'avg_party_size': None})
+        day.update(rating_count=row[1], avg_rating=_ratio(row[2], row[1]))
+    trend = [trend[day] for day in sorted(trend)]
+
+    parties = sum(hour['parties'] for hour in hours)
+    covers = sum(hour['covers'] for hour in hours)
+    rating_count = sum(day['rating_count'] for day in trend)
+    rating_sum = sum(day['avg_rating'] * day['rating_count'] for day in trend if day['rating_count'])
+    return {'tables': tables, 'days': days, 'hours': hours, 'trend': trend,
+            'totals': {'parties': parties, 'covers': covers, 'avg_party_size': _ratio(covers, parties),
+                       'rating_count': rating_count, 'avg_rating': _ratio(rating_sum, rating_count)}}
+
+
+def _columns(np, rows, count, floats=0):
+    """The columns of ``rows`` as NumPy arrays: integers, then the last ``floats`` as floats"""
+    columns = list(zip(*rows)) if rows else [()] * count
+    return [np.array(column, dtype=np.float64 if index >= count - floats else np.int64)
+            for index, column in enumerate(columns)]
+
+
+def _group_sums(np, keys, *weights):
+    """Distinct keys and the sum of each weight per key"""
+    unique, inverse = np.unique(keys, return_inverse=True)
+    return unique, [np.bincount(inverse, weights=weight, minlength=len(unique)) for weight in weights]
+
+
+def _day_names(np, day_numbers):
+    names = {int(day): (_EPOCH + timedelta(days=int(day))).isoformat() for day in np.unique(day_numbers)}
+    return [names[day] for day in day_numbers.tolist()]
+
+
+def rebuild(conn):
+    """Recompute both rollups from bookings and ratings; return ``(booking_hourly rows, rating_daily rows)``.
+
+    Rows are read once and aggregated with NumPy: each booking is spread over
+    the hours its slot touches, then summed per (restaurant, day, hour) key.
+    The caller commits.
+    """
+    import numpy as np
+
+    restaurant, day, start, end, party, parent = _columns(np, conn.execute(f'''
+        SELECT restaurant_id, {_EPOCH_DAY % 'booking_date'}, start_minute, end_minute, party_size, parent_id IS NULL
+        FROM bookings
+        WHERE status IN ({', '.join('?' * len(COUNTED_STATUSES))})
+          AND restaurant_id IS NOT NULL AND start_minute IS NOT NULL AND end_minute IS NOT NULL
+    ''', COUNTED_STATUSES).fetchall(), 6)
+
+    # One entry per (booking, hour touched)
+    first = start // 60
+    spans = np.maximum((end - 1) // 60 - first + 1, 0)
+    booking = np.repeat(np.arange(len(start)), spans)
+    hour = first[booking] + np.arange(len(booking)) - np.repeat(np.cumsum(spans) - spans, spans)
+    minutes = np.minimum(end[booking], hour * 60 + 60) - np.maximum(start[booking], hour * 60)
+    opens = (hour == first[booking]) & (parent[booking] == 1)
+    keep = hour < ROLLUP_HOURS
+    booking, hour, minutes, opens = booking[keep], hour[keep], minutes[keep], opens[keep]
+
+    day_floor = int(day.min()) if len(day) else 0
+    day_count = int(day.max()) - day_floor + 1 if len(day) else 1
+    keys = (restaurant[booking] * day_count + (day[booking] - day_floor)) * ROLLUP_HOURS + hour
+    keys, (parties, covers, table_minutes) = _group_sums(np, keys, opens, np.where(opens, party[booking], 0),
+                                                         minutes)
+    hourly = list(zip((keys // ROLLUP_HOURS // day_count).tolist(),
+                      _day_names(np, keys // ROLLUP_HOURS % day_count + day_floor),
+                      (keys % ROLLUP_HOURS).tolist(),
+                      parties.astype(np.int64).tolist(), covers.astype(np.int64).tolist(),
+                      table_minutes.astype(np.int64).tolist()))
+
+    restaurant, day, *scores = _columns(np, conn.execute(f'''
+        SELECT restaurant_id, {_EPOCH_DAY % 'created_at'}, COALESCE(overall_rating, 0), COALESCE(customer_service, 0),
+               COALESCE(food_quality, 0), COALESCE(respect, 0)
+        FROM ratings
+        WHERE restaurant_id IS NOT NULL AND created_at IS NOT NULL
+    ''').fetchall(), 6, floats=4)
+    day_floor = int(day.min()) if len(day) else 0
+    day_count = int(day.max()) - day_floor + 1 if len(day) else 1
+    keys, sums = _group_sums(np, restaurant * day_count + (day - day_floor), np.ones(len(day)), *scores)
+    daily = list(zip((keys // day_count).tolist(), _day_names(np, keys % day_count + day_floor),
+                     *(column.tolist() for column in sums)))
+
+    conn.execute('DELETE FROM booking_hourly')
+    conn.executemany('''INSERT INTO booking_hourly (restaurant_id, booking_date, hour, parties, covers, table_minutes)
+                        VALUES (?, ?, ?, ?, ?, ?)''', hourly)
+    conn.execute('DELETE FROM rating_daily')
+    conn.executemany('''INSERT INTO rating_daily (restaurant_id, rating_date, rating_count, overall_sum,
+                                                  customer_service_sum, food_quality_sum, respect_sum)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                     [(rid, day, int(count), *sums) for rid, day, count, *sums in daily])
+    return len(hourly), len(daily)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain the analytics rollups')
+    parser.add_argument('--rebuild', action='store_true', help='recompute the rollups from all bookings and ratings')
+    parser.add_argument('--database', default='restaurant_booking.db')
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    conn = sqlite3.connect(args.database)
+    migrations.migrate(conn)
+    started = time.perf_counter()
+    with conn:
+        hourly, daily = rebuild(conn)
+    conn.close()
+    print(f"✅ Rebuilt {hourly} hourly booking rollups and {daily} daily rating rollups "
+          f"in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,137 +1,357 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, g, has_app_context, \
+    abort, Response, stream_with_context
+from markupsafe import escape
 import sqlite3
-from datetime import datetime
+from datetime import date, datetime, timedelta
+import functools
 import os
+import uuid
+import zlib
+
+import analytics
+import booking
+import cache
+import catalog_import
+import db
+import exports
+import idempotency
+import metrics
+import migrations
+import offers
+import lifecycle
+import ratings
+import search
+import shards
+import snapshots
+import versions
+import waitlist
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
 
-# Database configuration
+# Database configuration (connection pool and PRAGMA tuning, see db.py)
 DATABASE = 'restaurant_booking.db'
+app.config['DATABASE'] = DATABASE
+app.config.update(db.DEFAULT_SETTINGS)
+
+# One database file per city in this directory (see shards.py); None keeps everything in DATABASE
+app.config.update(DB_SHARD_DIR=None)
+
+# Routes marked with @serves_snapshot read from a copy of DATABASE refreshed every
+# READ_SNAPSHOT_INTERVAL seconds (see snapshots.py); READ_SNAPSHOT_DIR holds the copies (default: temp dir)
+app.config.update(READ_SNAPSHOTS=False, READ_SNAPSHOT_INTERVAL=snapshots.REFRESH_SECONDS, READ_SNAPSHOT_DIR=None)
+
+# Catalog cache (see cache.py); CACHE_STORE is an optional SQLite file shared by workers
+app.config.update(CACHE_ENABLED=True, CACHE_MAX_ENTRIES=4096, CACHE_TTL=300, CACHE_STORE=None)
+
+# Waitlist promotion runs on a background thread (see waitlist.py)
+app.config.update(WAITLIST_WORKER=True, WAITLIST_POLL_SECONDS=waitlist.POLL_SECONDS)
+
+# Bookings are seated, completed and released on a background tick (see lifecycle.py); turn
+# LIFECYCLE_SCHEDULER off when `python lifecycle.py` runs as a separate worker. With NO_SHOW_MINUTES
+# set, staff seat parties themselves and unseated ones become no-shows that long after their start.
+app.config.update(LIFECYCLE_SCHEDULER=True, LIFECYCLE_TICK_SECONDS=lifecycle.TICK_SECONDS, NO_SHOW_MINUTES=None)
+
+# Thread pools for the async serving mode (see async_server.py)
+app.config.update(ASYNC_READ_THREADS=8, ASYNC_WRITE_THREADS=2)
+
+# Rendered listing and menu pages, stored compressed and keyed on data versions (see cached_page);
+# a version read from SQLite is trusted for PAGE_VERSION_TTL seconds, or until a write here drops it
+app.config.update(PAGE_CACHE_ENABLED=True, PAGE_CACHE_MAX_ENTRIES=1024, PAGE_VERSION_TTL=1.0)
 
-def get_db_connection():
-    conn = sqlite3.connect(DATABASE)
-    conn.row_factory = sqlite3.Row
+# Stands in for the viewer's name while a shared page is rendered
+PAGE_USER_MARK = '\x00page-user\x00'
+
+# Per-endpoint request and SQL metrics, served at /metrics (see metrics.py)
+app.config.update(METRICS_ENABLED=True)
+
+# A booking or rating post repeating an idempotency key within this many seconds gets the
+# first post's response and writes nothing (see idempotency.py)
+app.config.update(IDEMPOTENCY_TTL=idempotency.TTL_SECONDS)
+
+def get_db_connection(restaurant_id=None, location_id=None, users=False, fresh=False):
+    """Get a pooled connection; close() returns it to this thread's pool.
+
+    In sharded mode a ``restaurant_id`` or ``location_id`` picks that city's
+    shard, and ``users=True`` lets reads on it join the catalog's users.
+    Anything else, and every connection when unsharded, goes to the catalog.
+    Routes marked with @serves_snapshot read the catalog from a snapshot
+    unless ``fresh`` is set.
+    """
+    if app.config['READ_SNAPSHOTS'] and not fresh and has_app_context() and 'snapshot_max_age' in g:
+        # Only the catalog is snapshotted when sharded
+        if not app.config['DB_SHARD_DIR'] or (restaurant_id is None and location_id is None):
+            conn = get_snapshots().connect(g.snapshot_max_age)
+            if conn is not None:
+                g.setdefault('db_connections', []).append(conn)
+                return conn
+    
+    database = attach = None
+    if app.config['DB_SHARD_DIR']:
+        if location_id is None and restaurant_id is not None:
+            restaurant = get_restaurant(restaurant_id)
+            location_id = restaurant['location_id'] if restaurant else None
+        if location_id is not None:
+            database = shards.shard_path(app.config['DB_SHARD_DIR'], location_id)
+            attach = app.config['DATABASE'] if users else None
+    conn = db.connect(app.config, database, attach)
+    if has_app_context():
+        # Anything a request forgets to close is released at teardown
+        g.setdefault('db_connections', []).append(conn)
     return conn
 
-def init_db():
-    """Initialize database with all required tables"""
-    conn = get_db_connection()
+def get_snapshots():
+    """The read-snapshot manager, with a first snapshot taken and refreshing started"""
+    if 'read_snapshots' not in app.extensions:
+        settings = {name: app.config.get(name, default) for name, default in db.DEFAULT_SETTINGS.items()}
+        manager = snapshots.SnapshotManager(app.config['DATABASE'], settings, app.config['READ_SNAPSHOT_INTERVAL'],
+                                            app.config['READ_SNAPSHOT_DIR'])
+        manager.refresh()
+        app.extensions['read_snapshots'] = manager
+    manager = app.extensions['read_snapshots']
+    manager.start()
+    return manager
+
+def serves_snapshot(max_age):
+    """Declare a read-only route that may see data up to ``max_age`` seconds old.
+
+    With READ_SNAPSHOTS on its reads go to the latest snapshot while that is
+    young enough, and to the primary otherwise.  Cached catalog data is
+    still loaded from the primary.
+    """
+    def decorate(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            g.snapshot_max_age = max_age
+            return view(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def shard_connections():
+    """One connection per city shard, or just the catalog when unsharded"""
+    if not app.config['DB_SHARD_DIR']:
+        return [get_db_connection()]
+    return [get_db_connection(location_id=location['id']) for location in get_locations()]
+
+def row_connections(row_id):
+    """Connections to the databases that may hold a booking or waitlist entry, most likely first"""
+    location_id = shards.location_of(row_id) if app.config['DB_SHARD_DIR'] else None
+    if location_id is not None:
+        return [get_db_connection(location_id=location_id)]
+    return shard_connections()
+
+def idempotency_key():
+    """This submission's key, from the Idempotency-Key header or the form; ``None`` without one"""
+    key = request.headers.get('Idempotency-Key') or request.form.get('idempotency_key')
+    if key and len(key) > idempotency.KEY_MAX_LENGTH:
+        abort(400)
+    return key or None
+
+@app.template_global()
+def new_idempotency_key():
+    """A key for one rendered form, so a double tap or retry of it sends the same key"""
+    return uuid.uuid4().hex
+
+def replay_submission(response):
+    """Answer a repeated submission as the first one was answered"""
+    for message in response['messages']:
+        flash(message)
+    return redirect(response['location'])
+
+def remember_submission(conn, key, messages, location):
+    """Flash ``messages``, store them and ``location`` under ``key`` if there is one; return the redirect"""
+    if key:
+        idempotency.remember(conn, session['user_id'], request.endpoint, key,
+                             {'messages': messages, 'location': location}, app.config['IDEMPOTENCY_TTL'])
+    for message in messages:
+        flash(message)
+    return redirect(location)
+
+@app.teardown_appcontext
+def release_db_connections(exception):
+    for conn in g.pop('db_connections', []):
+        conn.close()
+
+def get_metrics():
+    if 'metrics' not in app.extensions:
+        app.extensions['metrics'] = metrics.Registry()
+    return app.extensions['metrics']
+
+@app.before_request
+def start_request_metrics():
+    if app.config['METRICS_ENABLED']:
+        db.sql_stats.reset()
+        request.environ['metrics.started'] = get_metrics().request_started(request.endpoint)
+
+@app.after_request
+def record_request_metrics(response):
+    # Streamed bodies are produced after this runs, so an export counts only up to its first byte
+    started = request.environ.pop('metrics.started', None)
+    if started is not None:
+        # Count connections the view has not closed yet; teardown closes them later
+        for conn in g.get('db_connections', []):
+            if getattr(conn, 'checked_out', False) and hasattr(conn, 'flush_stats'):
+                conn.flush_stats()
+        get_metrics().request_finished(request.endpoint, request.method, response.status_code, started,
+                                       db.sql_stats)
+    return response
+
+def get_catalog_cache():
+    """The app's catalog cache, created from the config on first use"""
+    if 'catalog_cache' not in app.extensions:
+        store = cache.SQLiteStore(app.config['CACHE_STORE']) if app.config['CACHE_STORE'] else None
+        app.extensions['catalog_cache'] = cache.Cache(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_TTL'], store)
+    return app.extensions['catalog_cache']
+
+def cached_load(key, tags, fetch, **route):
+    """Cache what ``fetch(conn)`` returns, which must be plain data.
+
+    ``route`` (restaurant_id or location_id) picks the shard to query.
+    """
+    def load():
+        # Cached rows outlive the request, so they never come from a snapshot
+        conn = get_db_connection(fresh=True, **route)
+        try:
+            return fetch(conn)
+        finally:
+            conn.close()
     
-    # Users table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            email TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Locations table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS locations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            city_name TEXT UNIQUE NOT NULL
-        )
-    ''')
-    
-    # Restaurants table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS restaurants (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            location_id INTEGER,
-            cuisine_type TEXT NOT NULL,
-            is_veg_only INTEGER DEFAULT 0,
-            description TEXT,
-            image_url TEXT,
-            FOREIGN KEY (location_id) REFERENCES locations (id)
-        )
-    ''')
-    
-    # Tables in restaurants
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS restaurant_tables (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            restaurant_id INTEGER,
-            table_number TEXT NOT NULL,
-            capacity INTEGER NOT NULL,
-            is_available INTEGER DEFAULT 1,
-            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
-        )
-    ''')
-    
-    # Bookings table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS bookings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            restaurant_id INTEGER,
-            table_id INTEGER,
-            booking_date DATE NOT NULL,
-            booking_time TIME NOT NULL,
-            party_size INTEGER NOT NULL,
-            status TEXT DEFAULT 'confirmed',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id),
-            FOREIGN KEY (table_id) REFERENCES restaurant_tables (id)
-        )
-    ''')
-    
-    # Menu items table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS menu_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            restaurant_id INTEGER,
-            item_name TEXT NOT NULL,
-            description TEXT,
-            price REAL NOT NULL,
-            category TEXT NOT NULL,
-            is_veg INTEGER DEFAULT 1,
-            image_url TEXT,
-            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
-        )
-    ''')
-    
-    # Ratings table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS ratings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            restaurant_id INTEGER,
-            customer_service INTEGER CHECK(customer_service >= 1 AND customer_service <= 5),
-            food_quality INTEGER CHECK(food_quality >= 1 AND food_quality <= 5),
-            respect INTEGER CHECK(respect >= 1 AND respect <= 5),
-            overall_rating REAL,
-            review_text TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
-        )
-    ''')
-    
-    # Special offers table
-    conn.execute('''
-        CREATE TABLE IF NOT EXISTS special_offers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            restaurant_id INTEGER,
-            title TEXT NOT NULL,
-            description TEXT NOT NULL,
-            discount_percentage REAL,
-            valid_from DATE,
-            valid_to DATE,
-            is_active INTEGER DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
-        )
-    ''')
+    if not app.config['CACHE_ENABLED']:
+        return load()
+    return get_catalog_cache().get_or_load(key, load, tags)
+
+def cached_query(key, tags, sql, params=(), one=False, **route):
+    """Run a catalog query through the cache; rows come back as plain dicts"""
+    def fetch(conn):
+        rows = [dict(row) for row in conn.execute(sql, params).fetchall()]
+        return (rows[0] if rows else None) if one else rows
     
-    conn.commit()
+    return cached_load(key, tags, fetch, **route)
+
+def get_locations():
+    return cached_query(('locations',), ('locations',), 'SELECT * FROM locations ORDER BY city_name')
+
+def get_location(location_id):
+    return cached_query(('location', location_id), ('locations',),
+                        'SELECT * FROM locations WHERE id = ?', (location_id,), one=True)
+
+def get_cuisines():
+    return [row['cuisine_type'] for row in cached_query(
+        ('cuisines',), ('locations',), 'SELECT DISTINCT cuisine_type FROM restaurants ORDER BY cuisine_type')]
+
+def get_restaurant(restaurant_id):
+    return cached_query(('restaurant', restaurant_id), ('restaurant:%s' % restaurant_id,),
+                        'SELECT * FROM restaurants WHERE id = ?', (restaurant_id,), one=True)
+
+def get_menu_items(restaurant_id, veg_only):
+    # Pure vegetarian restaurants only list vegetarian items
+    sql = 'SELECT * FROM menu_items WHERE restaurant_id = ? %s ORDER BY category' % ('AND is_veg = 1' if veg_only else '')
+    return cached_query(('menu', restaurant_id, bool(veg_only)), ('restaurant:%s' % restaurant_id,),
+                        sql, (restaurant_id,), restaurant_id=restaurant_id)
+
+def get_active_offers(restaurant_id, day=None):
+    """Offers valid on ``day`` (default today) at one restaurant"""
+    day = day or datetime.now().date().isoformat()
+    return cached_load(('offers', restaurant_id, day), ('restaurant:%s' % restaurant_id,),
+                       lambda conn: offers.active_offers(conn, [restaurant_id], day).get(restaurant_id, []),
+                       restaurant_id=restaurant_id)
+
+def get_location_offers(location_id, day=None):
+    """Offers valid on ``day`` (default today) at every restaurant in a city, ``{restaurant_id: [offer, ...]}``"""
+    day = day or datetime.now().date().isoformat()
+    return cached_load(('location-offers', location_id, day), ('location:%s' % location_id,),
+                       lambda conn: offers.location_offers(conn, location_id, day), location_id=location_id)
+
+def invalidate_restaurant(restaurant_id):
+    """Drop cached catalog data for a restaurant; call after every write that touches it"""
+    if 'catalog_cache' in app.extensions:
+        app.extensions['catalog_cache'].invalidate('restaurant:%s' % restaurant_id)
+    restaurant = get_restaurant(restaurant_id)
+    if restaurant and 'catalog_cache' in app.extensions:
+        # Per-city data such as the offers of every restaurant in it
+        app.extensions['catalog_cache'].invalidate('location:%s' % restaurant['location_id'])
+    if 'page_cache' in app.extensions:
+        # Re-read the versions of its menu and its city's listing on the next request
+        versions, _ = app.extensions['page_cache']
+        versions.invalidate('restaurant:%s' % restaurant_id)
+        if restaurant:
+            versions.invalidate('location:%s' % restaurant['location_id'])
+
+def get_page_cache():
+    """``(versions, pages)``: data versions per page, and compressed pages per page and version"""
+    if 'page_cache' not in app.extensions:
+        app.extensions['page_cache'] = (cache.Cache(4096, app.config['PAGE_VERSION_TTL']),
+                                        cache.Cache(app.config['PAGE_CACHE_MAX_ENTRIES'], ttl=24 * 3600))
+    return app.extensions['page_cache']
+
+def cached_page(key, tags, load_version, render):
+    """Serve a page from the rendered-page cache.
+
+    ``key`` names the page, e.g. ``('menu', 5)``; the cache key adds the data
+    version ``load_version()`` returns, so a write makes the next request
+    render it afresh while a hot page costs neither SQLite nor Jinja.
+    ``render(**context)`` renders the page; it is rendered once for everyone
+    with PAGE_USER_MARK as the viewer's name, which is filled in per request.
+    Requests with flashed messages waiting are rendered directly.
+    """
+    if not app.config['PAGE_CACHE_ENABLED'] or session.get('_flashes'):
+        return render()
+    
+    versions, pages = get_page_cache()
+    version = versions.get_or_load(key, load_version, tags)
+    page = pages.get_or_load(key + (version,), lambda: zlib.compress(render(page_user=PAGE_USER_MARK).encode()),
+                             tags)
+    return zlib.decompress(page).replace(PAGE_USER_MARK.encode(), str(escape(session.get('username', ''))).encode())
+
+def get_waitlist_worker():
+    """The waitlist promotion worker, started on first use unless WAITLIST_WORKER is off"""
+    if 'waitlist_worker' not in app.extensions:
+        app.extensions['waitlist_worker'] = waitlist.PromotionWorker(shard_connections,
+                                                                     app.config['WAITLIST_POLL_SECONDS'])
+    worker = app.extensions['waitlist_worker']
+    if app.config['WAITLIST_WORKER']:
+        worker.start()
+    return worker
+
+def get_lifecycle_scheduler():
+    """The booking lifecycle scheduler, started on first use unless LIFECYCLE_SCHEDULER is off"""
+    if 'lifecycle_scheduler' not in app.extensions:
+        app.extensions['lifecycle_scheduler'] = lifecycle.LifecycleScheduler(
+            shard_connections, app.config['LIFECYCLE_TICK_SECONDS'], app.config['NO_SHOW_MINUTES'])
+    scheduler = app.extensions['lifecycle_scheduler']
+    if app.config['LIFECYCLE_SCHEDULER']:
+        scheduler.start()
+    return scheduler
+
+def start_background_workers(reloader=False):
+    """Start waitlist promotion and the lifecycle scheduler in the process that serves requests.
+
+    Werkzeug's reloader runs the startup code twice: in a parent that only watches the source files and
+    in the child that serves. With ``reloader`` only the child, which sets WERKZEUG_RUN_MAIN, starts them.
+    """
+    if reloader and os.environ.get('WERKZEUG_RUN_MAIN') != 'true':
+        return
+    get_waitlist_worker()
+    get_lifecycle_scheduler()
+
+def init_db():
+    """Create or upgrade the database schema (a no-op when already current)"""
+    conn = get_db_connection()
+    migrations.migrate(conn)
     conn.close()
+    if app.config['DB_SHARD_DIR']:
+        sync_shards()
+
+def sync_shards():
+    """Create missing city shards and copy the catalog's locations and restaurants into them"""
+    os.makedirs(app.config['DB_SHARD_DIR'], exist_ok=True)
+    catalog = get_db_connection()
+    for location in catalog.execute('SELECT id FROM locations').fetchall():
+        shard = get_db_connection(location_id=location['id'])
+        shards.prepare_shard(shard, location['id'])
+        shards.sync_directory(catalog, shard, location['id'])
+        shard.close()
+    catalog.close()
 
 def populate_sample_data():
     """Populate database with sample data"""
@@ -164,7 +384,10 @@ def populate_sample_data():
                           (restaurant_data[0], location['id'], restaurant_data[2], restaurant_data[3], restaurant_data[4]))
     
     conn.commit()
+    search.refresh(conn)
     conn.close()
+    if app.config['DB_SHARD_DIR']:
+        sync_shards()
 
 # Routes
 @app.route('/')
@@ -236,69 +459,147 @@ def admin_login():
     return render_template('admin_login.html')
 
 @app.route('/select-location')
+@serves_snapshot(max_age=60)
 def select_location():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    locations = conn.execute('SELECT * FROM locations ORDER BY city_name').fetchall()
-    conn.close()
+    locations = get_locations()
     
     return render_template('select_location.html', locations=locations)
 
 @app.route('/restaurants/<int:location_id>')
+@serves_snapshot(max_age=30)
 def restaurants_by_location(location_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    location = conn.execute('SELECT * FROM locations WHERE id = ?', (location_id,)).fetchone()
-    restaurants = conn.execute('''
-        SELECT r.*, AVG(rt.overall_rating) as avg_rating
-        FROM restaurants r
-        LEFT JOIN ratings rt ON r.id = rt.restaurant_id
-        WHERE r.location_id = ?
-        GROUP BY r.id
-        ORDER BY r.name
-    ''', (location_id,)).fetchall()
-    conn.close()
+    today = datetime.now().date().isoformat()
     
-    return render_template('restaurants.html', restaurants=restaurants, location=location)
+    def render(**context):
+        location = get_location(location_id)
+        conn = get_db_connection(location_id=location_id)
+        # Averages come from the per-restaurant aggregates kept by ratings.record_rating
+        restaurants = conn.execute('''
+            SELECT r.*, s.avg_overall as avg_rating, s.rating_count
+            FROM restaurants r
+            LEFT JOIN restaurant_rating_stats s ON s.restaurant_id = r.id
+            WHERE r.location_id = ?
+            ORDER BY r.name
+        ''', (location_id,)).fetchall()
+        conn.close()
+        return render_template('restaurants.html', restaurants=restaurants, location=location,
+                               offer_badges=get_location_offers(location_id, today), **context)
+    
+    # Offer badges change with the date as well as with the data
+    return cached_page(('restaurants', location_id, today), ('location:%s' % location_id,),
+                       lambda: location_version(location_id), render)
 
 @app.route('/restaurant/<int:restaurant_id>')
+@serves_snapshot(max_age=5)
 def restaurant_details(restaurant_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    restaurant = conn.execute('SELECT * FROM restaurants WHERE id = ?', (restaurant_id,)).fetchone()
-    tables = conn.execute('SELECT * FROM restaurant_tables WHERE restaurant_id = ? AND is_available = 1', 
-                         (restaurant_id,)).fetchall()
-    special_offers = conn.execute('SELECT * FROM special_offers WHERE restaurant_id = ? AND is_active = 1', 
-                                 (restaurant_id,)).fetchall()
+    # Optional slot to check availability for, e.g. ?date=2025-09-01&time=19:30
+    slot_date = request.args.get('date', '')
+    slot_time = request.args.get('time', '')
+    party_size = request.args.get('party_size', 2, type=int)
+    
+    restaurant = get_restaurant(restaurant_id)
+    conn = get_db_connection(restaurant_id=restaurant_id)
+    try:
+        start_minute = booking.parse_time(slot_time) if slot_date else None
+    except ValueError:
+        start_minute = None
+    if start_minute is not None:
+        tables = booking.available_tables(conn, restaurant_id, slot_date, start_minute,
+                                          start_minute + booking.DEFAULT_DURATION_MINUTES)
+    else:
+        tables = conn.execute('SELECT * FROM restaurant_tables WHERE restaurant_id = ? AND is_available = 1', 
+                             (restaurant_id,)).fetchall()
     conn.close()
+    special_offers = get_active_offers(restaurant_id)
     
-    return render_template('restaurant_details.html', restaurant=restaurant, tables=tables, special_offers=special_offers)
+    return render_template('restaurant_details.html', restaurant=restaurant, tables=tables, special_offers=special_offers,
+                           slot_date=slot_date, slot_time=slot_time if start_minute is not None else '',
+                           party_size=party_size, today=datetime.now().date().isoformat(),
+                           offer_waitlist=start_minute is not None and (not tables or 'party_size' in request.args))
 
 @app.route('/menu/<int:restaurant_id>')
+@serves_snapshot(max_age=30)
 def view_menu(restaurant_id):
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = get_db_connection()
-    restaurant = conn.execute('SELECT * FROM restaurants WHERE id = ?', (restaurant_id,)).fetchone()
+    def render(**context):
+        restaurant = get_restaurant(restaurant_id)
+        
+        # Filter menu items based on restaurant type
+        menu_items = get_menu_items(restaurant_id, restaurant['is_veg_only'])
+        
+        return render_template('menu.html', restaurant=restaurant, menu_items=menu_items, **context)
     
-    # Filter menu items based on restaurant type
-    if restaurant['is_veg_only']:
-        menu_items = conn.execute('SELECT * FROM menu_items WHERE restaurant_id = ? AND is_veg = 1 ORDER BY category', 
-                                 (restaurant_id,)).fetchall()
-    else:
-        menu_items = conn.execute('SELECT * FROM menu_items WHERE restaurant_id = ? ORDER BY category', 
-                                 (restaurant_id,)).fetchall()
+    def catalog_version():
+        # Bookings do not show on the menu, so only catalog writes make it stale
+        version = restaurant_version(restaurant_id)
+        return version and version[0]
     
-    conn.close()
+    return cached_page(('menu', restaurant_id), ('restaurant:%s' % restaurant_id,), catalog_version, render)
+
+def search_filters(args):
+    """Keyword arguments for search.search_restaurants from query parameters; ValueError if malformed"""
+    def number(name, kind):
+        value = args.get(name, '')
+        return kind(value) if value != '' else None
+    
+    filters = {
+        'text': args.get('q', ''),
+        'location_id': number('location_id', int),
+        'cuisine_type': args.get('cuisine', '') or None,
+        'veg_only': None if args.get('veg', '') == '' else args['veg'] in ('1', 'true', 'yes'),
+        'min_rating': number('min_rating', float),
+        'party_size': number('party_size', int),
+        'page': number('page', int) or 1,
+        'per_page': min(number('per_page', int) or search.PER_PAGE, search.MAX_PER_PAGE),
+    }
+    if args.get('date') and args.get('time'):
+        filters['booking_date'] = datetime.strptime(args['date'], '%Y-%m-%d').date().isoformat()
+        filters['start_minute'] = booking.parse_time(args['time'])
+    return filters
+
+def run_search(filters):
+    """Search one city's database, or every shard when sharded and no city is given"""
+    if app.config['DB_SHARD_DIR'] and filters['location_id'] is None:
+        connections = shard_connections()
+        try:
+            return search.search_shards(connections, **filters)
+        finally:
+            for conn in connections:
+                conn.close()
+    conn = get_db_connection(location_id=filters['location_id'])
+    try:
+        return search.search_restaurants(conn, **filters)
+    finally:
+        conn.close()
+
+@app.route('/search')
+def search_page():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    restaurants, has_more = [], False
+    try:
+        filters = search_filters(request.args)
+    except ValueError:
+        flash('Please check the search filters.')
+        filters = None
+    if filters is not None and request.args:
+        restaurants, has_more = run_search(filters)
     
-    return render_template('menu.html', restaurant=restaurant, menu_items=menu_items)
+    return render_template('search.html', restaurants=restaurants, has_more=has_more, args=request.args,
+                           page=filters['page'] if filters else 1, locations=get_locations(),
+                           cuisines=get_cuisines())
 
 @app.route('/book-table', methods=['POST'])
 def book_table():
@@ -306,34 +607,212 @@ def book_table():
         return redirect(url_for('login'))
     
     restaurant_id = request.form['restaurant_id']
-    table_id = request.form['table_id']
+    # Without a table_id the allocator picks the best free table, or tables, for the party
+    table_id = request.form.get('table_id')
     booking_date = request.form['booking_date']
     booking_time = request.form['booking_time']
-    party_size = request.form['party_size']
     
-    conn = get_db_connection()
+    try:
+        start_minute = booking.parse_time(booking_time)
+        party_size = int(request.form['party_size'])
+    except ValueError:
+        flash('Please choose a valid booking time and party size.')
+        return redirect(url_for('restaurant_details', restaurant_id=restaurant_id))
     
-    # Check if table is still available
-    table = conn.execute('SELECT * FROM restaurant_tables WHERE id = ? AND is_available = 1', 
-                        (table_id,)).fetchone()
+    conn = get_db_connection(restaurant_id=restaurant_id)
+    key = idempotency_key()
     
-    if table:
-        # Create booking
-        conn.execute('''INSERT INTO bookings 
-                       (user_id, restaurant_id, table_id, booking_date, booking_time, party_size) 
-                       VALUES (?, ?, ?, ?, ?, ?)''',
-                    (session['user_id'], restaurant_id, table_id, booking_date, booking_time, party_size))
-        
-        # Mark table as unavailable
-        conn.execute('UPDATE restaurant_tables SET is_available = 0 WHERE id = ?', (table_id,))
-        
-        conn.commit()
-        flash('Table booked successfully!')
+    # Book only if no other booking overlaps the requested slot; the check
+    # and the insert are one write under an immediate transaction
+    tables = []
+    try:
+        # A repeat of a booking already made is answered without booking again
+        replayed = key and idempotency.lookup(conn, session['user_id'], request.endpoint, key)
+        if replayed:
+            booking_id = None
+        elif table_id:
+            booking_id = booking.create_booking(conn, session['user_id'], restaurant_id, table_id,
+                                                booking_date, start_minute, party_size)
+        else:
+            booking_id, tables = booking.book_party(conn, session['user_id'], restaurant_id,
+                                                    booking_date, start_minute, party_size)
+    except sqlite3.OperationalError:
+        # Write lock not granted within the busy timeout
+        booking_id = replayed = None
+        conn.rollback()
+        flash('We are handling a lot of bookings right now. Please try again.')
     else:
-        flash('Sorry, this table is no longer available.')
+        if replayed:
+            conn.rollback()
+            conn.close()
+            return replay_submission(replayed)
+        if booking_id:
+            if len(tables) > 1:
+                message = ('Tables %s are booked together for your party!'
+                           % ' + '.join(table['table_number'] for table in tables))
+            elif tables:
+                message = 'Table %s booked successfully!' % tables[0]['table_number']
+            else:
+                message = 'Table booked successfully!'
+            response = remember_submission(conn, key, [message], url_for(
+                'restaurant_details', restaurant_id=restaurant_id, date=booking_date, time=booking_time))
+            conn.commit()
+            conn.close()
+            return response
+        else:
+            conn.rollback()
+            if table_id:
+                flash('Sorry, this table is no longer available.')
+            else:
+                flash('Sorry, no table for %d is free at that time. Join the waitlist and we will book one '
+                      'for you if a table frees up.' % party_size)
+            conn.close()
+            return redirect(url_for('restaurant_details', restaurant_id=restaurant_id, date=booking_date,
+                                    time=booking_time, party_size=party_size))
+    
+    conn.close()
+    return redirect(url_for('restaurant_details', restaurant_id=restaurant_id,
+                            date=booking_date, time=booking_time))
+
+@app.route('/book-group', methods=['POST'])
+def book_group():
+    """Several tables at one slot for a large party, in one all-or-nothing transaction"""
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    restaurant_id = request.form['restaurant_id']
+    booking_date = request.form['booking_date']
+    booking_time = request.form['booking_time']
+    slot_page = url_for('restaurant_details', restaurant_id=restaurant_id, date=booking_date, time=booking_time)
+    try:
+        start_minute = booking.parse_time(booking_time)
+        party_size = int(request.form['party_size'])
+        # No tables ticked: spread the party over the best free tables
+        table_ids = [int(table_id) for table_id in request.form.getlist('table_ids')] or None
+    except ValueError:
+        flash('Please choose a valid booking time and party size.')
+        return redirect(slot_page)
     
+    conn = get_db_connection(restaurant_id=restaurant_id)
+    key = idempotency_key()
+    try:
+        replayed = key and idempotency.lookup(conn, session['user_id'], request.endpoint, key)
+        if not replayed:
+            booking_id, tables, unavailable = booking.book_group(conn, session['user_id'], restaurant_id,
+                                                                 booking_date, start_minute, party_size, table_ids)
+    except sqlite3.OperationalError:
+        # Write lock not granted within the busy timeout
+        conn.rollback()
+        conn.close()
+        flash('We are handling a lot of bookings right now. Please try again.')
+        return redirect(slot_page)
+    except ValueError as error:
+        conn.rollback()
+        conn.close()
+        flash(str(error))
+        return redirect(slot_page)
+    
+    if replayed:
+        conn.rollback()
+        conn.close()
+        return replay_submission(replayed)
+    if not booking_id:
+        conn.rollback()
+        if unavailable:
+            taken = conn.execute('SELECT table_number FROM restaurant_tables WHERE id IN (%s) ORDER BY id'
+                                 % ', '.join('?' * len(unavailable)), unavailable).fetchall()
+            flash('Sorry, %s %s no longer free. Nothing was booked; please choose again.'
+                  % (' + '.join(row['table_number'] for row in taken), 'is' if len(taken) == 1 else 'are'))
+        else:
+            flash('Sorry, there are not enough free tables for %d at that time.' % party_size)
+        conn.close()
+        return redirect(slot_page)
+    
+    response = remember_submission(conn, key, ['Tables %s are booked for your group of %d!'
+                                               % (' + '.join(table['table_number'] for table in tables), party_size)],
+                                   url_for('my_bookings'))
+    conn.commit()
     conn.close()
-    return redirect(url_for('restaurant_details', restaurant_id=restaurant_id))
+    return response
+
+@app.route('/join-waitlist', methods=['POST'])
+def join_waitlist():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    restaurant_id = request.form['restaurant_id']
+    booking_date = request.form['booking_date']
+    try:
+        start_minute = booking.parse_time(request.form['booking_time'])
+        party_size = int(request.form['party_size'])
+    except ValueError:
+        flash('Please choose a valid booking time and party size.')
+        return redirect(url_for('restaurant_details', restaurant_id=restaurant_id))
+    
+    conn = get_db_connection(restaurant_id=restaurant_id)
+    entry_id = waitlist.join(conn, session['user_id'], restaurant_id, booking_date, start_minute, party_size)
+    conn.commit()
+    conn.close()
+    # A table may have come free since the booking attempt; let the worker look now
+    get_waitlist_worker().wake()
+    
+    if entry_id:
+        flash('You are on the waitlist for %d at %s on %s. We will book a table for you as soon as one frees up.'
+              % (party_size, booking.format_time(start_minute), booking_date))
+    else:
+        flash('You are already on the waitlist for that time.')
+    return redirect(url_for('my_bookings'))
+
+@app.route('/my-bookings')
+def my_bookings():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    today = datetime.now().date().isoformat()
+    bookings, entries = [], []
+    for conn in shard_connections():
+        bookings += booking.user_bookings(conn, session['user_id'], today)
+        entries += waitlist.user_entries(conn, session['user_id'], today)
+        conn.close()
+    bookings.sort(key=lambda row: (row['booking_date'], row['booking_time'], row['id']))
+    entries.sort(key=lambda row: (row['booking_date'], row['start_minute'], row['id']))
+    
+    return render_template('my_bookings.html', bookings=bookings, waitlist=entries)
+
+@app.route('/cancel-booking/<int:booking_id>', methods=['POST'])
+def cancel_booking(booking_id):
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    cancelled = 0
+    for conn in row_connections(booking_id):
+        if not cancelled:
+            cancelled = booking.cancel_booking(conn, booking_id, user_id=session['user_id'])
+            conn.commit()
+        conn.close()
+    
+    if cancelled:
+        # The freed tables go to the first matching party on the waitlist
+        get_waitlist_worker().wake()
+        flash('Your booking has been cancelled.')
+    else:
+        flash('That booking could not be cancelled.')
+    return redirect(url_for('my_bookings'))
+
+@app.route('/leave-waitlist/<int:entry_id>', methods=['POST'])
+def leave_waitlist(entry_id):
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    left = False
+    for conn in row_connections(entry_id):
+        if not left:
+            left = waitlist.leave(conn, entry_id, session['user_id'])
+            conn.commit()
+        conn.close()
+    
+    flash('You have left the waitlist.' if left else 'That waitlist entry is no longer waiting.')
+    return redirect(url_for('my_bookings'))
 
 @app.route('/rate-restaurant/<int:restaurant_id>', methods=['GET', 'POST'])
 def rate_restaurant(restaurant_id):
@@ -345,22 +824,34 @@ def rate_restaurant(restaurant_id):
         food_quality = int(request.form['food_quality'])
         respect = int(request.form['respect'])
         review_text = request.form['review_text']
-        overall_rating = (customer_service + food_quality + respect) / 3
         
-        conn = get_db_connection()
-        conn.execute('''INSERT INTO ratings 
-                       (user_id, restaurant_id, customer_service, food_quality, respect, overall_rating, review_text) 
-                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                    (session['user_id'], restaurant_id, customer_service, food_quality, respect, overall_rating, review_text))
+        conn = get_db_connection(restaurant_id=restaurant_id)
+        key = idempotency_key()
+        try:
+            # A repeat of a rating already recorded is answered without counting it again
+            replayed = key and idempotency.lookup(conn, session['user_id'], request.endpoint, key)
+        except sqlite3.OperationalError:
+            # Write lock not granted within the busy timeout
+            conn.rollback()
+            conn.close()
+            flash('We are handling a lot of requests right now. Please try again.')
+            return redirect(url_for('rate_restaurant', restaurant_id=restaurant_id))
+        if replayed:
+            conn.rollback()
+            conn.close()
+            return replay_submission(replayed)
+        
+        # Rating and restaurant aggregates are written in one transaction
+        ratings.record_rating(conn, session['user_id'], restaurant_id, customer_service, food_quality, respect,
+                              review_text)
+        response = remember_submission(conn, key, ['Rating submitted successfully!'],
+                                       url_for('restaurant_details', restaurant_id=restaurant_id))
         conn.commit()
         conn.close()
-        
-        flash('Rating submitted successfully!')
-        return redirect(url_for('restaurant_details', restaurant_id=restaurant_id))
+        invalidate_restaurant(restaurant_id)
+        return response
     
-    conn = get_db_connection()
-    restaurant = conn.execute('SELECT * FROM restaurants WHERE id = ?', (restaurant_id,)).fetchone()
-    conn.close()
+    restaurant = get_restaurant(restaurant_id)
     
     return render_template('rate_restaurant.html', restaurant=restaurant)
 
@@ -369,18 +860,33 @@ def admin_dashboard():
     if 'admin_restaurant_id' not in session:
         return redirect(url_for('admin_login'))
     
-    conn = get_db_connection()
     restaurant_id = session['admin_restaurant_id']
+    conn = get_db_connection(restaurant_id=restaurant_id, users=True)
+    today = datetime.now().date().isoformat()
     
-    # Get bookings for this restaurant
-    bookings = conn.execute('''
-        SELECT b.*, u.username, rt.table_number 
-        FROM bookings b
-        JOIN users u ON b.user_id = u.id
-        JOIN restaurant_tables rt ON b.table_id = rt.id
-        WHERE b.restaurant_id = ?
-        ORDER BY b.booking_date DESC, b.booking_time DESC
-    ''', (restaurant_id,)).fetchall()
+    # Filters; the default view is today's and upcoming bookings, soonest first
+    view = request.args.get('view', 'upcoming')
+    date_from = request.args.get('date_from', '')
+    date_to = request.args.get('date_to', '')
+    status = request.args.get('status', '')
+    cursor = request.args.get('after', '')
+    
+    try:
+        bookings, next_cursor = booking.page_bookings(
+            conn, restaurant_id,
+            date_from=date_from or (today if view == 'upcoming' else None),
+            date_to=date_to or None, status=status or None,
+            after=cursor or None, descending=(view != 'upcoming'))
+    except ValueError:
+        flash('That page link is no longer valid.')
+        return redirect(url_for('admin_dashboard'))
+    
+    # Count parties, not tables: the extra rows of a combined booking have a parent_id
+    total_bookings = conn.execute('SELECT COUNT(*) FROM bookings WHERE restaurant_id = ? AND parent_id IS NULL',
+                                  (restaurant_id,)).fetchone()[0]
+    today_bookings = conn.execute('''SELECT COUNT(*) FROM bookings
+                                     WHERE restaurant_id = ? AND booking_date = ? AND parent_id IS NULL''',
+                                  (restaurant_id, today)).fetchone()[0]
     
     # Get special offers
     special_offers = conn.execute('SELECT * FROM special_offers WHERE restaurant_id = ? ORDER BY created_at DESC', 
@@ -388,7 +894,95 @@ def admin_dashboard():
     
     conn.close()
     
-    return render_template('admin_dashboard.html', bookings=bookings, special_offers=special_offers)
+    filters = {'view': view, 'date_from': date_from, 'date_to': date_to, 'status': status}
+    return render_template('admin_dashboard.html', bookings=bookings, special_offers=special_offers,
+                           next_cursor=next_cursor, filters=filters, is_first_page=not cursor, cursor=cursor,
+                           statuses=booking.BOOKING_STATUSES, lifecycle_actions=LIFECYCLE_ACTIONS,
+                           total_bookings=total_bookings, today_bookings=today_bookings, today=today)
+
+@app.route('/admin-analytics')
+def admin_analytics():
+    if 'admin_restaurant_id' not in session:
+        return redirect(url_for('admin_login'))
+    
+    restaurant_id = session['admin_restaurant_id']
+    today = datetime.now().date()
+    # Default to the last 30 days
+    date_from = request.args.get('date_from') or (today - timedelta(days=29)).isoformat()
+    date_to = request.args.get('date_to') or today.isoformat()
+    try:
+        if date.fromisoformat(date_from) > date.fromisoformat(date_to):
+            raise ValueError
+    except ValueError:
+        flash('Please choose a valid date range.')
+        return redirect(url_for('admin_analytics'))
+    
+    # Rollups only (see analytics.py): the raw bookings and ratings are never scanned here
+    conn = get_db_connection(restaurant_id=restaurant_id)
+    report = analytics.report(conn, restaurant_id, date_from, date_to)
+    conn.close()
+    
+    return render_template('admin_analytics.html', report=report, date_from=date_from, date_to=date_to)
+
+# Staff buttons offered for a party in each status
+LIFECYCLE_ACTIONS = {'confirmed': [('seated', 'Seat'), ('no_show', 'No-show')], 'seated': [('completed', 'Clear')]}
+
+# Dashboard query parameters a status change carries back, so staff return to the same page
+DASHBOARD_PARAMS = ('view', 'date_from', 'date_to', 'status', 'after')
+
+@app.route('/admin-booking/<int:booking_id>/status', methods=['POST'])
+def admin_booking_status(booking_id):
+    if 'admin_restaurant_id' not in session:
+        return redirect(url_for('admin_login'))
+    
+    restaurant_id = session['admin_restaurant_id']
+    status = request.form.get('status', '')
+    if status not in lifecycle.TRANSITIONS:
+        abort(400)
+    page = {name: request.form['page_' + name] for name in DASHBOARD_PARAMS if request.form.get('page_' + name)}
+    conn = get_db_connection(restaurant_id=restaurant_id)
+    changed = lifecycle.set_status(conn, booking_id, restaurant_id, status)
+    conn.commit()
+    conn.close()
+    
+    if changed:
+        if status != 'seated':
+            # The table is free again for the rest of the slot
+            get_waitlist_worker().wake()
+        flash('Booking marked as %s.' % status.replace('_', ' '))
+    else:
+        flash('That booking can no longer be changed.')
+    return redirect(url_for('admin_dashboard', **page))
+
+@app.route('/admin-export/<kind>.<fmt>')
+def admin_export(kind, fmt):
+    if 'admin_restaurant_id' not in session:
+        return redirect(url_for('admin_login'))
+    
+    if kind not in ('bookings', 'ratings') or fmt not in exports.FORMATS:
+        abort(404)
+    
+    restaurant_id = session['admin_restaurant_id']
+    date_from = request.args.get('date_from') or None
+    date_to = request.args.get('date_to') or None
+    
+    def generate():
+        # Rows are read and encoded batch by batch while the response streams
+        conn = get_db_connection(restaurant_id=restaurant_id, users=True)
+        try:
+            if kind == 'bookings':
+                cursor = exports.query_bookings(conn, restaurant_id, date_from, date_to)
+                columns = exports.BOOKING_COLUMNS
+            else:
+                cursor = exports.query_ratings(conn, restaurant_id, date_from, date_to)
+                columns = exports.RATING_COLUMNS
+            yield from exports.iter_export(cursor, columns, fmt)
+        finally:
+            conn.close()
+    
+    filename = '%s-%s.%s' % (kind, restaurant_id, fmt)
+    return Response(stream_with_context(generate()), mimetype=exports.FORMATS[fmt],
+                    headers={'Content-Disposition': 'attachment; filename=%s' % filename})
 
 @app.route('/admin-add-offer', methods=['GET', 'POST'])
 def admin_add_offer():
@@ -401,20 +995,227 @@ def admin_add_offer():
         discount_percentage = float(request.form['discount_percentage'])
         valid_from = request.form['valid_from']
         valid_to = request.form['valid_to']
+        # Later days are picked up by offers.refresh_flags
+        is_active = offers.is_valid_on(valid_from, valid_to, datetime.now().date().isoformat())
         
-        conn = get_db_connection()
+        conn = get_db_connection(restaurant_id=session['admin_restaurant_id'])
         conn.execute('''INSERT INTO special_offers 
-                       (restaurant_id, title, description, discount_percentage, valid_from, valid_to) 
-                       VALUES (?, ?, ?, ?, ?, ?)''',
-                    (session['admin_restaurant_id'], title, description, discount_percentage, valid_from, valid_to))
+                       (restaurant_id, title, description, discount_percentage, valid_from, valid_to, is_active) 
+                       VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                    (session['admin_restaurant_id'], title, description, discount_percentage, valid_from, valid_to,
+                     int(is_active)))
         conn.commit()
         conn.close()
+        invalidate_restaurant(session['admin_restaurant_id'])
         
         flash('Special offer added successfully!')
         return redirect(url_for('admin_dashboard'))
     
     return render_template('admin_add_offer.html')
 
+@app.route('/admin-import', methods=['GET', 'POST'])
+def admin_import():
+    if 'admin_restaurant_id' not in session:
+        return redirect(url_for('admin_login'))
+    
+    if request.method == 'POST':
+        try:
+            data = {}
+            for kind in ('restaurants', 'tables', 'menu_items'):
+                upload = request.files.get(kind)
+                if upload and upload.filename:
+                    fmt = 'json' if upload.filename.lower().endswith('.json') else 'csv'
+                    data[kind] = catalog_import.parse_rows(kind, upload.read().decode('utf-8'), fmt)
+            
+            def progress(stage, done, total):
+                app.logger.info('Catalog import: staged %d/%d %s', done, total, stage)
+            
+            conn = get_db_connection()
+            if app.config['DB_SHARD_DIR']:
+                summary = shards.import_catalog(conn, lambda location_id: get_db_connection(location_id=location_id),
+                                                progress=progress, **data)
+            else:
+                summary = catalog_import.import_catalog(conn, progress=progress, **data)
+            conn.close()
+        except (ValueError, UnicodeDecodeError) as error:
+            if request.accept_mimetypes.best == 'application/json':
+                return jsonify({'error': str(error)}), 400
+            flash('Import failed: %s' % error)
+            return redirect(url_for('admin_import'))
+        
+        # Imported rows may touch any restaurant or city
+        get_catalog_cache().clear()
+        if 'page_cache' in app.extensions:
+            app.extensions['page_cache'][0].clear()
+        # New or re-enabled tables may seat waitlisted parties
+        get_waitlist_worker().wake()
+        
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(summary)
+        flash('Import finished: ' + '; '.join('%s %s' % (kind, ', '.join('%d %s' % (count, label)
+                                                                        for label, count in counts.items()))
+                                              for kind, counts in summary.items()))
+        return redirect(url_for('admin_dashboard'))
+    
+    return render_template('admin_import.html')
+
+@app.route('/admin-cache-stats')
+def admin_cache_stats():
+    if 'admin_restaurant_id' not in session:
+        return redirect(url_for('admin_login'))
+    
+    return jsonify(get_catalog_cache().stats())
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(get_metrics().render(), content_type=metrics.CONTENT_TYPE)
+
+# JSON API (v1): read-only catalog and availability for the mobile app.
+# Every response carries an ETag derived from the data versions it depends
+# on (see versions.py), so a conditional GET is answered with a 304 before
+# the payload is built. ``?fields=id,name`` trims each record to those keys.
+def api_error(message, status):
+    return jsonify({'error': message}), status
+
+def pick_fields(data, fields):
+    if isinstance(data, list):
+        return [pick_fields(item, fields) for item in data]
+    return {key: value for key, value in data.items() if key in fields}
+
+def api_response(version, load):
+    """JSON from ``load()``, or an empty 304 if the client already has this version"""
+    etag = versions.make_etag(request.path, sorted(request.args.items(multi=True)), version)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        payload = load()
+        fields = {name.strip() for name in request.args.get('fields', '').split(',') if name.strip()}
+        if fields:
+            payload['data'] = pick_fields(payload['data'], fields)
+        response = jsonify(payload)
+    response.set_etag(etag)
+    # Clients may keep the body but must revalidate it each time
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def restaurant_version(restaurant_id):
+    conn = get_db_connection(restaurant_id=restaurant_id)
+    version = versions.restaurant_version(conn, restaurant_id)
+    conn.close()
+    return version
+
+def location_version(location_id):
+    conn = get_db_connection(location_id=location_id)
+    version = versions.location_version(conn, location_id)
+    conn.close()
+    return version
+
+@app.route('/api/v1/locations')
+def api_locations():
+    locations = get_locations()
+    return api_response(locations, lambda: {'data': locations})
+
+@app.route('/api/v1/locations/<int:location_id>/restaurants')
+def api_restaurants_by_location(location_id):
+    if get_location(location_id) is None:
+        return api_error('Location not found', 404)
+    
+    version = location_version(location_id)
+    # Versions are part of the cache key, so a cached payload is never older than its ETag
+    return api_response(version, lambda: {'data': cached_query(
+        ('api-restaurants', location_id, version), ('locations',), '''
+            SELECT r.*, s.avg_overall as avg_rating, s.rating_count
+            FROM restaurants r
+            LEFT JOIN restaurant_rating_stats s ON s.restaurant_id = r.id
+            WHERE r.location_id = ?
+            ORDER BY r.name
+        ''', (location_id,), location_id=location_id)})
+
+@app.route('/api/v1/restaurants/<int:restaurant_id>')
+def api_restaurant(restaurant_id):
+    version = restaurant_version(restaurant_id)
+    if version is None:
+        return api_error('Restaurant not found', 404)
+    
+    return api_response(version[0], lambda: {'data': cached_query(
+        ('api-restaurant', restaurant_id, version[0]), ('restaurant:%s' % restaurant_id,), '''
+            SELECT r.*, s.rating_count, s.avg_overall as avg_rating, s.avg_customer_service, s.avg_food_quality,
+                   s.avg_respect
+            FROM restaurants r
+            LEFT JOIN restaurant_rating_stats s ON s.restaurant_id = r.id
+            WHERE r.id = ?
+        ''', (restaurant_id,), one=True, restaurant_id=restaurant_id)})
+
+@app.route('/api/v1/restaurants/<int:restaurant_id>/menu')
+def api_menu(restaurant_id):
+    version = restaurant_version(restaurant_id)
+    if version is None:
+        return api_error('Restaurant not found', 404)
+    
+    # Pure vegetarian restaurants only list vegetarian items
+    return api_response(version[0], lambda: {'data': cached_query(
+        ('api-menu', restaurant_id, version[0]), ('restaurant:%s' % restaurant_id,), '''
+            SELECT m.* FROM menu_items m JOIN restaurants r ON r.id = m.restaurant_id
+            WHERE m.restaurant_id = ? AND (m.is_veg = 1 OR NOT r.is_veg_only)
+            ORDER BY m.category
+        ''', (restaurant_id,), restaurant_id=restaurant_id)})
+
+@app.route('/api/v1/restaurants/<int:restaurant_id>/offers')
+def api_offers(restaurant_id):
+    version = restaurant_version(restaurant_id)
+    if version is None:
+        return api_error('Restaurant not found', 404)
+    
+    # Offers valid on ?date=YYYY-MM-DD, default today
+    try:
+        day = datetime.strptime(request.args.get('date') or datetime.now().strftime('%Y-%m-%d'),
+                                '%Y-%m-%d').date().isoformat()
+    except ValueError:
+        return api_error('date must be YYYY-MM-DD', 400)
+    
+    return api_response((version[0], day), lambda: {'data': get_active_offers(restaurant_id, day)})
+
+@app.route('/api/v1/restaurants/<int:restaurant_id>/availability')
+def api_availability(restaurant_id):
+    """Tables free at ?date=YYYY-MM-DD&time=HH:MM for ?party_size=N (default 1)"""
+    try:
+        slot_date = datetime.strptime(request.args.get('date', ''), '%Y-%m-%d').date().isoformat()
+        start_minute = booking.parse_time(request.args.get('time', ''))
+        party_size = int(request.args.get('party_size', 1))
+    except ValueError:
+        return api_error('date (YYYY-MM-DD), time (HH:MM) and an integer party_size are required', 400)
+    
+    version = restaurant_version(restaurant_id)
+    if version is None:
+        return api_error('Restaurant not found', 404)
+    
+    def load():
+        conn = get_db_connection(restaurant_id=restaurant_id)
+        tables = booking.available_tables(conn, restaurant_id, slot_date, start_minute,
+                                          start_minute + booking.DEFAULT_DURATION_MINUTES)
+        conn.close()
+        return {'meta': {'date': slot_date, 'time': booking.format_time(start_minute), 'party_size': party_size,
+                         'duration_minutes': booking.DEFAULT_DURATION_MINUTES},
+                'data': [{'id': table['id'], 'table_number': table['table_number'], 'capacity': table['capacity']}
+                         for table in tables if table['capacity'] >= party_size]}
+    
+    return api_response(version, load)
+
+@app.route('/api/v1/search')
+def api_search():
+    """Ranked restaurant search; see search_filters for the parameters"""
+    try:
+        filters = search_filters(request.args)
+    except ValueError:
+        return api_error('location_id, party_size, page and per_page must be integers, min_rating a number, '
+                         'date YYYY-MM-DD and time HH:MM', 400)
+    
+    restaurants, has_more = run_search(filters)
+    
+    fields = {name.strip() for name in request.args.get('fields', '').split(',') if name.strip()}
+    return jsonify({'data': pick_fields(restaurants, fields) if fields else restaurants,
+                    'meta': {'page': filters['page'], 'per_page': filters['per_page'], 'has_more': has_more}})
+
 @app.route('/logout')
 def logout():
     session.clear()
@@ -428,4 +1229,5 @@ def admin_logout():
 if __name__ == '__main__':
     init_db()
     populate_sample_data()
+    start_background_workers(reloader=True)
     app.run(debug=True)
@@ -0,0 +1,347 @@
+#!/usr/bin/env python3
+"""
+Async serving mode
+
+An asyncio HTTP/1.1 server for the Flask app. The event loop owns every
+socket (accepting, parsing, keep-alive, writing responses), so slow clients
+and idle connections cost no threads. The routes themselves, and with them
+every blocking sqlite3 call, run on two bounded thread pools:
+
+    read pool   GET, HEAD and OPTIONS requests (ASYNC_READ_THREADS)
+    write pool  everything else (ASYNC_WRITE_THREADS)
+
+SQLite takes one writer at a time, so a handful of write threads is all the
+lock can use; extra writers queue in the pool instead of sleeping in the busy
+handler. Readers never wait behind them because WAL lets them run beside the
+writer and they have their own threads. That holds only while GET routes
+never take the write lock, which is why search leaves refreshing its index
+to the catalog writers and the lifecycle tick.
+
+A client that stops reading or disconnects gives up its pool thread: writes
+to it time out after SEND_TIMEOUT, and the app's response iterable is then
+abandoned and closed instead of being produced for nobody.
+
+A request and its whole response, streamed or not, stay on one pool thread,
+so the per-thread connection pool in db.py works unchanged.
+
+Usage:
+    python async_server.py [--host 0.0.0.0] [--port 5000]
+or  python run.py --async
+"""
+
+import argparse
+import asyncio
+import io
+import logging
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from email.utils import formatdate
+from urllib.parse import unquote_to_bytes
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+MAX_HEADERS = 100
+
+# Response chunks buffered between a pool thread and a slow client
+STREAM_BUFFER = 16
+
+# Seconds a write to the client, or a pool thread waiting for room in that buffer, may take
+# before the client is given up
+SEND_TIMEOUT = 5
+
+REASONS = {400: 'Bad Request', 411: 'Length Required', 413: 'Payload Too Large',
+           431: 'Request Header Fields Too Large', 500: 'Internal Server Error'}
+
+
+class BadRequest(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+class ClientGone(Exception):
+    """The client disconnected or stopped reading; raised in the pool thread to stop the response"""
+
+
+class AsyncServer:
+    """Serve a WSGI app from an event loop, running requests on read and write thread pools"""
+
+    def __init__(self, app, host='127.0.0.1', port=5000, read_threads=8, write_threads=2,
+                 keepalive_timeout=5.0, max_body=16 * 1024 * 1024):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.keepalive_timeout = keepalive_timeout
+        self.max_body = max_body
+        self.read_pool = ThreadPoolExecutor(read_threads, thread_name_prefix='db-read')
+        self.write_pool = ThreadPoolExecutor(write_threads, thread_name_prefix='db-write')
+        self.server = None
+        self._handlers = set()
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self):
+        await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def shutdown(self):
+        """Stop accepting, drop open connections and release the thread pools"""
+        self.server.close()
+        for task in list(self._handlers):
+            task.cancel()
+        await asyncio.gather(*self._handlers, return_exceptions=True)
+        self.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+        self.read_pool.shutdown(wait=False)
+        self.write_pool.shutdown(wait=False)
+
+    async def handle(self, reader, writer):
+        """Serve requests on one connection until either side closes it"""
+        peer = writer.get_extra_info('peername') or ('', 0)
+        task = asyncio.current_task()
+        self._handlers.add(task)
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(self.read_request(reader), self.keepalive_timeout)
+                except BadRequest as error:
+                    self.write_error(writer, error.status)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                environ, keep_alive = request
+                environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = peer[0], str(peer[1])
+                environ['SERVER_NAME'], environ['SERVER_PORT'] = self.host, str(self.port)
+                if not await self.respond(environ, writer, keep_alive):
+                    break
+        except (asyncio.TimeoutError, ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._handlers.discard(task)
+            writer.close()
+
+    async def read_request(self, reader):
+        """Parse one request into a WSGI environ; ``None`` when the client closed the connection"""
+        try:
+            line = await reader.readline()
+        except ValueError:
+            raise BadRequest(431)
+        if not line:
+            return None
+        try:
+            method, target, protocol = line.decode('latin-1').split()
+        except ValueError:
+            raise BadRequest(400)
+
+        headers = []
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                raise BadRequest(431)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            if len(headers) >= MAX_HEADERS:
+                raise BadRequest(431)
+            name, _, value = line.decode('latin-1').partition(':')
+            headers.append((name.strip(), value.strip()))
+
+        path, _, query = target.partition('?')
+        environ = {
+            'REQUEST_METHOD': method.upper(),
+            'SCRIPT_NAME': '',
+            'PATH_INFO': unquote_to_bytes(path).decode('latin-1'),
+            'QUERY_STRING': query,
+            'SERVER_PROTOCOL': protocol,
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers:
+            key = name.upper().replace('-', '_')
+            if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[key] = value
+            else:
+                key = 'HTTP_' + key
+                environ[key] = environ[key] + ', ' + value if key in environ else value
+
+        if 'chunked' in environ.get('HTTP_TRANSFER_ENCODING', '').lower():
+            raise BadRequest(411)
+        try:
+            length = int(environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            raise BadRequest(400)
+        if length > self.max_body:
+            raise BadRequest(413)
+        environ['wsgi.input'] = io.BytesIO(await reader.readexactly(length) if length else b'')
+
+        connection = environ.get('HTTP_CONNECTION', '').lower()
+        keep_alive = 'keep-alive' in connection if protocol == 'HTTP/1.0' else 'close' not in connection
+        return environ, keep_alive
+
+    async def respond(self, environ, writer, keep_alive):
+        """Run the app on a pool thread and write its response; return whether to keep the connection"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(STREAM_BUFFER)
+        gone = threading.Event()
+
+        def emit(item):
+            if gone.is_set():
+                raise ClientGone()
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            try:
+                future.result(SEND_TIMEOUT)
+            except FutureTimeout:
+                future.cancel()
+                gone.set()
+                raise ClientGone()
+
+        pool = self.read_pool if environ['REQUEST_METHOD'] in READ_METHODS else self.write_pool
+        task = loop.run_in_executor(pool, self.call_app, environ, emit)
+
+        head_only = environ['REQUEST_METHOD'] == 'HEAD'
+        chunked = False
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    # The pool thread gave up on a full buffer without sending 'end'
+                    getter.cancel()
+                    raise ConnectionError('client stopped reading')
+                kind, *item = getter.result()
+                if kind == 'end':
+                    break
+                if kind == 'head':
+                    status, headers, length = item
+                    if length is None:
+                        # Streamed body: chunked on HTTP/1.1, else delimited by closing the connection
+                        chunked = keep_alive and environ['SERVER_PROTOCOL'] == 'HTTP/1.1'
+                        keep_alive = chunked
+                    self.write_head(writer, status, headers, keep_alive, chunked and not head_only)
+                elif not head_only and item[0]:
+                    writer.write(b'%x\r\n%s\r\n' % (len(item[0]), item[0]) if chunked else item[0])
+                    await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+            if chunked and not head_only:
+                writer.write(b'0\r\n\r\n')
+            await asyncio.wait_for(writer.drain(), SEND_TIMEOUT)
+        except (ConnectionError, asyncio.TimeoutError):
+            # Stop the pool thread at its next chunk, and free it if it is waiting for room in the queue
+            gone.set()
+            while not queue.empty():
+                queue.get_nowait()
+            await task
+            return False
+        await task
+        return keep_alive
+
+    def call_app(self, environ, emit):
+        """Pool thread: call the app and hand its status, headers and body to the event loop"""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and response.get('sent'):
+                raise exc_info[1].with_traceback(exc_info[2])
+            response['status'], response['headers'] = status, headers
+            return lambda data: None
+
+        try:
+            result = self.app(environ, start_response)
+            try:
+                length = next((value for name, value in response['headers']
+                               if name.lower() == 'content-length'), None)
+                if length is not None or isinstance(result, (list, tuple)):
+                    body = b''.join(result)
+                    headers = response['headers']
+                    if length is None:
+                        headers = headers + [('Content-Length', str(len(body)))]
+                    response['sent'] = True
+                    emit(('head', response['status'], headers, len(body)))
+                    emit(('body', body))
+                else:
+                    for chunk in result:
+                        if not response.get('sent'):
+                            response['sent'] = True
+                            emit(('head', response['status'], response['headers'], None))
+                        emit(('body', chunk))
+                    if not response.get('sent'):
+                        response['sent'] = True
+                        emit(('head', response['status'], response['headers'], None))
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+        except ClientGone:
+            # Closing the app's iterable above was all that was left to do
+            return
+        except Exception:
+            logger.exception('Error handling %s %s', environ['REQUEST_METHOD'], environ['PATH_INFO'])
+            if not response.get('sent'):
+                body = b'Internal Server Error'
+                try:
+                    emit(('head', '500 Internal Server Error',
+                          [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))], len(body)))
+                    emit(('body', body))
+                except ClientGone:
+                    return
+        try:
+            emit(('end',))
+        except ClientGone:
+            pass
+
+    def write_head(self, writer, status, headers, keep_alive, chunked):
+        lines = ['HTTP/1.1 %s' % status, 'Date: %s' % formatdate(usegmt=True), 'Server: booking-async']
+        lines.extend('%s: %s' % header for header in headers)
+        if chunked:
+            lines.append('Transfer-Encoding: chunked')
+        lines.append('Connection: %s' % ('keep-alive' if keep_alive else 'close'))
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+    def write_error(self, writer, status):
+        body = REASONS[status].encode()
+        self.write_head(writer, '%d %s' % (status, REASONS[status]),
+                        [('Content-Type', 'text/plain'), ('Content-Length', str(len(body)))], False, False)
+        writer.write(body)
+
+
+def serve(app, host='127.0.0.1', port=5000):
+    """Run the app in async mode until interrupted, with pool sizes from its config"""
+    server = AsyncServer(app, host, port, read_threads=app.config['ASYNC_READ_THREADS'],
+                         write_threads=app.config['ASYNC_WRITE_THREADS'])
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the booking app from an event loop')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    args = parser.parse_args()
+
+    from app import app, init_db, start_background_workers
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    start_background_workers()
+    print('🚀 Serving in async mode on http://%s:%d' % (args.host, args.port))
+    serve(app, args.host, args.port)
+
+
+if __name__ == '__main__':
+    main()
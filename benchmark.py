@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""
+Route latency benchmark
+
+Drives every route in app.py through app.test_client() and reports per-route
+throughput and p50/p95/p99 latency. Results can be saved as JSON and a later
+run compared against them, so regressions show up before they ship.
+
+Without --database it runs against a small temporary database; point it at
+a file built by generate_data.py to measure at production size (the write
+routes add rows to that file). --compare-untuned repeats the read routes
+with the original connect-per-call, uncached setup.
+
+Usage:
+    python benchmark.py [--database large.db] [--requests 500] [--routes view_menu,book_table]
+                        [--output results.json] [--baseline previous.json] [--compare-untuned]
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+import app as booking_app
+import db
+import ratings
+
+# Settings equivalent to a bare sqlite3.connect() per call and no caching
+UNTUNED_SETTINGS = {
+    'CACHE_ENABLED': False,
+    'DB_POOLING': False,
+    'SQLITE_JOURNAL_MODE': 'DELETE',
+    'SQLITE_SYNCHRONOUS': 'FULL',
+    'SQLITE_CACHE_SIZE': 2000,
+    'SQLITE_MMAP_SIZE': 0,
+    'SQLITE_STATEMENT_CACHE': 128,
+}
+
+BOOKING_TIMES = ['11:00', '12:30', '14:00', '15:30', '17:00', '18:30', '20:00', '21:30']
+
+def booking_form(i, target):
+    """Walk tables, then times, then days far in the future so each post gets a free slot"""
+    tables = target['table_ids']
+    slot = i // len(tables)
+    day = date(2031, 1, 1) + timedelta(days=slot // len(BOOKING_TIMES))
+    return {'restaurant_id': target['restaurant_id'], 'table_id': tables[i % len(tables)],
+            'booking_date': day.isoformat(), 'booking_time': BOOKING_TIMES[slot % len(BOOKING_TIMES)],
+            'party_size': 2}
+
+# name, session ('user', 'admin' or None), method, url(i, target), form(i, target)
+ROUTES = [
+    ('index', None, 'GET', lambda i, t: '/', None),
+    ('login_page', None, 'GET', lambda i, t: '/login', None),
+    ('login', None, 'POST', lambda i, t: '/login',
+     lambda i, t: {'username': t['username'], 'password': 'password123'}),
+    ('register_page', None, 'GET', lambda i, t: '/register', None),
+    ('register', None, 'POST', lambda i, t: '/register',
+     lambda i, t: {'username': 'bench_%s_%d' % (t['run'], i), 'password': 'password123',
+                   'email': 'bench@email.com', 'phone': '9000000000'}),
+    ('admin_login_page', None, 'GET', lambda i, t: '/admin-login', None),
+    ('admin_login', None, 'POST', lambda i, t: '/admin-login',
+     lambda i, t: {'restaurant_name': t['restaurant_name'], 'password': 'admin123'}),
+    ('select_location', 'user', 'GET', lambda i, t: '/select-location', None),
+    ('restaurants_by_location', 'user', 'GET', lambda i, t: '/restaurants/%d' % t['location_id'], None),
+    ('restaurant_details', 'user', 'GET', lambda i, t: '/restaurant/%d' % t['restaurant_id'], None),
+    ('restaurant_details_slot', 'user', 'GET',
+     lambda i, t: '/restaurant/%d?date=%s&time=19:00' % (t['restaurant_id'], t['today']), None),
+    ('view_menu', 'user', 'GET', lambda i, t: '/menu/%d' % t['restaurant_id'], None),
+    ('book_table', 'user', 'POST', lambda i, t: '/book-table', booking_form),
+    ('book_table_allocated', 'user', 'POST', lambda i, t: '/book-table',
+     lambda i, t: {key: value for key, value in booking_form(i, t).items() if key != 'table_id'}),
+    ('my_bookings', 'user', 'GET', lambda i, t: '/my-bookings', None),
+    ('rate_restaurant_page', 'user', 'GET', lambda i, t: '/rate-restaurant/%d' % t['restaurant_id'], None),
+    ('rate_restaurant', 'user', 'POST', lambda i, t: '/rate-restaurant/%d' % t['restaurant_id'],
+     lambda i, t: {'customer_service': 1 + i % 5, 'food_quality': 4, 'respect': 5, 'review_text': 'Benchmark'}),
+    ('admin_dashboard', 'admin', 'GET', lambda i, t: '/admin-dashboard', None),
+    ('admin_dashboard_all', 'admin', 'GET', lambda i, t: '/admin-dashboard?view=all', None),
+    ('admin_export_bookings', 'admin', 'GET',
+     lambda i, t: '/admin-export/bookings.csv?date_from=%s' % t['today'], None),
+    ('admin_add_offer_page', 'admin', 'GET', lambda i, t: '/admin-add-offer', None),
+    ('admin_add_offer', 'admin', 'POST', lambda i, t: '/admin-add-offer',
+     lambda i, t: {'title': 'Bench %d' % i, 'description': 'Benchmark offer', 'discount_percentage': 10,
+                   'valid_from': t['today'], 'valid_to': t['today']}),
+    ('admin_import_page', 'admin', 'GET', lambda i, t: '/admin-import', None),
+    ('admin_cache_stats', 'admin', 'GET', lambda i, t: '/admin-cache-stats', None),
+    ('metrics', None, 'GET', lambda i, t: '/metrics', None),
+    ('logout', 'user', 'GET', lambda i, t: '/logout', None),
+    ('admin_logout', 'admin', 'GET', lambda i, t: '/admin-logout', None),
+]
+
+READ_ROUTES = ['select_location', 'restaurants_by_location', 'restaurant_details', 'restaurant_details_slot',
+               'view_menu']
+
+def prepare_database(path):
+    """Create a small database with the sample catalog, tables, menus and ratings"""
+    booking_app.app.config['DATABASE'] = path
+    booking_app.init_db()
+    booking_app.populate_sample_data()
+
+    conn = sqlite3.connect(path)
+    conn.execute("INSERT INTO users (username, password, email, phone) VALUES ('bench', 'password123', 'b@email.com', '0')")
+    for restaurant_id in range(1, 9):
+        for number in range(1, 11):
+            conn.execute('INSERT INTO restaurant_tables (restaurant_id, table_number, capacity) VALUES (?, ?, ?)',
+                         (restaurant_id, 'T%d' % number, 2 + number % 4 * 2))
+        for number in range(40):
+            conn.execute('''INSERT INTO menu_items (restaurant_id, item_name, description, price, category, is_veg)
+                            VALUES (?, ?, ?, ?, ?, ?)''',
+                         (restaurant_id, 'Dish %d' % number, 'House special', 100 + number, 'Category %d' % (number % 5),
+                          number % 2))
+        for number in range(50):
+            conn.execute('''INSERT INTO ratings (user_id, restaurant_id, customer_service, food_quality, respect,
+                            overall_rating, review_text) VALUES (1, ?, 4, 5, 4, 4.33, 'Good')''', (restaurant_id,))
+    ratings.rebuild_rating_stats(conn)
+    conn.commit()
+    conn.close()
+    db.reset_pools()
+
+def load_target(path):
+    """Pick the user, restaurant and tables the routes will exercise"""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    user = conn.execute('SELECT id, username FROM users ORDER BY id LIMIT 1').fetchone()
+    restaurant = conn.execute('''SELECT r.id, r.name, r.location_id FROM restaurants r
+                                 WHERE EXISTS (SELECT 1 FROM restaurant_tables t WHERE t.restaurant_id = r.id)
+                                 ORDER BY r.id LIMIT 1''').fetchone()
+    table_ids = [row['id'] for row in conn.execute('SELECT id FROM restaurant_tables WHERE restaurant_id = ?',
+                                                   (restaurant['id'],))]
+    conn.close()
+    return {'user_id': user['id'], 'username': user['username'], 'restaurant_id': restaurant['id'],
+            'restaurant_name': restaurant['name'], 'location_id': restaurant['location_id'],
+            'table_ids': table_ids, 'today': date.today().isoformat(),
+            'run': datetime.now().strftime('%Y%m%d%H%M%S')}
+
+def client_for(kind, target):
+    client = booking_app.app.test_client()
+    with client.session_transaction() as sess:
+        if kind == 'user':
+            sess['user_id'] = target['user_id']
+            sess['username'] = target['username']
+        elif kind == 'admin':
+            sess['admin_restaurant_id'] = target['restaurant_id']
+            sess['admin_restaurant_name'] = target['restaurant_name']
+    return client
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def measure(route, target, requests):
+    """Time ``requests`` calls of one route after a warm-up call; return its summary"""
+    name, kind, method, url, form = route
+    latencies, errors = [], 0
+    client = client_for(kind, target)
+    for i in range(requests + 1):
+        if name.endswith('logout'):
+            # Logging out empties the session, so every call needs a fresh one
+            client = client_for(kind, target)
+        started = time.perf_counter()
+        response = client.open(url(i, target), method=method, data=form(i, target) if form else None)
+        response.get_data()
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            errors += 1
+        if i:
+            latencies.append(elapsed)
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'throughput': len(latencies) / sum(latencies),
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+def run_benchmark(path, requests, names=None, settings=None):
+    """Benchmark the named routes (default: all) against ``path``; return stats per route"""
+    settings = settings or {}
+    saved = {name: booking_app.app.config[name] for name in ['DATABASE', *settings]}
+    booking_app.app.config['DATABASE'] = path
+    booking_app.app.config.update(settings)
+    booking_app.app.extensions.pop('catalog_cache', None)
+    try:
+        target = load_target(path)
+        return {route[0]: measure(route, target, requests)
+                for route in ROUTES if names is None or route[0] in names}
+    finally:
+        booking_app.app.config.update(saved)
+        booking_app.app.extensions.pop('catalog_cache', None)
+        db.reset_pools()
+
+def print_results(results, baseline=None):
+    print(f"{'route':<26}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+          + ('  p95 vs baseline' if baseline else ''))
+    for name, stats in results.items():
+        line = (f"{name:<26}{stats['throughput']:>8.0f}{stats['p50_ms']:>9.2f}{stats['p95_ms']:>9.2f}"
+                f"{stats['p99_ms']:>9.2f}{stats['errors']:>8}")
+        previous = (baseline or {}).get(name)
+        if previous:
+            change = (stats['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] * 100
+            line += f"  {change:+7.1f}%" + ('  ⚠️ slower' if change > 20 else '')
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every route of the booking app')
+    parser.add_argument('--database', help='database to benchmark (default: a small temporary one)')
+    parser.add_argument('--requests', type=int, default=500, help='requests per route')
+    parser.add_argument('--routes', help='comma-separated route names (default: all)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--baseline', help='earlier JSON results to compare p95 latency against')
+    parser.add_argument('--compare-untuned', action='store_true',
+                        help='also run the read routes with connect-per-call and no cache')
+    args = parser.parse_args()
+
+    print("🍽️ Restaurant Booking System - Route Benchmark")
+    print("=" * 50)
+
+    workdir = None
+    path = args.database
+    if path is None:
+        workdir = tempfile.mkdtemp(prefix='booking-bench-')
+        path = os.path.join(workdir, 'bench.db')
+        prepare_database(path)
+    names = args.routes.split(',') if args.routes else None
+
+    results = run_benchmark(path, args.requests, names)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as handle:
+            baseline = json.load(handle)['routes']
+    print_results(results, baseline)
+
+    if args.compare_untuned:
+        read_names = [name for name in READ_ROUTES if name in results]
+        untuned = run_benchmark(path, args.requests, read_names, UNTUNED_SETTINGS)
+        print()
+        print(f"{'read route':<26}{'untuned req/s':>15}{'tuned req/s':>13}{'speedup':>10}")
+        for name in read_names:
+            before, after = untuned[name]['throughput'], results[name]['throughput']
+            print(f"{name:<26}{before:>15.0f}{after:>13.0f}{after / before:>9.2f}x")
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump({'created_at': datetime.now().isoformat(timespec='seconds'), 'database': args.database,
+                       'requests_per_route': args.requests, 'routes': results}, handle, indent=2)
+        print(f"\n📁 Results written to {args.output}")
+
+    if workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,318 @@
+"""Slot-based table reservations.
+
+A booking holds its table on ``booking_date`` from ``start_minute`` up to
+``end_minute`` (minutes after midnight, half-open).  Two bookings for the
+same table clash when those intervals overlap, so a table can serve several
+parties a day instead of being locked by its first booking.
+
+Parties are seated by book_party(): the smallest free table that fits, or
+else the tightest combination of tables that share a ``combine_group``.
+A combined booking is one row per table; the extra rows point at the first
+through ``parent_id`` so each table stays blocked by the usual checks.
+Group bookings by book_group() (several tables for one large party, all or
+nothing) are stored the same way.
+"""
+
+import itertools
+
+DEFAULT_DURATION_MINUTES = 90
+
+BOOKING_STATUSES = ('confirmed', 'seated', 'completed', 'no_show', 'cancelled')
+
+# Bookings in these states keep their table occupied for the slot
+BLOCKING_STATUSES = ('confirmed', 'seated')
+
+_BLOCKING_SQL = ', '.join("'%s'" % status for status in BLOCKING_STATUSES)
+
+ADMIN_PAGE_SIZE = 25
+
+# Most tables pushed together for one party
+MAX_COMBINED_TABLES = 3
+
+# Most tables one group booking may hold
+MAX_GROUP_TABLES = 12
+
+
+def parse_time(value):
+    """Convert an ``HH:MM`` string into minutes after midnight"""
+    hours, _, minutes = value.partition(':')
+    hours, minutes = int(hours), int(minutes[:2])
+    if not (0 <= hours < 24 and 0 <= minutes < 60):
+        raise ValueError('Invalid booking time: %r' % value)
+    return hours * 60 + minutes
+
+
+def format_time(minute):
+    """Convert minutes after midnight back into ``HH:MM``"""
+    return '%02d:%02d' % divmod(minute, 60)
+
+
+def find_conflict(conn, table_id, booking_date, start_minute, end_minute):
+    """Return the first booking overlapping the slot on this table, if any"""
+    # Served by idx_bookings_table_slot: one index seek per (table, date)
+    return conn.execute(f'''
+        SELECT id FROM bookings
+        WHERE table_id = ? AND booking_date = ?
+          AND start_minute < ? AND end_minute > ?
+          AND status IN ({_BLOCKING_SQL})
+        LIMIT 1
+    ''', (table_id, booking_date, end_minute, start_minute)).fetchone()
+
+
+def available_tables(conn, restaurant_id, booking_date, start_minute, end_minute):
+    """List the in-service tables of a restaurant that are free for the slot"""
+    return conn.execute(f'''
+        SELECT t.* FROM restaurant_tables t
+        WHERE t.restaurant_id = ? AND t.is_available = 1
+          AND NOT EXISTS (
+              SELECT 1 FROM bookings b
+              WHERE b.table_id = t.id AND b.booking_date = ?
+                AND b.start_minute < ? AND b.end_minute > ?
+                AND b.status IN ({_BLOCKING_SQL})
+          )
+        ORDER BY t.id
+    ''', (restaurant_id, booking_date, end_minute, start_minute)).fetchall()
+
+
+def create_booking(conn, user_id, restaurant_id, table_id, booking_date,
+                   start_minute, party_size, duration=DEFAULT_DURATION_MINUTES, parent_id=None):
+    """Atomically book a table unless it is out of service or already taken.
+
+    The write lock is taken up front with ``BEGIN IMMEDIATE`` and the insert
+    itself is guarded by the overlap check, so two concurrent requests for the
+    same slot can never both succeed.  The caller commits (or rolls back) to
+    release the lock.  Returns the new booking id, or ``None`` when the slot
+    is not free.
+    """
+    end_minute = start_minute + duration
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+
+    cursor = conn.execute(f'''
+        INSERT INTO bookings
+            (user_id, restaurant_id, table_id, booking_date, booking_time, party_size,
+             duration_minutes, start_minute, end_minute, parent_id)
+        SELECT ?, t.restaurant_id, t.id, ?, ?, ?, ?, ?, ?, ?
+        FROM restaurant_tables t
+        WHERE t.id = ? AND t.restaurant_id = ? AND t.is_available = 1
+          AND NOT EXISTS (
+              SELECT 1 FROM bookings b
+              WHERE b.table_id = t.id AND b.booking_date = ?
+                AND b.start_minute < ? AND b.end_minute > ?
+                AND b.status IN ({_BLOCKING_SQL})
+          )
+    ''', (user_id, booking_date, format_time(start_minute), party_size, duration, start_minute, end_minute,
+          parent_id, table_id, restaurant_id, booking_date, end_minute, start_minute))
+    return cursor.lastrowid if cursor.rowcount else None
+
+
+def choose_tables(free_tables, party_size, max_combined=MAX_COMBINED_TABLES):
+    """Pick the tables to seat a party from rows with ``id``, ``capacity`` and ``combine_group``.
+
+    The smallest single table that fits wins, which keeps large tables for
+    large parties.  Failing that, the combination of up to ``max_combined``
+    tables from one combine group with the fewest empty seats, then the
+    fewest tables.  Returns a list of rows, empty if the party cannot be seated.
+    """
+    singles = [table for table in free_tables if table['capacity'] >= party_size]
+    if singles:
+        return [min(singles, key=lambda table: (table['capacity'], table['id']))]
+
+    groups = {}
+    for table in free_tables:
+        if table['combine_group']:
+            groups.setdefault(table['combine_group'], []).append(table)
+
+    best, best_key = [], None
+    for tables in groups.values():
+        if sum(table['capacity'] for table in tables) < party_size:
+            continue
+        for size in range(2, min(max_combined, len(tables)) + 1):
+            for combo in itertools.combinations(tables, size):
+                seats = sum(table['capacity'] for table in combo)
+                key = (seats, size, sorted(table['id'] for table in combo))
+                if seats >= party_size and (best_key is None or key < best_key):
+                    best, best_key = list(combo), key
+    return best
+
+
+def book_party(conn, user_id, restaurant_id, booking_date, start_minute, party_size,
+               duration=DEFAULT_DURATION_MINUTES):
+    """Allocate tables with choose_tables() and book them all under one write lock.
+
+    Returns ``(booking_id, tables)`` where ``booking_id`` is the party's
+    (first) booking, or ``(None, [])`` when no table or combination is free.
+    As with create_booking() the caller commits or rolls back.
+    """
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+
+    free = available_tables(conn, restaurant_id, booking_date, start_minute, start_minute + duration)
+    tables = choose_tables(free, party_size)
+    booking_id = None
+    for table in tables:
+        created = create_booking(conn, user_id, restaurant_id, table['id'], booking_date, start_minute,
+                                 party_size, duration, parent_id=booking_id)
+        if created is None:
+            # Cannot happen while we hold the write lock, but never book part of a party
+            return None, []
+        booking_id = booking_id or created
+    return booking_id, tables
+
+
+def spread_seats(free_tables, seats, max_tables=MAX_GROUP_TABLES):
+    """Pick tables from ``free_tables`` to seat a group of ``seats`` across several tables.
+
+    Largest tables first, so the group takes as few tables as it can, then
+    the smallest table that seats whoever is left.  Returns a list of rows,
+    empty if the free tables cannot seat everyone within ``max_tables``.
+    """
+    pool = sorted(free_tables, key=lambda table: (-table['capacity'], table['id']))
+    chosen, remaining = [], seats
+    while remaining > 0 and pool and len(chosen) < max_tables:
+        fits = [table for table in pool if table['capacity'] >= remaining]
+        table = min(fits, key=lambda table: (table['capacity'], table['id'])) if fits else pool[0]
+        pool.remove(table)
+        chosen.append(table)
+        remaining -= table['capacity']
+    return chosen if remaining <= 0 else []
+
+
+def book_group(conn, user_id, restaurant_id, booking_date, start_minute, party_size, table_ids=None,
+               duration=DEFAULT_DURATION_MINUTES):
+    """Book several tables for one group under one write lock: all of them or none.
+
+    With ``table_ids`` exactly those tables are booked; without, spread_seats()
+    picks tables for ``party_size`` guests.  The rows form one party like a
+    combined booking, so it is confirmed, listed and cancelled as one.
+
+    Returns ``(booking_id, tables, unavailable)``: the group's first booking
+    and its tables, or ``(None, [], ids)`` with the requested tables already
+    taken (none when there are simply not enough free seats).  Raises
+    ValueError for a request no free tables could satisfy.  As with
+    create_booking() the caller commits or rolls back.
+    """
+    if table_ids is not None:
+        table_ids = list(dict.fromkeys(int(table_id) for table_id in table_ids))
+        if not table_ids or len(table_ids) > MAX_GROUP_TABLES:
+            raise ValueError('Choose between 1 and %d tables.' % MAX_GROUP_TABLES)
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+
+    free = available_tables(conn, restaurant_id, booking_date, start_minute, start_minute + duration)
+    if table_ids is not None:
+        by_id = {table['id']: table for table in free}
+        unavailable = [table_id for table_id in table_ids if table_id not in by_id]
+        if unavailable:
+            return None, [], unavailable
+        tables = [by_id[table_id] for table_id in table_ids]
+        if sum(table['capacity'] for table in tables) < party_size:
+            raise ValueError('Those tables seat %d, not %d.' % (sum(table['capacity'] for table in tables),
+                                                                 party_size))
+    else:
+        tables = spread_seats(free, party_size)
+        if not tables:
+            return None, [], []
+
+    booking_id = None
+    for table in tables:
+        created = create_booking(conn, user_id, restaurant_id, table['id'], booking_date, start_minute,
+                                 party_size, duration, parent_id=booking_id)
+        if created is None:
+            # Cannot happen while we hold the write lock, but never book part of a group
+            return None, [], [table['id']]
+        booking_id = booking_id or created
+    return booking_id, tables, []
+
+
+def cancel_booking(conn, booking_id, user_id=None):
+    """Cancel a booking and the other tables of its party; return the number of rows cancelled.
+
+    With ``user_id`` only that user's booking is touched.  Freeing the
+    tables queues the slot for waitlist promotion (see waitlist.py).
+    """
+    owner = 'AND user_id = ?' if user_id is not None else ''
+    params = (booking_id, booking_id) + ((user_id,) if user_id is not None else ())
+    cursor = conn.execute(f'''
+        UPDATE bookings SET status = 'cancelled'
+        WHERE (id = ? OR parent_id = ?) AND status IN ({_BLOCKING_SQL}) {owner}
+    ''', params)
+    return cursor.rowcount
+
+
+def user_bookings(conn, user_id, date_from):
+    """A user's bookings from ``date_from`` on, one row per party"""
+    return conn.execute('''
+        SELECT b.*, r.name AS restaurant_name, rt.table_number || COALESCE((
+                   SELECT ' + ' || group_concat(ct.table_number, ' + ')
+                   FROM bookings c JOIN restaurant_tables ct ON ct.id = c.table_id
+                   WHERE c.parent_id = b.id), '') AS table_number
+        FROM bookings b
+        JOIN restaurants r ON r.id = b.restaurant_id
+        JOIN restaurant_tables rt ON rt.id = b.table_id
+        WHERE b.user_id = ? AND b.booking_date >= ? AND b.parent_id IS NULL
+        ORDER BY b.booking_date, b.booking_time, b.id
+    ''', (user_id, date_from)).fetchall()
+
+
+def count_double_bookings(conn):
+    """Count pairs of blocking bookings that overlap on the same table"""
+    return conn.execute(f'''
+        SELECT COUNT(*) FROM bookings a
+        JOIN bookings b ON b.table_id = a.table_id AND b.booking_date = a.booking_date AND b.id > a.id
+        WHERE a.start_minute < b.end_minute AND b.start_minute < a.end_minute
+          AND a.status IN ({_BLOCKING_SQL}) AND b.status IN ({_BLOCKING_SQL})
+    ''').fetchone()[0]
+
+
+def encode_cursor(row):
+    """Opaque keyset cursor for the (booking_date, booking_time, id) of a row"""
+    return '%s_%s_%d' % (row['booking_date'], row['booking_time'], row['id'])
+
+
+def decode_cursor(cursor):
+    booking_date, booking_time, booking_id = cursor.split('_')
+    return booking_date, booking_time, int(booking_id)
+
+
+def page_bookings(conn, restaurant_id, date_from=None, date_to=None, status=None,
+                  after=None, descending=False, limit=ADMIN_PAGE_SIZE):
+    """One page of a restaurant's bookings in (date, time, id) order.
+
+    Pages are keyset-paginated: ``after`` is the cursor of the last row of the
+    previous page, so every page is a single index range scan no matter how
+    deep it is.  Returns ``(rows, next_cursor)``; ``next_cursor`` is ``None``
+    on the last page.
+    """
+    clauses = ['b.restaurant_id = ?']
+    params = [restaurant_id]
+    if date_from:
+        clauses.append('b.booking_date >= ?')
+        params.append(date_from)
+    if date_to:
+        clauses.append('b.booking_date <= ?')
+        params.append(date_to)
+    if status:
+        clauses.append('b.status = ?')
+        params.append(status)
+    if after:
+        clauses.append('(b.booking_date, b.booking_time, b.id) %s (?, ?, ?)' % ('<' if descending else '>'))
+        params.extend(decode_cursor(after))
+
+    order = 'DESC' if descending else 'ASC'
+    rows = conn.execute(f'''
+        SELECT b.*, u.username, rt.table_number || COALESCE((
+                   SELECT ' + ' || group_concat(ct.table_number, ' + ')
+                   FROM bookings c JOIN restaurant_tables ct ON ct.id = c.table_id
+                   WHERE c.parent_id = b.id), '') AS table_number
+        FROM bookings b
+        JOIN users u ON b.user_id = u.id
+        JOIN restaurant_tables rt ON b.table_id = rt.id
+        WHERE {' AND '.join(clauses)} AND b.parent_id IS NULL
+        ORDER BY b.booking_date {order}, b.booking_time {order}, b.id {order}
+        LIMIT ?
+    ''', params + [limit + 1]).fetchall()
+
+    if len(rows) > limit:
+        return rows[:limit], encode_cursor(rows[limit - 1])
+    return rows, None
@@ -0,0 +1,166 @@
+"""Read-through cache for near-static catalog lookups.
+
+Entries live in a bounded in-process LRU with a TTL.  Every entry carries
+tags (e.g. ``restaurant:5``) so a write can drop exactly the entries it
+affects with ``invalidate(tag)``.
+
+Several worker processes can optionally share entries through a
+``SQLiteStore`` on local disk.  Invalidations are applied to the store at
+once; other workers keep their own local copies for at most ``local_ttl``
+seconds, which bounds how stale a sibling process can be after a write.
+
+Cached values must be picklable when a store is used, so loaders should
+return plain dicts and lists rather than ``sqlite3.Row`` objects.
+"""
+
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class Cache:
+    """Thread-safe LRU/TTL cache with tag invalidation and hit/miss counters"""
+
+    def __init__(self, max_entries=1024, ttl=300, store=None, local_ttl=2):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.store = store
+        self.local_ttl = min(ttl, local_ttl) if store else ttl
+        self._entries = OrderedDict()  # key -> (expires, value, tags)
+        self._tags = {}  # tag -> set of keys
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = self.invalidations = 0
+
+    def get_or_load(self, key, loader, tags=()):
+        """Return the cached value for ``key``, calling ``loader()`` on a miss"""
+        value = self._get_local(key)
+        if value is not _MISSING:
+            return value
+
+        if self.store is not None:
+            value = self.store.get(key)
+            if value is not _MISSING:
+                self._set_local(key, value, tags)
+                return value
+
+        value = loader()
+        if self.store is not None:
+            self.store.set(key, value, tags, time.time() + self.ttl)
+        self._set_local(key, value, tags)
+        return value
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return _MISSING
+            if entry[0] < time.monotonic():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return _MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def _set_local(self, key, value, tags):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.local_ttl, value, tags)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _remove(self, key):
+        _, _, tags = self._entries.pop(key)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def invalidate(self, tag):
+        """Drop every entry carrying ``tag``; return how many local entries went"""
+        with self._lock:
+            keys = list(self._tags.get(tag, ()))
+            for key in keys:
+                self._remove(key)
+            self.invalidations += len(keys)
+        if self.store is not None:
+            self.store.invalidate(tag)
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+        if self.store is not None:
+            self.store.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+class SQLiteStore:
+    """Cache entries shared between worker processes through a local SQLite file"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute('''CREATE TABLE IF NOT EXISTS cache_entries
+                        (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL NOT NULL)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS cache_tags
+                        (tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key)) WITHOUT ROWID''')
+        conn.commit()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=5.0)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = OFF')
+        return conn
+
+    def get(self, key):
+        row = self._conn().execute('SELECT value FROM cache_entries WHERE key = ? AND expires > ?',
+                                   (repr(key), time.time())).fetchone()
+        return pickle.loads(row[0]) if row else _MISSING
+
+    def set(self, key, value, tags, expires):
+        conn = self._conn()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO cache_entries (key, value, expires) VALUES (?, ?, ?)',
+                         (repr(key), pickle.dumps(value, pickle.HIGHEST_PROTOCOL), expires))
+            conn.executemany('INSERT OR IGNORE INTO cache_tags (tag, key) VALUES (?, ?)',
+                             [(tag, repr(key)) for tag in tags])
+
+    def invalidate(self, tag):
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM cache_entries WHERE key IN (SELECT key FROM cache_tags WHERE tag = ?)', (tag,))
+            conn.execute('DELETE FROM cache_tags WHERE tag = ?', (tag,))
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute('DELETE FROM cache_entries')
+            conn.execute('DELETE FROM cache_tags')
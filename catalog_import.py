@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+"""
+Bulk catalog import for restaurants, tables and menu items
+
+Reads CSV or JSON files and loads them in one transaction. Rows are staged
+with executemany into temporary tables and merged with a handful of
+set-based statements, so tens of thousands of menu items load in well under
+a second. Rows are matched on their natural keys, so re-running an import
+updates rows in place instead of duplicating them:
+
+    restaurants   city + name
+    tables        city + restaurant + table_number
+    menu items    city + restaurant + item_name
+
+Columns (CSV header or JSON object keys):
+    restaurants   city, name, cuisine_type, is_veg_only, description, image_url
+    tables        city, restaurant, table_number, capacity, combine_group
+    menu items    city, restaurant, item_name, description, price, category, is_veg, image_url
+
+capacity must be a whole number from 1 to MAX_CAPACITY, price a number of
+at least 0, and is_veg / is_veg_only one of 1/0, true/false or yes/no. Any
+other value fails the whole import with the row it is on.
+
+A JSON file holds either a list of rows or an object with any of the keys
+"restaurants", "tables" and "menu_items".
+
+Usage:
+    python catalog_import.py [--restaurants FILE] [--tables FILE] [--menu-items FILE]
+                             [--database restaurant_booking.db]
+"""
+
+import argparse
+import csv
+import io
+import json
+import math
+import sqlite3
+import time
+
+import migrations
+import search
+
+BATCH_SIZE = 5000
+
+COLUMNS = {
+    'restaurants': ['city', 'name', 'cuisine_type', 'is_veg_only', 'description', 'image_url'],
+    'tables': ['city', 'restaurant', 'table_number', 'capacity', 'combine_group'],
+    'menu_items': ['city', 'restaurant', 'item_name', 'description', 'price', 'category', 'is_veg', 'image_url'],
+}
+
+REQUIRED = {
+    'restaurants': ['city', 'name', 'cuisine_type'],
+    'tables': ['city', 'restaurant', 'table_number', 'capacity'],
+    'menu_items': ['city', 'restaurant', 'item_name', 'price', 'category'],
+}
+
+# Largest table an import may declare
+MAX_CAPACITY = 100
+
+_FLAGS = {'1': 1, '0': 0, 'true': 1, 'false': 0, 'yes': 1, 'no': 0}
+
+class CatalogImportError(ValueError):
+    """An import file is malformed or missing required columns"""
+
+def _capacity(value):
+    if isinstance(value, bool) or isinstance(value, float) and not value.is_integer():
+        raise ValueError(value)
+    capacity = int(value)
+    if not 1 <= capacity <= MAX_CAPACITY:
+        raise ValueError(value)
+    return capacity
+
+def _price(value):
+    if isinstance(value, bool):
+        raise ValueError(value)
+    price = float(value)
+    if not math.isfinite(price) or price < 0:
+        raise ValueError(value)
+    return price
+
+def _flag(value):
+    if isinstance(value, bool):
+        return int(value)
+    flag = _FLAGS.get(str(value).strip().lower())
+    if flag is None:
+        raise ValueError(value)
+    return flag
+
+def _text(value):
+    # Numbers in JSON (e.g. a table_number of 5) are kept as their text
+    if isinstance(value, (dict, list)):
+        raise ValueError(value)
+    return value if isinstance(value, str) else str(value)
+
+# Every other column is text
+CONVERTERS = {'capacity': _capacity, 'price': _price, 'is_veg': _flag, 'is_veg_only': _flag}
+
+def parse_rows(kind, text, fmt):
+    """Parse CSV or JSON text into a list of row tuples in COLUMNS order, with typed values"""
+    if fmt == 'json':
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as error:
+            raise CatalogImportError('%s file is not valid JSON: %s' % (kind, error)) from None
+        records = data.get(kind, []) if isinstance(data, dict) else data
+        if not isinstance(records, list):
+            raise CatalogImportError('%s must be a list of objects' % kind)
+    elif fmt == 'csv':
+        records = list(csv.DictReader(io.StringIO(text)))
+    else:
+        raise CatalogImportError('Unsupported format: %s' % fmt)
+
+    rows = []
+    for number, record in enumerate(records, 1):
+        if not isinstance(record, dict):
+            raise CatalogImportError('%s row %d is not an object' % (kind, number))
+        missing = [name for name in REQUIRED[kind] if record.get(name) in (None, '')]
+        if missing:
+            raise CatalogImportError('%s row %d is missing %s' % (kind, number, ', '.join(missing)))
+        row = []
+        for name in COLUMNS[kind]:
+            value = record.get(name)
+            if value is None or value == '':
+                row.append(None)
+                continue
+            try:
+                row.append(CONVERTERS.get(name, _text)(value))
+            except (TypeError, ValueError):
+                raise CatalogImportError('%s row %d has an invalid %s: %r' % (kind, number, name, value)) from None
+        rows.append(tuple(row))
+    return rows
+
+def read_file(kind, path):
+    fmt = 'json' if path.lower().endswith('.json') else 'csv'
+    with open(path, encoding='utf-8') as handle:
+        return parse_rows(kind, handle.read(), fmt)
+
+def _stage(conn, table, columns, rows, progress, stage):
+    """Load rows into a temp staging table; later duplicates of a key win"""
+    placeholders = ', '.join('?' * len(columns))
+    sql = 'INSERT OR REPLACE INTO %s (%s) VALUES (%s)' % (table, ', '.join(columns), placeholders)
+    for start in range(0, len(rows), BATCH_SIZE):
+        conn.executemany(sql, rows[start:start + BATCH_SIZE])
+        progress(stage, min(start + BATCH_SIZE, len(rows)), len(rows))
+
+def import_catalog(conn, restaurants=(), tables=(), menu_items=(), progress=lambda stage, done, total: None):
+    """Upsert parsed catalog rows in one transaction; return per-kind counts.
+
+    ``progress(stage, done, total)`` is called after every staged batch.
+    Tables and menu items whose restaurant does not exist are skipped and
+    counted under ``skipped``.
+    """
+    summary = {}
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('''CREATE TEMP TABLE import_restaurants (
+                            city TEXT, name TEXT, cuisine_type TEXT, is_veg_only INTEGER, description TEXT,
+                            image_url TEXT, PRIMARY KEY (city, name))''')
+        conn.execute('''CREATE TEMP TABLE import_tables (
+                            city TEXT, restaurant TEXT, table_number TEXT, capacity INTEGER, combine_group TEXT,
+                            restaurant_id INTEGER, PRIMARY KEY (city, restaurant, table_number))''')
+        conn.execute('''CREATE TEMP TABLE import_menu_items (
+                            city TEXT, restaurant TEXT, item_name TEXT, description TEXT, price REAL,
+                            category TEXT, is_veg INTEGER, image_url TEXT,
+                            restaurant_id INTEGER, PRIMARY KEY (city, restaurant, item_name))''')
+
+        # Restaurants: create missing cities, update matches, insert the rest
+        _stage(conn, 'import_restaurants', COLUMNS['restaurants'], list(restaurants), progress, 'restaurants')
+        conn.execute('INSERT OR IGNORE INTO locations (city_name) SELECT DISTINCT city FROM import_restaurants')
+        updated = conn.execute('''
+            UPDATE restaurants
+            SET cuisine_type = i.cuisine_type, is_veg_only = COALESCE(i.is_veg_only, 0),
+                description = i.description, image_url = COALESCE(i.image_url, restaurants.image_url)
+            FROM import_restaurants i JOIN locations l ON l.city_name = i.city
+            WHERE restaurants.location_id = l.id AND restaurants.name = i.name
+        ''').rowcount
+        inserted = conn.execute('''
+            INSERT INTO restaurants (name, location_id, cuisine_type, is_veg_only, description, image_url)
+            SELECT i.name, l.id, i.cuisine_type, COALESCE(i.is_veg_only, 0), i.description, i.image_url
+            FROM import_restaurants i JOIN locations l ON l.city_name = i.city
+            WHERE NOT EXISTS (SELECT 1 FROM restaurants r WHERE r.location_id = l.id AND r.name = i.name)
+        ''').rowcount
+        summary['restaurants'] = {'inserted': inserted, 'updated': updated}
+
+        # Tables and menu items belong to the oldest restaurant with that city and name
+        for kind, staging, target, key, fields in [
+            ('tables', 'import_tables', 'restaurant_tables', 'table_number', ['capacity', 'combine_group']),
+            ('menu_items', 'import_menu_items', 'menu_items', 'item_name',
+             ['description', 'price', 'category', 'is_veg', 'image_url']),
+        ]:
+            rows = menu_items if kind == 'menu_items' else tables
+            _stage(conn, staging, COLUMNS[kind], list(rows), progress, kind)
+            conn.execute(f'''
+                UPDATE {staging} SET restaurant_id = (
+                    SELECT MIN(r.id) FROM restaurants r JOIN locations l ON r.location_id = l.id
+                    WHERE l.city_name = {staging}.city AND r.name = {staging}.restaurant)
+            ''')
+            skipped = conn.execute(f'DELETE FROM {staging} WHERE restaurant_id IS NULL').rowcount
+            if kind == 'menu_items':
+                conn.execute('UPDATE import_menu_items SET is_veg = COALESCE(is_veg, 1)')
+            assignments = ', '.join('%s = i.%s' % (field, field) for field in fields)
+            updated = conn.execute(f'''
+                UPDATE {target} SET {assignments}
+                FROM {staging} i
+                WHERE {target}.restaurant_id = i.restaurant_id AND {target}.{key} = i.{key}
+            ''').rowcount
+            columns = ['restaurant_id', key] + fields
+            inserted = conn.execute(f'''
+                INSERT INTO {target} ({', '.join(columns)})
+                SELECT {', '.join('i.' + column for column in columns)}
+                FROM {staging} i
+                WHERE NOT EXISTS (SELECT 1 FROM {target} t
+                                  WHERE t.restaurant_id = i.restaurant_id AND t.{key} = i.{key})
+            ''').rowcount
+            summary[kind] = {'inserted': inserted, 'updated': updated, 'skipped': skipped}
+
+        conn.execute('DROP TABLE temp.import_restaurants')
+        conn.execute('DROP TABLE temp.import_tables')
+        conn.execute('DROP TABLE temp.import_menu_items')
+        # Rebuild the search documents of every touched restaurant now rather than on the next search
+        search.refresh(conn)
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import restaurants, tables and menu items')
+    parser.add_argument('--restaurants', help='CSV or JSON file of restaurants')
+    parser.add_argument('--tables', help='CSV or JSON file of restaurant tables')
+    parser.add_argument('--menu-items', help='CSV or JSON file of menu items')
+    parser.add_argument('--database', default='restaurant_booking.db')
+    args = parser.parse_args()
+
+    if not (args.restaurants or args.tables or args.menu_items):
+        parser.error('give at least one of --restaurants, --tables, --menu-items')
+
+    print("🍽️ Restaurant Booking System - Catalog Import")
+    print("=" * 50)
+
+    started = time.perf_counter()
+    data = {kind: read_file(kind, path) if path else []
+            for kind, path in [('restaurants', args.restaurants), ('tables', args.tables),
+                               ('menu_items', args.menu_items)]}
+
+    def progress(stage, done, total):
+        print(f"\r⏳ Staging {stage}: {done}/{total}", end='\n' if done == total else '', flush=True)
+
+    conn = sqlite3.connect(args.database)
+    migrations.migrate(conn)
+    summary = import_catalog(conn, data['restaurants'], data['tables'], data['menu_items'], progress)
+    conn.close()
+
+    for kind, counts in summary.items():
+        print(f"✅ {kind}: " + ', '.join(f"{count} {label}" for label, count in counts.items()))
+    print(f"⏱️  Finished in {time.perf_counter() - started:.2f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+"""SQLite connection handling.
+
+Connections are opened once per thread and tuned with the PRAGMAs below,
+then handed back to a small per-thread pool when the caller closes them, so a
+request reuses a warm connection (and its page and statement caches) instead
+of paying for ``sqlite3.connect`` every time.
+
+Settings are read from the Flask config:
+
+    DATABASE              path of the SQLite file
+    DB_POOLING            reuse connections (False opens one per call)
+    DB_POOL_SIZE          idle connections kept per thread
+    SQLITE_JOURNAL_MODE   journal mode, WAL lets readers run beside a writer
+    SQLITE_SYNCHRONOUS    NORMAL is durable in WAL mode and avoids an fsync per commit
+    SQLITE_CACHE_SIZE     page cache per connection in KiB
+    SQLITE_MMAP_SIZE      bytes of the file to memory-map
+    SQLITE_BUSY_TIMEOUT   seconds to wait for a lock before failing
+    SQLITE_STATEMENT_CACHE  prepared statements cached per connection
+    SQL_METRICS           count statements, SQL time and rows in ``sql_stats``
+    SQL_SLOW_MS           log statements at least this slow (None turns the log off)
+    SQL_SLOW_LOG          file of the slow-query log, rotated at SQL_SLOW_LOG_BYTES
+                          with SQL_SLOW_LOG_BACKUPS old files kept (see slow_queries.py)
+
+A connection may also attach a second file as ``catalog`` and read its
+``users`` table through a temporary view; sharded mode (see shards.py) uses
+this so a city's shard can join bookings to their users.
+"""
+
+import sqlite3
+import threading
+from time import perf_counter as _now
+
+import slow_queries
+
+DEFAULT_SETTINGS = {
+    'DB_POOLING': True,
+    'DB_POOL_SIZE': 4,
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_CACHE_SIZE': 16384,
+    'SQLITE_MMAP_SIZE': 64 * 1024 * 1024,
+    'SQLITE_BUSY_TIMEOUT': 5.0,
+    'SQLITE_STATEMENT_CACHE': 512,
+    'SQL_METRICS': True,
+    'SQL_SLOW_MS': 100,
+    'SQL_SLOW_LOG': 'slow_queries.log',
+    'SQL_SLOW_LOG_BYTES': 10 * 1024 * 1024,
+    'SQL_SLOW_LOG_BACKUPS': 5,
+}
+
+
+class SQLStats(threading.local):
+    """Per-thread SQL counters; the app resets them at the start of each request"""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.queries = 0
+        self.seconds = 0.0
+        self.rows = 0
+
+
+sql_stats = SQLStats()
+
+
+class PooledConnection(sqlite3.Connection):
+    """Connection whose close() hands it back to its pool"""
+
+    pool = None
+    checked_out = False
+
+    def close(self):
+        if self.pool is None:
+            super().close()
+        elif self.checked_out:
+            if self.in_transaction:
+                self.rollback()
+            self.checked_out = False
+            self.pool.release(self)
+
+    def dispose(self):
+        """Really close the underlying connection"""
+        self.pool = None
+        super().close()
+
+
+class ConnectionPool:
+    """Per-thread pool of tuned connections to one database file"""
+
+    def __init__(self, database, settings, attach=None):
+        self.database = database
+        self.settings = settings
+        self.attach = attach
+        self._local = threading.local()
+
+    def _idle(self):
+        idle = getattr(self._local, 'idle', None)
+        if idle is None:
+            idle = self._local.idle = []
+        return idle
+
+    def acquire(self):
+        idle = self._idle()
+        conn = idle.pop() if idle else open_connection(self.database, self.settings, self.attach)
+        conn.pool = self
+        conn.checked_out = True
+        return conn
+
+    def release(self, conn):
+        idle = self._idle()
+        if len(idle) < self.settings['DB_POOL_SIZE']:
+            idle.append(conn)
+        else:
+            conn.dispose()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that counts the rows it returns, and the time spent fetching them, on its connection"""
+
+    # (sql, parameters, seconds so far) while a statement could still turn out slow
+    statement = None
+
+    def _fetched(self, conn, seconds):
+        sql, parameters, total = self.statement
+        total += seconds
+        if total >= conn.slow_seconds:
+            self.statement = None
+            conn.slow_log.record(conn, sql, parameters, total)
+        else:
+            self.statement = (sql, parameters, total)
+
+    def fetchone(self):
+        # SQLite steps to the first row inside execute(), which is already timed
+        row = sqlite3.Cursor.fetchone(self)
+        if row is not None:
+            self.connection.sql_rows += 1
+        return row
+
+    def fetchmany(self, *args, **kwargs):
+        started = _now()
+        rows = sqlite3.Cursor.fetchmany(self, *args, **kwargs)
+        conn = self.connection
+        elapsed = _now() - started
+        conn.sql_seconds += elapsed
+        conn.sql_rows += len(rows)
+        if self.statement is not None:
+            self._fetched(conn, elapsed)
+        return rows
+
+    def fetchall(self):
+        started = _now()
+        rows = sqlite3.Cursor.fetchall(self)
+        conn = self.connection
+        elapsed = _now() - started
+        conn.sql_seconds += elapsed
+        conn.sql_rows += len(rows)
+        if self.statement is not None:
+            self._fetched(conn, elapsed)
+        return rows
+
+    def __next__(self):
+        row = sqlite3.Cursor.__next__(self)
+        self.connection.sql_rows += 1
+        return row
+
+
+class InstrumentedConnection(PooledConnection):
+    """Pooled connection that counts its statements, SQL time and rows.
+
+    Counters live on the connection, which is cheaper to update than a
+    thread-local, and move into ``sql_stats`` when it is closed (or
+    flush_stats() is called), so ``sql_stats`` covers every connection the
+    thread used.
+    """
+
+    sql_queries = 0
+    sql_seconds = 0.0
+    sql_rows = 0
+    # Set from SQL_SLOW_MS and SQL_SLOW_LOG by open_connection()
+    slow_seconds = float('inf')
+    slow_log = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return sqlite3.Connection.cursor(self, factory)
+
+    def execute(self, sql, parameters=()):
+        started = _now()
+        cursor = sqlite3.Connection.cursor(self, InstrumentedCursor)
+        try:
+            return cursor.execute(sql, parameters)
+        finally:
+            elapsed = _now() - started
+            self.sql_queries += 1
+            self.sql_seconds += elapsed
+            if elapsed >= self.slow_seconds:
+                self.slow_log.record(self, sql, parameters, elapsed)
+            elif self.slow_log is not None:
+                # Fetching the rows may still push it over the threshold
+                cursor.statement = (sql, parameters, elapsed)
+
+    def executemany(self, sql, parameters):
+        started = _now()
+        try:
+            return sqlite3.Connection.cursor(self, InstrumentedCursor).executemany(sql, parameters)
+        finally:
+            elapsed = _now() - started
+            self.sql_queries += 1
+            self.sql_seconds += elapsed
+            if elapsed >= self.slow_seconds:
+                self.slow_log.record(self, sql, parameters, elapsed, many=True)
+
+    def flush_stats(self):
+        if self.sql_queries or self.sql_rows:
+            sql_stats.queries += self.sql_queries
+            sql_stats.seconds += self.sql_seconds
+            sql_stats.rows += self.sql_rows
+            self.sql_queries = self.sql_rows = 0
+            self.sql_seconds = 0.0
+
+    def close(self):
+        self.flush_stats()
+        super().close()
+
+    def dispose(self):
+        self.flush_stats()
+        super().dispose()
+
+
+def open_connection(database, settings, attach=None, check_same_thread=True):
+    """Open a connection with the configured PRAGMAs applied.
+
+    ``attach`` names a catalog database whose users become readable as
+    ``users``.  Use such connections for reads only: a write transaction on
+    them takes the catalog's write lock too.
+    """
+    conn = sqlite3.connect(database, timeout=settings['SQLITE_BUSY_TIMEOUT'],
+                           cached_statements=settings['SQLITE_STATEMENT_CACHE'], uri=database.startswith('file:'),
+                           check_same_thread=check_same_thread,
+                           factory=InstrumentedConnection if settings['SQL_METRICS'] or settings['SQL_SLOW_MS'] is not None
+                           else PooledConnection)
+    conn.row_factory = sqlite3.Row
+    if settings['SQL_SLOW_MS'] is not None:
+        conn.slow_seconds = settings['SQL_SLOW_MS'] / 1000
+        conn.slow_log = slow_queries.get_log(settings['SQL_SLOW_LOG'], settings['SQL_SLOW_LOG_BYTES'],
+                                             settings['SQL_SLOW_LOG_BACKUPS'])
+    conn.execute('PRAGMA journal_mode = %s' % settings['SQLITE_JOURNAL_MODE'])
+    conn.execute('PRAGMA synchronous = %s' % settings['SQLITE_SYNCHRONOUS'])
+    conn.execute('PRAGMA cache_size = -%d' % settings['SQLITE_CACHE_SIZE'])
+    conn.execute('PRAGMA mmap_size = %d' % settings['SQLITE_MMAP_SIZE'])
+    if attach is not None:
+        conn.execute('ATTACH DATABASE ? AS catalog', (attach,))
+        # Temporary objects shadow the file's own (empty) users table
+        conn.execute('CREATE TEMP VIEW users AS SELECT * FROM catalog.users')
+    return conn
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(database, settings, attach=None):
+    """Return the pool for a database file, creating it on first use"""
+    key = (database, attach, tuple(sorted(settings.items())))
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, ConnectionPool(database, settings, attach))
+    return pool
+
+
+def connect(config, database=None, attach=None):
+    """Get a connection for the given Flask config, to ``database`` instead of DATABASE if given"""
+    settings = {name: config.get(name, default) for name, default in DEFAULT_SETTINGS.items()}
+    database = database or config['DATABASE']
+    if not settings['DB_POOLING']:
+        return open_connection(database, settings, attach)
+    return get_pool(database, settings, attach).acquire()
+
+
+def reset_pools():
+    """Close this thread's idle connections and forget all pools.
+
+    Call before forking workers or after the database file was replaced;
+    connections idling in other threads are closed when those threads exit.
+    """
+    with _pools_lock:
+        for pool in _pools.values():
+            idle = pool._idle()
+            while idle:
+                idle.pop().dispose()
+        _pools.clear()
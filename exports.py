@@ -0,0 +1,99 @@
+"""Streaming exports of a restaurant's bookings and ratings.
+
+Rows are pulled from the SQLite cursor in small batches and encoded as they
+go, so an export holds one batch in memory whether it has a hundred rows or
+ten million.
+"""
+
+import csv
+import io
+import json
+
+BATCH_SIZE = 500
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+BOOKING_COLUMNS = ['id', 'booking_date', 'booking_time', 'duration_minutes', 'table_number', 'party_size',
+                   'status', 'username', 'email', 'phone', 'created_at']
+
+RATING_COLUMNS = ['id', 'created_at', 'username', 'customer_service', 'food_quality', 'respect',
+                  'overall_rating', 'review_text']
+
+
+def query_bookings(conn, restaurant_id, date_from=None, date_to=None):
+    """Cursor over a restaurant's bookings in date order, one row per party"""
+    clauses, params = ['b.restaurant_id = ?'], [restaurant_id]
+    if date_from:
+        clauses.append('b.booking_date >= ?')
+        params.append(date_from)
+    if date_to:
+        clauses.append('b.booking_date <= ?')
+        params.append(date_to)
+    return conn.execute(f'''
+        SELECT b.id, b.booking_date, b.booking_time, b.duration_minutes,
+               rt.table_number || COALESCE((
+                   SELECT ' + ' || group_concat(ct.table_number, ' + ')
+                   FROM bookings c JOIN restaurant_tables ct ON ct.id = c.table_id
+                   WHERE c.parent_id = b.id), ''),
+               b.party_size, b.status, u.username, u.email, u.phone, b.created_at
+        FROM bookings b
+        LEFT JOIN users u ON b.user_id = u.id
+        LEFT JOIN restaurant_tables rt ON b.table_id = rt.id
+        WHERE {' AND '.join(clauses)} AND b.parent_id IS NULL
+        ORDER BY b.booking_date, b.booking_time, b.id
+    ''', params)
+
+
+def query_ratings(conn, restaurant_id, date_from=None, date_to=None):
+    """Cursor over a restaurant's ratings in submission order"""
+    clauses, params = ['r.restaurant_id = ?'], [restaurant_id]
+    if date_from:
+        clauses.append('r.created_at >= ?')
+        params.append(date_from)
+    if date_to:
+        # created_at is a timestamp, so include the whole last day
+        clauses.append("r.created_at < date(?, '+1 day')")
+        params.append(date_to)
+    return conn.execute(f'''
+        SELECT r.id, r.created_at, u.username, r.customer_service, r.food_quality, r.respect,
+               r.overall_rating, r.review_text
+        FROM ratings r
+        LEFT JOIN users u ON r.user_id = u.id
+        WHERE {' AND '.join(clauses)}
+        ORDER BY r.created_at, r.id
+    ''', params)
+
+
+def _batches(cursor):
+    while True:
+        rows = cursor.fetchmany(BATCH_SIZE)
+        if not rows:
+            return
+        yield rows
+
+
+def iter_csv(cursor, columns):
+    """Yield CSV text, header first, one chunk per batch of rows"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in _batches(cursor):
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def iter_ndjson(cursor, columns):
+    """Yield one JSON object per line, one chunk per batch of rows"""
+    for rows in _batches(cursor):
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows)
+
+
+def iter_export(cursor, columns, fmt):
+    return iter_csv(cursor, columns) if fmt == 'csv' else iter_ndjson(cursor, columns)
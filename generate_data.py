@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Synthetic production-shaped dataset generator
+
+Builds a database with thousands of restaurants spread over the Tamil Nadu
+cities, hundreds of thousands of tables and menu items, and millions of
+bookings and ratings. The same --seed and --today always produce the same
+database, so benchmark results are comparable between runs.
+
+Usage:
+    python generate_data.py --output large.db [--scale 1.0] [--seed 42] [--today 2025-09-01]
+
+At --scale 1.0 the database holds 3,000 restaurants, 150,000 tables,
+240,000 menu items, 2,250,000 bookings and 1,000,000 ratings. Use a smaller
+scale (e.g. 0.01) for quick runs.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import time
+from datetime import date, timedelta
+
+import migrations
+import ratings
+import search
+
+CITIES = ['Karur', 'Dindigul', 'Salem', 'Madurai', 'Chennai', 'Coimbatore', 'Trichy', 'Erode']
+CUISINES = ['South Indian', 'Biryani', 'Chettinad', 'Multi-cuisine', 'North Indian', 'Chinese']
+NAME_PARTS = (['Sri', 'Hotel', 'New', 'Royal', 'Annapoorna', 'Murugan', 'Ganesh', 'Lakshmi', 'Kaveri', 'Golden'],
+              ['Bhavan', 'Mess', 'Restaurant', 'Kitchen', 'Palace', 'Dhaba', 'Cafe', 'Inn', 'Biryani House', 'Meals'])
+DISHES = ['Idli', 'Dosa', 'Vada', 'Pongal', 'Meals', 'Biryani', 'Parotta', 'Chukka', 'Kurma', 'Rasam',
+          'Sambar Rice', 'Curd Rice', 'Chicken 65', 'Fish Fry', 'Payasam', 'Filter Coffee']
+CATEGORIES = ['Breakfast', 'Lunch', 'Main Course', 'Starters', 'Desserts', 'Beverages']
+# Non-overlapping 90 minute slots, so each table takes at most one booking per slot
+SLOTS = [('12:00', 720), ('13:30', 810), ('19:00', 1140), ('20:30', 1230)]
+STATUSES = ['confirmed'] * 18 + ['cancelled'] * 2
+
+BATCH_SIZE = 50000
+
+def scaled(value, scale):
+    return max(1, int(value * scale))
+
+def insert_batches(conn, sql, rows, label):
+    """executemany in batches, printing progress"""
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            conn.executemany(sql, batch)
+            count += len(batch)
+            batch = []
+            print(f"\r⏳ {label}: {count}", end='', flush=True)
+    conn.executemany(sql, batch)
+    count += len(batch)
+    print(f"\r✅ {label}: {count}")
+    return count
+
+def generate(path, scale=1.0, seed=42, today=None):
+    """Write a fresh synthetic database to ``path``; return row counts"""
+    rng = random.Random(seed)
+    today = today or date.today()
+    if os.path.exists(path):
+        os.remove(path)
+
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode = OFF')
+    conn.execute('PRAGMA synchronous = OFF')
+    migrations.migrate(conn)
+
+    n_restaurants = scaled(3000, scale)
+    n_users = scaled(50000, scale)
+    tables_per_restaurant = 50
+    menu_per_restaurant = 80
+    bookings_per_table = scaled(15, min(scale * 10, 1.0))
+    n_ratings = scaled(1000000, scale)
+
+    conn.executemany('INSERT INTO locations (city_name) VALUES (?)', [(city,) for city in CITIES])
+
+    insert_batches(conn, 'INSERT INTO users (username, password, email, phone) VALUES (?, ?, ?, ?)',
+                   (('user%d' % n, 'password123', 'user%d@email.com' % n, '9%09d' % n)
+                    for n in range(1, n_users + 1)), 'users')
+
+    restaurant_rows = []
+    for n in range(1, n_restaurants + 1):
+        is_veg = rng.random() < 0.35
+        name = '%s %s %d' % (rng.choice(NAME_PARTS[0]), rng.choice(NAME_PARTS[1]), n)
+        restaurant_rows.append((name, rng.randint(1, len(CITIES)), rng.choice(CUISINES), int(is_veg),
+                                'Serving %s favourites since %d' % (rng.choice(CUISINES), rng.randint(1950, 2020))))
+    insert_batches(conn, '''INSERT INTO restaurants (name, location_id, cuisine_type, is_veg_only, description)
+                            VALUES (?, ?, ?, ?, ?)''', restaurant_rows, 'restaurants')
+
+    insert_batches(conn, 'INSERT INTO restaurant_tables (restaurant_id, table_number, capacity) VALUES (?, ?, ?)',
+                   ((r, 'T%d' % t, rng.choice([2, 2, 4, 4, 4, 6, 8]))
+                    for r in range(1, n_restaurants + 1) for t in range(1, tables_per_restaurant + 1)), 'tables')
+
+    insert_batches(conn, '''INSERT INTO menu_items (restaurant_id, item_name, description, price, category, is_veg)
+                            VALUES (?, ?, ?, ?, ?, ?)''',
+                   ((r, '%s %d' % (rng.choice(DISHES), m), 'House special', rng.randint(30, 400),
+                     rng.choice(CATEGORIES), int(rng.random() < 0.6))
+                    for r in range(1, n_restaurants + 1) for m in range(1, menu_per_restaurant + 1)), 'menu items')
+
+    # Bookings: a year of history plus two months ahead, at most one per table per slot
+    first_day = today - timedelta(days=365)
+    days = [(first_day + timedelta(days=offset)).isoformat() for offset in range(425)]
+
+    def booking_rows():
+        table_id = 0
+        for restaurant_id in range(1, n_restaurants + 1):
+            for _ in range(tables_per_restaurant):
+                table_id += 1
+                for day_index in rng.sample(range(len(days)), bookings_per_table):
+                    booking_time, start = rng.choice(SLOTS)
+                    # Booked up to a month ahead; never left to CURRENT_TIMESTAMP so runs stay identical
+                    created = days[max(0, day_index - rng.randint(0, 30))] + ' %02d:%02d:00' % (
+                        rng.randint(8, 22), rng.randint(0, 59))
+                    yield (rng.randint(1, n_users), restaurant_id, table_id, days[day_index], booking_time,
+                           rng.randint(1, 6), rng.choice(STATUSES), 90, start, start + 90, created)
+
+    insert_batches(conn, '''INSERT INTO bookings (user_id, restaurant_id, table_id, booking_date, booking_time,
+                            party_size, status, duration_minutes, start_minute, end_minute, created_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', booking_rows(), 'bookings')
+
+    def rating_rows():
+        for _ in range(n_ratings):
+            scores = [rng.randint(1, 5) for _ in range(3)]
+            created = days[rng.randrange(365)] + ' %02d:%02d:00' % (rng.randint(11, 22), rng.randint(0, 59))
+            yield (rng.randint(1, n_users), rng.randint(1, n_restaurants), scores[0], scores[1], scores[2],
+                   sum(scores) / 3, 'Visited for %s' % rng.choice(DISHES), created)
+
+    insert_batches(conn, '''INSERT INTO ratings (user_id, restaurant_id, customer_service, food_quality, respect,
+                            overall_rating, review_text, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                   rating_rows(), 'ratings')
+    ratings.rebuild_rating_stats(conn)
+
+    conn.commit()
+    search.refresh(conn)
+    conn.execute('ANALYZE')
+    counts = {table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+              for table in ['restaurants', 'restaurant_tables', 'menu_items', 'bookings', 'ratings', 'users']}
+    conn.close()
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a large synthetic database')
+    parser.add_argument('--output', default='large_restaurant_booking.db')
+    parser.add_argument('--scale', type=float, default=1.0)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--today', type=date.fromisoformat, default=None,
+                        help='anchor date for booking history (default: today)')
+    args = parser.parse_args()
+
+    print("🍽️ Restaurant Booking System - Dataset Generator")
+    print("=" * 50)
+    started = time.perf_counter()
+    generate(args.output, args.scale, args.seed, args.today)
+    print(f"🎉 Wrote {args.output} in {time.perf_counter() - started:.1f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Idempotency keys for booking and rating submissions.
+
+Forms carry a key generated when the page was rendered (or clients send an
+``Idempotency-Key`` header), so a double tap or a retried post repeats the
+key.  The first submission to do its write stores the response it got, in
+the same transaction as the write.  Any repeat within ``TTL_SECONDS`` is
+answered with that response and writes nothing.
+
+lookup() takes the write lock before checking for the key.  Concurrent
+duplicates therefore run one after another: the first writes and stores
+its response, and the rest find it.  A submission that wrote nothing (the
+table was taken, or the lock timed out) stores no key, so retrying it tries
+again.
+
+Keys are scoped to the user and the endpoint.  Expired rows are ignored and
+are deleted by purge(), which the lifecycle scheduler runs on every tick.
+"""
+
+import json
+import time
+
+# How long a repeat is answered from the stored response
+TTL_SECONDS = 24 * 60 * 60
+
+# Longer keys are rejected, not truncated, so two keys never collide
+KEY_MAX_LENGTH = 128
+
+
+def lookup(conn, user_id, endpoint, key, now=None):
+    """Take the write lock; return the stored response for ``key`` or ``None`` for a new submission.
+
+    The transaction stays open either way.  For a new submission the caller
+    does its write and remember(), then commits.
+    """
+    if not conn.in_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    row = conn.execute('''
+        SELECT response FROM idempotency_keys
+        WHERE user_id = ? AND endpoint = ? AND idem_key = ? AND expires_at > ?
+    ''', (user_id, endpoint, key, now or time.time())).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def remember(conn, user_id, endpoint, key, response, ttl=TTL_SECONDS, now=None):
+    """Store ``response`` for ``key``, replacing an expired entry; the caller commits"""
+    conn.execute('''
+        INSERT OR REPLACE INTO idempotency_keys (user_id, endpoint, idem_key, response, expires_at)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (user_id, endpoint, key, json.dumps(response), (now or time.time()) + ttl))
+
+
+def purge(conn, now=None):
+    """Delete expired keys; return how many.  Commits."""
+    deleted = conn.execute('DELETE FROM idempotency_keys WHERE expires_at <= ?', (now or time.time(),)).rowcount
+    conn.commit()
+    return deleted
@@ -1,8 +1,12 @@
 import sqlite3
 
+import migrations
+import search
+
 def populate_sample_data():
     """Populate database with comprehensive sample data"""
     conn = sqlite3.connect('restaurant_booking.db')
+    migrations.migrate(conn)
     
     # Sample restaurants with tables and menu items
     restaurants_with_data = [
@@ -112,6 +116,7 @@ def populate_sample_data():
                                (restaurant_id, menu_item[0], menu_item[1], menu_item[2], menu_item[3], menu_item[4]))
     
     conn.commit()
+    search.refresh(conn)
     conn.close()
 
 if __name__ == '__main__':
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Booking lifecycle
+
+Bookings move through timed states:
+
+    confirmed -> seated      at the start of the slot, or earlier when staff seat the party
+    confirmed -> no_show     NO_SHOW_MINUTES after the start, if staff check guests in
+                             (with no_show_minutes=None parties are seated automatically instead)
+    seated    -> completed   when the slot ends, or earlier when staff clear the table
+
+Leaving 'confirmed'/'seated' releases the booking's tables: availability
+checks stop counting it, and the waitlist triggers queue the slot for
+promotion. A combined booking moves as one, its child rows with it.
+
+tick() finds due parties through two partial indexes over live bookings
+only (migration ``booking_lifecycle``), so its cost follows the number of
+parties due, not the length of the booking history. It applies the changes
+in batches of ``batch`` parties, each in its own short write transaction.
+
+LifecycleScheduler runs tick() on a daemon thread inside the app, together
+with offers.refresh_flags() so special offers switch on and off with their
+validity dates, idempotency.purge() to drop expired submission keys and
+search.refresh() to index catalog edits made outside the app. To run it
+as a separate worker instead, set LIFECYCLE_SCHEDULER = False and start:
+
+    python lifecycle.py [--database restaurant_booking.db] [--shard-dir DIR] [--interval 30]
+                        [--no-show-minutes 15] [--once]
+"""
+
+import argparse
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+import db
+import idempotency
+import offers
+import search
+import shards
+
+BATCH_SIZE = 500
+
+TICK_SECONDS = 30.0
+
+# Status a party must be in for staff to move it to each status
+TRANSITIONS = {'seated': 'confirmed', 'no_show': 'confirmed', 'completed': 'seated'}
+
+
+def _moment(when):
+    return when.date().isoformat(), when.hour * 60 + when.minute
+
+
+def _advance(conn, source, target, column, until, batch):
+    """Move parties in ``source`` whose (booking_date, column) is at or before ``until`` to ``target``"""
+    moved = 0
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # The status literal lets SQLite use the partial index for it
+            ids = [row[0] for row in conn.execute(f'''
+                SELECT id FROM bookings
+                WHERE status = '{source}' AND parent_id IS NULL AND (booking_date, {column}) <= (?, ?)
+                LIMIT ?
+            ''', (*until, batch))]
+            if ids:
+                marks = ', '.join('?' * len(ids))
+                conn.execute(f'''
+                    UPDATE bookings SET status = ?
+                    WHERE (id IN ({marks}) OR parent_id IN ({marks})) AND status = ?
+                ''', (target, *ids, *ids, source))
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        moved += len(ids)
+        if len(ids) < batch:
+            return moved
+
+
+def tick(conn, now=None, no_show_minutes=None, batch=BATCH_SIZE):
+    """Apply every transition that is due at ``now``; return the number of parties per new status"""
+    now = now or datetime.now()
+    moved = {}
+    if no_show_minutes is None:
+        moved['seated'] = _advance(conn, 'confirmed', 'seated', 'start_minute', _moment(now), batch)
+    else:
+        moved['no_show'] = _advance(conn, 'confirmed', 'no_show', 'start_minute',
+                                    _moment(now - timedelta(minutes=no_show_minutes)), batch)
+    moved['completed'] = _advance(conn, 'seated', 'completed', 'end_minute', _moment(now), batch)
+    return moved
+
+
+def set_status(conn, booking_id, restaurant_id, status):
+    """Staff action: move one of the restaurant's parties to ``status``; return whether it moved.
+
+    The caller commits.
+    """
+    if status not in TRANSITIONS:
+        raise ValueError('Unknown booking status: %r' % status)
+    cursor = conn.execute('''
+        UPDATE bookings SET status = ?
+        WHERE (id = ? OR parent_id = ?) AND restaurant_id = ? AND status = ?
+    ''', (status, booking_id, booking_id, restaurant_id, TRANSITIONS[status]))
+    return cursor.rowcount > 0
+
+
+class LifecycleScheduler:
+    """Daemon thread that runs tick() and offers.refresh_flags() every ``interval`` seconds.
+
+    ``connect()`` returns a connection, or a list of them (one per shard).
+    """
+
+    def __init__(self, connect, interval=TICK_SECONDS, no_show_minutes=None):
+        self.connect = connect
+        self.interval = interval
+        self.no_show_minutes = no_show_minutes
+        self.runs = 0
+        self.moved = {}
+        self.last_seconds = None
+        self.last_error = None
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='booking-lifecycle', daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_once(self, now=None):
+        started = time.perf_counter()
+        connections = self.connect()
+        if not isinstance(connections, list):
+            connections = [connections]
+        moved = {}
+        try:
+            for conn in connections:
+                counts = tick(conn, now, self.no_show_minutes)
+                counts['offers_activated'], counts['offers_expired'] = offers.refresh_flags(
+                    conn, (now or datetime.now()).date().isoformat())
+                counts['keys_expired'] = idempotency.purge(conn, now and now.timestamp())
+                counts['search_refreshed'] = search.refresh(conn)
+                for status, count in counts.items():
+                    moved[status] = moved.get(status, 0) + count
+        finally:
+            for conn in connections:
+                conn.close()
+        self.runs += 1
+        for status, count in moved.items():
+            self.moved[status] = self.moved.get(status, 0) + count
+        self.last_seconds = time.perf_counter() - started
+        return moved
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except sqlite3.Error as error:
+                # Busy or locked: whatever is due stays due, retry on the next round
+                self.last_error = str(error)
+            self._stop.wait(self.interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the booking lifecycle scheduler as a separate worker')
+    parser.add_argument('--database', default='restaurant_booking.db')
+    parser.add_argument('--shard-dir', help='run over every shard in this directory instead')
+    parser.add_argument('--interval', type=float, default=TICK_SECONDS)
+    parser.add_argument('--no-show-minutes', type=int, default=None,
+                        help='mark parties not seated this long after their start as no-shows')
+    parser.add_argument('--once', action='store_true', help='run one tick and exit')
+    args = parser.parse_args()
+
+    config = {'DATABASE': args.database}
+
+    def connect():
+        if args.shard_dir:
+            return [db.connect(config, shards.shard_path(args.shard_dir, location_id))
+                    for location_id in shards.shard_locations(args.shard_dir)]
+        return db.connect(config)
+
+    scheduler = LifecycleScheduler(connect, args.interval, args.no_show_minutes)
+    print("⏰ Restaurant Booking System - Booking Lifecycle")
+    print("=" * 50)
+    while True:
+        moved = scheduler.run_once()
+        print(f"{datetime.now():%H:%M:%S} " + ', '.join(f"{count} {status}" for status, count in moved.items())
+              + f" ({scheduler.last_seconds * 1000:.1f} ms)", flush=True)
+        if args.once:
+            break
+        time.sleep(args.interval)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,131 @@
+"""Request and SQL metrics in the Prometheus text format.
+
+The app records every request against its Flask endpoint:
+
+    http_requests_total{endpoint, method, status}    counter
+    http_request_duration_seconds{endpoint}          histogram
+    http_requests_in_flight{endpoint}                gauge
+    sql_queries_total{endpoint}                      counter
+    sql_query_seconds_total{endpoint}                counter
+    sql_rows_total{endpoint}                         counter
+
+SQL figures come from the per-thread counters that instrumented
+connections keep (``db.sql_stats``).  Recording is a few dict and list
+updates under one uncontended lock, so it can stay on in production.
+Requests that match no route share the ``unmatched`` endpoint, which keeps
+the number of series bounded.
+"""
+
+import bisect
+import threading
+import time
+
+# Upper bounds in seconds; +Inf is implied
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class EndpointStats:
+    __slots__ = ('buckets', 'duration_sum', 'count', 'in_flight', 'statuses', 'sql_queries', 'sql_seconds',
+                 'sql_rows')
+
+    def __init__(self, bucket_count):
+        self.buckets = [0] * (bucket_count + 1)
+        self.duration_sum = 0.0
+        self.count = self.in_flight = self.sql_queries = self.sql_rows = 0
+        self.sql_seconds = 0.0
+        self.statuses = {}  # (method, status) -> count
+
+
+class Registry:
+    """Per-endpoint request and SQL metrics"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.bucket_bounds = tuple(buckets)
+        self._endpoints = {}
+        self._lock = threading.Lock()
+
+    def _stats(self, endpoint):
+        stats = self._endpoints.get(endpoint)
+        if stats is None:
+            stats = self._endpoints.setdefault(endpoint, EndpointStats(len(self.bucket_bounds)))
+        return stats
+
+    def request_started(self, endpoint):
+        """Count the request in flight; return its start time for request_finished()"""
+        with self._lock:
+            self._stats(endpoint or 'unmatched').in_flight += 1
+        return time.perf_counter()
+
+    def request_finished(self, endpoint, method, status, started, sql=None):
+        """Record a finished request and the SQL work it did (an object with queries, seconds and rows)"""
+        elapsed = time.perf_counter() - started
+        bucket = bisect.bisect_left(self.bucket_bounds, elapsed)
+        with self._lock:
+            stats = self._stats(endpoint or 'unmatched')
+            stats.in_flight -= 1
+            stats.count += 1
+            stats.duration_sum += elapsed
+            stats.buckets[bucket] += 1
+            key = (method, status)
+            stats.statuses[key] = stats.statuses.get(key, 0) + 1
+            if sql is not None:
+                stats.sql_queries += sql.queries
+                stats.sql_seconds += sql.seconds
+                stats.sql_rows += sql.rows
+
+    def snapshot(self):
+        """Copy of the per-endpoint figures as plain dicts, for tests and admin pages"""
+        with self._lock:
+            return {endpoint: {'count': stats.count, 'duration_sum': stats.duration_sum,
+                               'buckets': list(stats.buckets), 'in_flight': stats.in_flight,
+                               'statuses': dict(stats.statuses), 'sql_queries': stats.sql_queries,
+                               'sql_seconds': stats.sql_seconds, 'sql_rows': stats.sql_rows}
+                    for endpoint, stats in self._endpoints.items()}
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        endpoints = sorted(self.snapshot().items())
+        bounds = [_number(bound) for bound in self.bucket_bounds] + ['+Inf']
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append('# HELP %s %s' % (name, help_text))
+            lines.append('# TYPE %s %s' % (name, kind))
+
+        family('http_requests_total', 'counter', 'Requests by endpoint, method and status code.')
+        for endpoint, stats in endpoints:
+            for (method, status), count in sorted(stats['statuses'].items()):
+                lines.append('http_requests_total{endpoint="%s",method="%s",status="%s"} %d'
+                             % (_label(endpoint), method, status, count))
+
+        family('http_request_duration_seconds', 'histogram', 'Request latency by endpoint.')
+        for endpoint, stats in endpoints:
+            label = _label(endpoint)
+            cumulative = 0
+            for bound, count in zip(bounds, stats['buckets']):
+                cumulative += count
+                lines.append('http_request_duration_seconds_bucket{endpoint="%s",le="%s"} %d'
+                             % (label, bound, cumulative))
+            lines.append('http_request_duration_seconds_sum{endpoint="%s"} %s' % (label, _number(stats['duration_sum'])))
+            lines.append('http_request_duration_seconds_count{endpoint="%s"} %d' % (label, stats['count']))
+
+        for name, kind, key, help_text in [
+            ('http_requests_in_flight', 'gauge', 'in_flight', 'Requests being handled now.'),
+            ('sql_queries_total', 'counter', 'sql_queries', 'SQL statements executed by requests.'),
+            ('sql_query_seconds_total', 'counter', 'sql_seconds', 'Time requests spent executing and fetching SQL.'),
+            ('sql_rows_total', 'counter', 'sql_rows', 'Rows fetched from SQL by requests.'),
+        ]:
+            family(name, kind, help_text)
+            for endpoint, stats in endpoints:
+                lines.append('%s{endpoint="%s"} %s' % (name, _label(endpoint), _number(stats[key])))
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
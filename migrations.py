@@ -0,0 +1,605 @@
+"""Versioned schema migrations.
+
+The schema version lives in ``PRAGMA user_version``.  Each migration below
+brings the database from version N-1 to N and runs in its own transaction
+together with the version bump, so a database is never left half-migrated.
+Databases that are already current are left alone without running any DDL.
+
+To change the schema, append a new function to MIGRATIONS; never edit one
+that has already shipped.
+"""
+
+
+def initial_schema(conn):
+    """The original eight tables (no-op for databases created before versioning)"""
+    # Users table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password TEXT NOT NULL,
+            email TEXT NOT NULL,
+            phone TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Locations table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS locations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            city_name TEXT UNIQUE NOT NULL
+        )
+    ''')
+
+    # Restaurants table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS restaurants (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            location_id INTEGER,
+            cuisine_type TEXT NOT NULL,
+            is_veg_only INTEGER DEFAULT 0,
+            description TEXT,
+            image_url TEXT,
+            FOREIGN KEY (location_id) REFERENCES locations (id)
+        )
+    ''')
+
+    # Tables in restaurants
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS restaurant_tables (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            restaurant_id INTEGER,
+            table_number TEXT NOT NULL,
+            capacity INTEGER NOT NULL,
+            is_available INTEGER DEFAULT 1,
+            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
+        )
+    ''')
+
+    # Bookings table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bookings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            restaurant_id INTEGER,
+            table_id INTEGER,
+            booking_date DATE NOT NULL,
+            booking_time TIME NOT NULL,
+            party_size INTEGER NOT NULL,
+            status TEXT DEFAULT 'confirmed',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id),
+            FOREIGN KEY (table_id) REFERENCES restaurant_tables (id)
+        )
+    ''')
+
+    # Menu items table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS menu_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            restaurant_id INTEGER,
+            item_name TEXT NOT NULL,
+            description TEXT,
+            price REAL NOT NULL,
+            category TEXT NOT NULL,
+            is_veg INTEGER DEFAULT 1,
+            image_url TEXT,
+            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
+        )
+    ''')
+
+    # Ratings table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ratings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            restaurant_id INTEGER,
+            customer_service INTEGER CHECK(customer_service >= 1 AND customer_service <= 5),
+            food_quality INTEGER CHECK(food_quality >= 1 AND food_quality <= 5),
+            respect INTEGER CHECK(respect >= 1 AND respect <= 5),
+            overall_rating REAL,
+            review_text TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
+        )
+    ''')
+
+    # Special offers table
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS special_offers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            restaurant_id INTEGER,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL,
+            discount_percentage REAL,
+            valid_from DATE,
+            valid_to DATE,
+            is_active INTEGER DEFAULT 1,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
+        )
+    ''')
+
+
+def booking_slots(conn):
+    """Time-slotted bookings: duration and start/end minutes per booking"""
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(bookings)')]
+    if 'start_minute' not in columns:
+        conn.execute('ALTER TABLE bookings ADD COLUMN duration_minutes INTEGER NOT NULL DEFAULT 90')
+        conn.execute('ALTER TABLE bookings ADD COLUMN start_minute INTEGER')
+        conn.execute('ALTER TABLE bookings ADD COLUMN end_minute INTEGER')
+
+        # Backfill slot bounds from the HH:MM booking_time of older rows
+        conn.execute('''
+            UPDATE bookings
+            SET start_minute = CAST(substr(booking_time, 1, 2) AS INTEGER) * 60
+                             + CAST(substr(booking_time, 4, 2) AS INTEGER)
+        ''')
+        conn.execute('UPDATE bookings SET end_minute = start_minute + duration_minutes')
+
+        # Earlier versions flipped is_available on the first booking; it now
+        # only marks tables taken out of service, so release the locked ones
+        conn.execute('''
+            UPDATE restaurant_tables SET is_available = 1
+            WHERE is_available = 0 AND id IN (SELECT table_id FROM bookings)
+        ''')
+
+    # Overlap lookups seek on (table, date) and range-scan the slot bounds
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_bookings_table_slot
+                    ON bookings (table_id, booking_date, start_minute, end_minute)''')
+
+
+def query_indexes(conn):
+    """Secondary indexes for the per-restaurant lookups the routes make"""
+    # Admin dashboard: bookings of one restaurant newest first
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_bookings_restaurant_date
+                    ON bookings (restaurant_id, booking_date, booking_time)''')
+    # Listing averages: covering index, AVG never touches the ratings rows
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_ratings_restaurant
+                    ON ratings (restaurant_id, overall_rating)''')
+    # Menu page: one restaurant's items already in category order
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_menu_items_restaurant_category
+                    ON menu_items (restaurant_id, category)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_restaurant_tables_restaurant
+                    ON restaurant_tables (restaurant_id, is_available)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_special_offers_restaurant
+                    ON special_offers (restaurant_id, is_active)''')
+    # Admin login looks restaurants up by name; listings filter by city
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_restaurants_name ON restaurants (name)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_restaurants_location ON restaurants (location_id, name)')
+
+
+def rating_stats(conn):
+    """Per-restaurant rating aggregates, backfilled from existing ratings"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS restaurant_rating_stats (
+            restaurant_id INTEGER PRIMARY KEY,
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            overall_sum REAL NOT NULL DEFAULT 0,
+            customer_service_sum INTEGER NOT NULL DEFAULT 0,
+            food_quality_sum INTEGER NOT NULL DEFAULT 0,
+            respect_sum INTEGER NOT NULL DEFAULT 0,
+            avg_overall REAL,
+            avg_customer_service REAL,
+            avg_food_quality REAL,
+            avg_respect REAL,
+            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
+        )
+    ''')
+    conn.execute('''
+        INSERT OR REPLACE INTO restaurant_rating_stats
+            (restaurant_id, rating_count, overall_sum, customer_service_sum, food_quality_sum, respect_sum,
+             avg_overall, avg_customer_service, avg_food_quality, avg_respect)
+        SELECT restaurant_id, COUNT(*), TOTAL(overall_rating), TOTAL(customer_service), TOTAL(food_quality),
+               TOTAL(respect), AVG(overall_rating), AVG(customer_service), AVG(food_quality), AVG(respect)
+        FROM ratings
+        WHERE restaurant_id IS NOT NULL
+        GROUP BY restaurant_id
+    ''')
+
+
+def booking_status_index(conn):
+    """Admin dashboard filtered by booking status, still in keyset order"""
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_bookings_restaurant_status_date
+                    ON bookings (restaurant_id, status, booking_date, booking_time)''')
+
+
+def ratings_created_index(conn):
+    """Rating exports and trends scan one restaurant's ratings by date"""
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_ratings_restaurant_created
+                    ON ratings (restaurant_id, created_at)''')
+
+
+def catalog_natural_keys(conn):
+    """Catalog imports match tables and menu items on their natural keys"""
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_restaurant_tables_number
+                    ON restaurant_tables (restaurant_id, table_number)''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_menu_items_name
+                    ON menu_items (restaurant_id, item_name)''')
+
+
+def data_versions(conn):
+    """Per-restaurant version counters bumped by triggers on every write.
+
+    ``catalog_version`` covers the restaurant row, its tables, menu, offers
+    and rating aggregates; ``booking_version`` covers its bookings.  API
+    ETags and cache keys are derived from them.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS restaurant_versions (
+            restaurant_id INTEGER PRIMARY KEY,
+            catalog_version INTEGER NOT NULL DEFAULT 0,
+            booking_version INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    conn.execute('''INSERT OR IGNORE INTO restaurant_versions (restaurant_id, catalog_version, booking_version)
+                    SELECT id, 1, 1 FROM restaurants''')
+
+    for table, key, column in [
+        ('restaurants', 'id', 'catalog_version'),
+        ('restaurant_tables', 'restaurant_id', 'catalog_version'),
+        ('menu_items', 'restaurant_id', 'catalog_version'),
+        ('special_offers', 'restaurant_id', 'catalog_version'),
+        ('restaurant_rating_stats', 'restaurant_id', 'catalog_version'),
+        ('bookings', 'restaurant_id', 'booking_version'),
+    ]:
+        for event, row in [('INSERT', 'NEW'), ('UPDATE', 'NEW'), ('DELETE', 'OLD')]:
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_version
+                AFTER {event} ON {table}
+                WHEN {row}.{key} IS NOT NULL
+                BEGIN
+                    INSERT INTO restaurant_versions (restaurant_id, {column}) VALUES ({row}.{key}, 1)
+                    ON CONFLICT (restaurant_id) DO UPDATE SET {column} = {column} + 1;
+                END
+            ''')
+        # A row moved to another restaurant changes the old one too
+        if key == 'restaurant_id':
+            conn.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_move_version
+                AFTER UPDATE OF restaurant_id ON {table}
+                WHEN OLD.restaurant_id IS NOT NEW.restaurant_id AND OLD.restaurant_id IS NOT NULL
+                BEGIN
+                    UPDATE restaurant_versions SET {column} = {column} + 1 WHERE restaurant_id = OLD.restaurant_id;
+                END
+            ''')
+
+
+def restaurant_search(conn):
+    """FTS5 index with one document per restaurant: name, description, cuisine and menu.
+
+    A menu is folded into its restaurant's document so a common dish matches
+    each restaurant once.  Rebuilding that document on every menu row would
+    make bulk imports quadratic, so triggers only queue the restaurant in
+    ``search_pending`` and search.refresh() rebuilds queued documents in one
+    statement before the next search.
+    """
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS restaurant_search
+        USING fts5(name, description, cuisine_type, menu, tokenize = 'unicode61 remove_diacritics 2')
+    ''')
+    conn.execute('CREATE TABLE IF NOT EXISTS search_pending (restaurant_id INTEGER PRIMARY KEY)')
+
+    for name, event, row, key in [
+        ('restaurants_insert', 'INSERT ON restaurants', 'NEW', 'id'),
+        ('restaurants_update', 'UPDATE OF name, description, cuisine_type ON restaurants', 'NEW', 'id'),
+        ('restaurants_delete', 'DELETE ON restaurants', 'OLD', 'id'),
+        ('menu_items_insert', 'INSERT ON menu_items', 'NEW', 'restaurant_id'),
+        ('menu_items_update', 'UPDATE OF item_name, description, restaurant_id ON menu_items', 'NEW', 'restaurant_id'),
+        ('menu_items_update_old', 'UPDATE OF restaurant_id ON menu_items', 'OLD', 'restaurant_id'),
+        ('menu_items_delete', 'DELETE ON menu_items', 'OLD', 'restaurant_id'),
+    ]:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{name}_search AFTER {event}
+            WHEN {row}.{key} IS NOT NULL
+            BEGIN
+                INSERT OR IGNORE INTO search_pending (restaurant_id) VALUES ({row}.{key});
+            END
+        ''')
+
+    conn.execute('''
+        INSERT INTO restaurant_search (rowid, name, description, cuisine_type, menu)
+        SELECT r.id, r.name, r.description, r.cuisine_type,
+               (SELECT group_concat(m.item_name || ' ' || COALESCE(m.description, ''), ' ')
+                FROM menu_items m WHERE m.restaurant_id = r.id)
+        FROM restaurants r
+    ''')
+
+
+def table_combining(conn):
+    """Tables that can be pushed together, and bookings that span several tables"""
+    conn.execute('ALTER TABLE restaurant_tables ADD COLUMN combine_group TEXT')
+    conn.execute('ALTER TABLE bookings ADD COLUMN parent_id INTEGER REFERENCES bookings (id)')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_bookings_parent
+                    ON bookings (parent_id) WHERE parent_id IS NOT NULL''')
+
+
+def waitlist(conn):
+    """Parties waiting for a slot, and the queue of slots that may have freed up.
+
+    Triggers queue a (restaurant, date) in ``waitlist_pending`` whenever a
+    booking stops holding its table, a table comes (back) into service or a
+    party joins the list; waitlist.process_pending() drains the queue.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS waitlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            restaurant_id INTEGER NOT NULL,
+            booking_date DATE NOT NULL,
+            booking_time TEXT NOT NULL,
+            start_minute INTEGER NOT NULL,
+            duration_minutes INTEGER NOT NULL DEFAULT 90,
+            party_size INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'waiting',
+            booking_id INTEGER,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            promoted_at TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id),
+            FOREIGN KEY (booking_id) REFERENCES bookings (id)
+        )
+    ''')
+    # Promotion walks one restaurant's waiting parties for a date in id (FIFO) order
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_waitlist_slot
+                    ON waitlist (restaurant_id, booking_date, status)''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_waitlist_user ON waitlist (user_id, booking_date)')
+    conn.execute("""CREATE INDEX IF NOT EXISTS idx_waitlist_expiry
+                    ON waitlist (booking_date) WHERE status = 'waiting'""")
+    # A user waits at most once for the same slot
+    conn.execute("""CREATE UNIQUE INDEX IF NOT EXISTS idx_waitlist_once
+                    ON waitlist (user_id, restaurant_id, booking_date, start_minute) WHERE status = 'waiting'""")
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS waitlist_pending (
+            restaurant_id INTEGER NOT NULL,
+            booking_date DATE NOT NULL,
+            PRIMARY KEY (restaurant_id, booking_date)
+        ) WITHOUT ROWID
+    ''')
+    # Bookings users can list their own
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bookings_user_date ON bookings (user_id, booking_date)')
+
+    for name, event, when, row in [
+        ('bookings_release', 'UPDATE OF status ON bookings',
+         "OLD.status IN ('confirmed', 'seated') AND NEW.status NOT IN ('confirmed', 'seated')", 'OLD'),
+        ('bookings_delete', 'DELETE ON bookings', "OLD.status IN ('confirmed', 'seated')", 'OLD'),
+        ('waitlist_join', 'INSERT ON waitlist', "NEW.status = 'waiting'", 'NEW'),
+    ]:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{name}_waitlist
+            AFTER {event}
+            WHEN {when}
+            BEGIN
+                INSERT OR IGNORE INTO waitlist_pending (restaurant_id, booking_date)
+                VALUES ({row}.restaurant_id, {row}.booking_date);
+            END
+        ''')
+    # A table added or put back in service can seat anyone waiting at that restaurant
+    for name, event, when in [
+        ('restaurant_tables_insert', 'INSERT ON restaurant_tables', 'NEW.is_available = 1'),
+        ('restaurant_tables_release', 'UPDATE OF is_available, capacity, combine_group ON restaurant_tables',
+         'NEW.is_available = 1'),
+    ]:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_{name}_waitlist
+            AFTER {event}
+            WHEN {when}
+            BEGIN
+                INSERT OR IGNORE INTO waitlist_pending (restaurant_id, booking_date)
+                SELECT DISTINCT restaurant_id, booking_date FROM waitlist
+                WHERE restaurant_id = NEW.restaurant_id AND status = 'waiting';
+            END
+        ''')
+
+
+def booking_lifecycle(conn):
+    """Indexes the lifecycle scheduler walks to find parties due to be seated, marked or released.
+
+    Both are partial over live parties, so they stay as small as the bookings
+    still in play however long the history grows.
+    """
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_bookings_due_start ON bookings (booking_date, start_minute)
+                    WHERE status = 'confirmed' AND parent_id IS NULL''')
+    conn.execute('''CREATE INDEX IF NOT EXISTS idx_bookings_due_end ON bookings (booking_date, end_minute)
+                    WHERE status = 'seated' AND parent_id IS NULL''')
+
+
+def offer_windows(conn):
+    """Index offers by validity window, open ends filled in as in offers.STARTS / offers.ENDS.
+
+    The window index answers "valid on this day" per restaurant and replaces
+    the (restaurant_id, is_active) one.  Two partial indexes serve the daily
+    flag refresh: inactive offers by end (the upcoming ones) and active
+    offers, which are few.
+    """
+    starts, ends = "IFNULL(valid_from, '0000-01-01')", "IFNULL(valid_to, '9999-12-31')"
+    conn.execute('DROP INDEX IF EXISTS idx_special_offers_restaurant')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_special_offers_window ON special_offers (restaurant_id, {starts}, {ends})')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_special_offers_pending ON special_offers ({ends}) WHERE is_active = 0')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_special_offers_live ON special_offers ({ends}) WHERE is_active = 1')
+
+
+def analytics_rollups(conn):
+    """Rollups behind the analytics page, kept current by triggers and backfilled here.
+
+    booking_hourly holds, per restaurant, date and hour, the parties starting
+    in that hour, their covers, and the minutes of that hour each booked table
+    is held (hours past 23 belong to slots running over midnight). Cancelled
+    and no-show bookings are left out. rating_daily holds rating counts and
+    sums per restaurant and day.
+    """
+    conn.execute('CREATE TABLE IF NOT EXISTS rollup_hours (hour INTEGER PRIMARY KEY)')
+    conn.executemany('INSERT OR IGNORE INTO rollup_hours (hour) VALUES (?)', [(hour,) for hour in range(48)])
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS booking_hourly (
+            restaurant_id INTEGER NOT NULL,
+            booking_date DATE NOT NULL,
+            hour INTEGER NOT NULL,
+            parties INTEGER NOT NULL DEFAULT 0,
+            covers INTEGER NOT NULL DEFAULT 0,
+            table_minutes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (restaurant_id, booking_date, hour)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rating_daily (
+            restaurant_id INTEGER NOT NULL,
+            rating_date DATE NOT NULL,
+            rating_count INTEGER NOT NULL DEFAULT 0,
+            overall_sum REAL NOT NULL DEFAULT 0,
+            customer_service_sum INTEGER NOT NULL DEFAULT 0,
+            food_quality_sum INTEGER NOT NULL DEFAULT 0,
+            respect_sum INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (restaurant_id, rating_date)
+        ) WITHOUT ROWID
+    ''')
+
+    # A booking row spread over the hours its slot touches, joined as h; the party counts in its first hour
+    def measures(row):
+        return [f'{row}.parent_id IS NULL AND h.hour = {row}.start_minute / 60',
+                f'''CASE WHEN {row}.parent_id IS NULL AND h.hour = {row}.start_minute / 60
+                         THEN COALESCE({row}.party_size, 0) ELSE 0 END''',
+                f'MIN({row}.end_minute, h.hour * 60 + 60) - MAX({row}.start_minute, h.hour * 60)']
+
+    def hours(row):
+        return f'h.hour BETWEEN {row}.start_minute / 60 AND ({row}.end_minute - 1) / 60'
+
+    upsert = '''
+        ON CONFLICT (restaurant_id, booking_date, hour) DO UPDATE SET
+            parties = parties + excluded.parties, covers = covers + excluded.covers,
+            table_minutes = table_minutes + excluded.table_minutes
+    '''
+    counted = "('confirmed', 'seated', 'completed')"
+    slot = ['restaurant_id', 'booking_date', 'start_minute', 'end_minute', 'party_size', 'parent_id']
+    # confirmed -> seated -> completed leaves every rollup as it was, so those updates skip the triggers
+    moved = f"NOT (OLD.status IN {counted} AND NEW.status IN {counted} AND %s)" % ' AND '.join(
+        f'OLD.{column} IS NEW.{column}' for column in slot)
+    update = f"UPDATE OF status, {', '.join(slot)} ON bookings"
+    for name, event, row, sign, when in [
+        ('insert', 'INSERT ON bookings', 'NEW', 1, '1'),
+        ('delete', 'DELETE ON bookings', 'OLD', -1, '1'),
+        ('update_old', update, 'OLD', -1, moved),
+        ('update_new', update, 'NEW', 1, moved),
+    ]:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_bookings_{name}_rollup
+            AFTER {event}
+            WHEN {row}.status IN {counted} AND {row}.restaurant_id IS NOT NULL AND {when}
+            BEGIN
+                INSERT INTO booking_hourly (restaurant_id, booking_date, hour, parties, covers, table_minutes)
+                SELECT {row}.restaurant_id, {row}.booking_date, h.hour,
+                       {', '.join('%d * (%s)' % (sign, measure) for measure in measures(row))}
+                FROM rollup_hours h
+                WHERE {hours(row)}
+                {upsert};
+            END
+        ''')
+
+    for name, row, sign in [('insert', 'NEW', 1), ('delete', 'OLD', -1)]:
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_ratings_{name}_rollup
+            AFTER {name.upper()} ON ratings
+            WHEN {row}.restaurant_id IS NOT NULL AND {row}.created_at IS NOT NULL
+            BEGIN
+                INSERT INTO rating_daily (restaurant_id, rating_date, rating_count, overall_sum,
+                                          customer_service_sum, food_quality_sum, respect_sum)
+                VALUES ({row}.restaurant_id, date({row}.created_at), {sign},
+                        {sign} * COALESCE({row}.overall_rating, 0), {sign} * COALESCE({row}.customer_service, 0),
+                        {sign} * COALESCE({row}.food_quality, 0), {sign} * COALESCE({row}.respect, 0))
+                ON CONFLICT (restaurant_id, rating_date) DO UPDATE SET
+                    rating_count = rating_count + excluded.rating_count,
+                    overall_sum = overall_sum + excluded.overall_sum,
+                    customer_service_sum = customer_service_sum + excluded.customer_service_sum,
+                    food_quality_sum = food_quality_sum + excluded.food_quality_sum,
+                    respect_sum = respect_sum + excluded.respect_sum;
+            END
+        ''')
+
+    # Backfill from the rows already there
+    conn.execute(f'''
+        INSERT INTO booking_hourly (restaurant_id, booking_date, hour, parties, covers, table_minutes)
+        SELECT b.restaurant_id, b.booking_date, h.hour, {', '.join('SUM(%s)' % measure for measure in measures('b'))}
+        FROM bookings b JOIN rollup_hours h ON {hours('b')}
+        WHERE b.status IN {counted} AND b.restaurant_id IS NOT NULL
+        GROUP BY b.restaurant_id, b.booking_date, h.hour
+    ''')
+    conn.execute('''
+        INSERT INTO rating_daily (restaurant_id, rating_date, rating_count, overall_sum,
+                                  customer_service_sum, food_quality_sum, respect_sum)
+        SELECT restaurant_id, date(created_at), COUNT(*), TOTAL(overall_rating),
+               TOTAL(customer_service), TOTAL(food_quality), TOTAL(respect)
+        FROM ratings
+        WHERE restaurant_id IS NOT NULL AND created_at IS NOT NULL
+        GROUP BY restaurant_id, date(created_at)
+    ''')
+
+
+def idempotency_keys(conn):
+    """Booking and rating submissions already handled, with the response each got (see idempotency.py).
+
+    One row per user, endpoint and client key until ``expires_at`` (Unix
+    seconds); the expiry index lets the purge find old keys without a scan.
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS idempotency_keys (
+            user_id INTEGER NOT NULL,
+            endpoint TEXT NOT NULL,
+            idem_key TEXT NOT NULL,
+            response TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            PRIMARY KEY (user_id, endpoint, idem_key)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires ON idempotency_keys (expires_at)')
+
+
+MIGRATIONS = [
+    initial_schema,
+    booking_slots,
+    query_indexes,
+    rating_stats,
+    booking_status_index,
+    ratings_created_index,
+    catalog_natural_keys,
+    data_versions,
+    restaurant_search,
+    table_combining,
+    waitlist,
+    booking_lifecycle,
+    offer_windows,
+    analytics_rollups,
+    idempotency_keys,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply every pending migration; return the number applied"""
+    if schema_version(conn) >= SCHEMA_VERSION:
+        return 0
+
+    applied = 0
+    while True:
+        # Take the write lock first so concurrent starters migrate only once
+        conn.execute('BEGIN IMMEDIATE')
+        version = schema_version(conn)
+        if version >= SCHEMA_VERSION:
+            conn.rollback()
+            return applied
+        try:
+            MIGRATIONS[version](conn)
+            conn.execute('PRAGMA user_version = %d' % (version + 1))
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+        applied += 1
@@ -0,0 +1,78 @@
+"""Special offers valid on a given day.
+
+An offer runs from ``valid_from`` to ``valid_to`` inclusive; a missing date
+leaves that end open.  active_offers() and location_offers() resolve the
+offers valid on any day from those dates alone, through the window index
+``(restaurant_id, start, end)`` (migration ``offer_windows``), so an expired
+offer never shows even if its flag is stale.
+
+``is_active`` is kept equal to "valid today" by refresh_flags(), which the
+lifecycle scheduler runs on every tick: it switches on offers whose window
+has opened and switches off those that ended, each in one statement over a
+partial index of the few offers that can change.
+"""
+
+from datetime import date
+
+# Open ends sort before and after every ISO date; the index is built on the same expressions
+STARTS = "IFNULL(valid_from, '0000-01-01')"
+ENDS = "IFNULL(valid_to, '9999-12-31')"
+
+
+def is_valid_on(valid_from, valid_to, day):
+    return (valid_from or '0000-01-01') <= day <= (valid_to or '9999-12-31')
+
+
+def _group(rows):
+    grouped = {}
+    for row in rows:
+        grouped.setdefault(row['restaurant_id'], []).append(dict(row))
+    return grouped
+
+
+def active_offers(conn, restaurant_ids, day):
+    """Offers valid on ``day`` at each of ``restaurant_ids``: ``{restaurant_id: [offer, ...]}``"""
+    restaurant_ids = list(restaurant_ids)
+    if not restaurant_ids:
+        return {}
+    rows = conn.execute(f'''
+        SELECT * FROM special_offers
+        WHERE restaurant_id IN ({', '.join('?' * len(restaurant_ids))}) AND {STARTS} <= ? AND {ENDS} >= ?
+        ORDER BY restaurant_id, discount_percentage DESC, id
+    ''', (*restaurant_ids, day, day)).fetchall()
+    return _group(rows)
+
+
+def location_offers(conn, location_id, day):
+    """active_offers() for every restaurant in a city, in one query"""
+    rows = conn.execute(f'''
+        SELECT * FROM special_offers
+        WHERE restaurant_id IN (SELECT id FROM restaurants WHERE location_id = ?) AND {STARTS} <= ? AND {ENDS} >= ?
+        ORDER BY restaurant_id, discount_percentage DESC, id
+    ''', (location_id, day, day)).fetchall()
+    return _group(rows)
+
+
+def refresh_flags(conn, day=None):
+    """Switch ``is_active`` on for offers valid on ``day`` (default today) and off for the rest.
+
+    Returns ``(activated, expired)``.  Commits.
+    """
+    day = day or date.today().isoformat()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Inactive offers that have not ended yet: upcoming ones, served by idx_special_offers_pending
+        activated = conn.execute(f'''
+            UPDATE special_offers SET is_active = 1
+            WHERE is_active = 0 AND {ENDS} >= :day AND {STARTS} <= :day
+        ''', {'day': day}).rowcount
+        # Active offers are few, so idx_special_offers_live is scanned whole
+        expired = conn.execute(f'''
+            UPDATE special_offers SET is_active = 0
+            WHERE is_active = 1 AND ({ENDS} < :day OR {STARTS} > :day)
+        ''', {'day': day}).rowcount
+    except Exception:
+        conn.rollback()
+        raise
+    conn.commit()
+    return activated, expired
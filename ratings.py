@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Restaurant ratings and their per-restaurant aggregates
+
+restaurant_rating_stats keeps a running count, sums and averages of every
+rating criterion per restaurant. record_rating() updates it in the same
+transaction as the rating insert, so listings read one row per restaurant
+instead of averaging every rating on each page view.
+
+Rebuild the aggregates from the ratings table (e.g. after a bulk import):
+    python ratings.py --rebuild [--database restaurant_booking.db]
+"""
+
+import argparse
+import sqlite3
+
+import migrations
+
+def record_rating(conn, user_id, restaurant_id, customer_service, food_quality, respect, review_text):
+    """Insert a rating and fold it into the restaurant's aggregates; the caller commits"""
+    overall_rating = (customer_service + food_quality + respect) / 3
+    cursor = conn.execute('''INSERT INTO ratings
+                   (user_id, restaurant_id, customer_service, food_quality, respect, overall_rating, review_text)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                          (user_id, restaurant_id, customer_service, food_quality, respect, overall_rating, review_text))
+    conn.execute('''
+        INSERT INTO restaurant_rating_stats
+            (restaurant_id, rating_count, overall_sum, customer_service_sum, food_quality_sum, respect_sum,
+             avg_overall, avg_customer_service, avg_food_quality, avg_respect)
+        VALUES (?, 1, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (restaurant_id) DO UPDATE SET
+            rating_count = rating_count + 1,
+            overall_sum = overall_sum + excluded.overall_sum,
+            customer_service_sum = customer_service_sum + excluded.customer_service_sum,
+            food_quality_sum = food_quality_sum + excluded.food_quality_sum,
+            respect_sum = respect_sum + excluded.respect_sum,
+            avg_overall = (overall_sum + excluded.overall_sum) / (rating_count + 1),
+            avg_customer_service = (customer_service_sum + excluded.customer_service_sum) * 1.0 / (rating_count + 1),
+            avg_food_quality = (food_quality_sum + excluded.food_quality_sum) * 1.0 / (rating_count + 1),
+            avg_respect = (respect_sum + excluded.respect_sum) * 1.0 / (rating_count + 1)
+    ''', (restaurant_id, overall_rating, customer_service, food_quality, respect,
+          overall_rating, customer_service, food_quality, respect))
+    return cursor.lastrowid
+
+def rebuild_rating_stats(conn):
+    """Recompute every restaurant's aggregates from the ratings table; the caller commits"""
+    conn.execute('DELETE FROM restaurant_rating_stats')
+    conn.execute('''
+        INSERT INTO restaurant_rating_stats
+            (restaurant_id, rating_count, overall_sum, customer_service_sum, food_quality_sum, respect_sum,
+             avg_overall, avg_customer_service, avg_food_quality, avg_respect)
+        SELECT restaurant_id, COUNT(*), TOTAL(overall_rating), TOTAL(customer_service), TOTAL(food_quality),
+               TOTAL(respect), AVG(overall_rating), AVG(customer_service), AVG(food_quality), AVG(respect)
+        FROM ratings
+        WHERE restaurant_id IS NOT NULL
+        GROUP BY restaurant_id
+    ''')
+    return conn.execute('SELECT COUNT(*) FROM restaurant_rating_stats').fetchone()[0]
+
+def main():
+    parser = argparse.ArgumentParser(description='Maintain restaurant rating aggregates')
+    parser.add_argument('--rebuild', action='store_true', help='recompute aggregates from all ratings')
+    parser.add_argument('--database', default='restaurant_booking.db')
+    args = parser.parse_args()
+
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    conn = sqlite3.connect(args.database)
+    migrations.migrate(conn)
+    with conn:
+        restaurants = rebuild_rating_stats(conn)
+    conn.close()
+    print(f"✅ Rebuilt rating aggregates for {restaurants} restaurants")
+
+if __name__ == '__main__':
+    main()
@@ -9,15 +9,24 @@ To run the application:
 3. Run this script: python run.py
 4. Open browser to http://localhost:5000
 
+Add --async to serve from an event loop with bounded database thread pools
+(see async_server.py) instead of the threaded development server.
+
 Login Information:
 - User Login: Register first, or use sample users (john_doe, jane_smith, ravi_kumar, priya_singh) with password: password123
 - Admin Login: Use restaurant name as username (e.g., "Valluvar Restaurant", "Thalapakatti Hotel") with password: admin123
 """
 
-from app import app, init_db, populate_sample_data
+from app import app, init_db, populate_sample_data, start_background_workers
+import argparse
 import os
 
 def main():
+    parser = argparse.ArgumentParser(description='Run the restaurant booking app')
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help='serve from an event loop with separate read and write thread pools')
+    args = parser.parse_args()
+    
     print("🍽️ Restaurant Booking System")
     print("=" * 40)
     print()
@@ -29,8 +38,14 @@ def main():
         populate_sample_data()
         print("✅ Database setup complete!")
     else:
+        # Bring older databases up to the current schema
+        init_db()
         print("✅ Database found!")
     
+    # Promote waitlisted parties and seat, complete and release bookings in the background.
+    # The development server's reloader runs this twice, so only its serving process starts them.
+    start_background_workers(reloader=not args.use_async)
+    
     print()
     print("🚀 Starting application...")
     print("📍 URL: http://localhost:5000")
@@ -46,7 +61,13 @@ def main():
     print("Press Ctrl+C to stop the server")
     print("=" * 40)
     
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    if args.use_async:
+        import async_server
+        print("⚡ Async mode: %d read / %d write threads" % (app.config['ASYNC_READ_THREADS'],
+                                                           app.config['ASYNC_WRITE_THREADS']))
+        async_server.serve(app, host='0.0.0.0', port=5000)
+    else:
+        app.run(debug=True, host='0.0.0.0', port=5000)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,167 @@
+"""Restaurant search: full-text matching plus city, cuisine, veg, rating and capacity filters.
+
+Text is matched against the ``restaurant_search`` FTS5 index (one document
+per restaurant holding its name, description, cuisine and whole menu) and
+ranked with bm25, weighting a hit in the name above one in the menu.
+Without text, results are ordered by average rating.  Pages are fetched
+one row past ``per_page`` to tell whether another page exists.
+
+Searching only reads.  Documents queued by the catalog triggers are rebuilt
+by refresh(), which catalog writers run after their writes and the
+lifecycle scheduler runs on every tick for anything written elsewhere, so a
+search never waits for the write lock.
+"""
+
+import re
+
+import booking
+
+PER_PAGE = 20
+MAX_PER_PAGE = 50
+
+# bm25 weights for name, description, cuisine_type, menu
+_RANK = 'bm25(restaurant_search, 10.0, 2.0, 4.0, 1.0)'
+
+
+def match_expression(text):
+    """Turn free text into an FTS5 query: every word must match, the last one as a prefix"""
+    words = re.findall(r'\w+', text or '')
+    if not words:
+        return None
+    terms = ['"%s"' % word for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def refresh(conn):
+    """Rebuild the search documents queued by the catalog triggers; return how many"""
+    if conn.execute('SELECT 1 FROM search_pending LIMIT 1').fetchone() is None:
+        return 0
+
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.execute('DELETE FROM restaurant_search WHERE rowid IN (SELECT restaurant_id FROM search_pending)')
+        conn.execute('''
+            INSERT INTO restaurant_search (rowid, name, description, cuisine_type, menu)
+            SELECT r.id, r.name, r.description, r.cuisine_type,
+                   (SELECT group_concat(m.item_name || ' ' || COALESCE(m.description, ''), ' ')
+                    FROM menu_items m WHERE m.restaurant_id = r.id)
+            FROM search_pending p JOIN restaurants r ON r.id = p.restaurant_id
+        ''')
+        refreshed = conn.execute('DELETE FROM search_pending').rowcount
+    except Exception:
+        if own_transaction:
+            conn.rollback()
+        raise
+    if own_transaction:
+        conn.commit()
+    return refreshed
+
+
+def search_restaurants(conn, page=1, per_page=PER_PAGE, **filters):
+    """One page of matching restaurants as dicts; return ``(rows, has_more)``.
+
+    Filters are the keyword arguments of ranked_restaurants().
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    rows = ranked_restaurants(conn, per_page + 1, (max(page, 1) - 1) * per_page, **filters)
+    return rows[:per_page], len(rows) > per_page
+
+
+def search_shards(connections, page=1, per_page=PER_PAGE, **filters):
+    """search_restaurants over several shards, merged into one ranking.
+
+    Each shard's top ``page * per_page + 1`` rows hold everything it can put
+    on the page.  bm25 scores come from each shard's own index, so text
+    matches from different cities rank close to, not exactly as, one index
+    would rank them.
+    """
+    per_page = max(1, min(per_page, MAX_PER_PAGE))
+    limit = max(page, 1) * per_page + 1
+    rows = []
+    for conn in connections:
+        rows.extend(ranked_restaurants(conn, limit, 0, **filters))
+    if match_expression(filters.get('text')):
+        rows.sort(key=lambda row: (row['score'], row['id']))
+    else:
+        rows.sort(key=lambda row: (row['avg_rating'] is None, -(row['avg_rating'] or 0), row['name'], row['id']))
+    rows = rows[(max(page, 1) - 1) * per_page:limit]
+    return rows[:per_page], len(rows) > per_page
+
+
+def ranked_restaurants(conn, limit, offset, text=None, location_id=None, cuisine_type=None, veg_only=None,
+                       min_rating=None, party_size=None, booking_date=None, start_minute=None):
+    """Matching restaurants as dicts, best first, ``limit`` rows from ``offset``.
+
+    ``party_size`` keeps restaurants with an in-service table that seats the
+    party; with ``booking_date`` and ``start_minute`` that table must also be
+    free for the slot.
+    """
+    match = match_expression(text)
+    # With text, restaurants are keyed by the index rowid and only joined
+    # when a filter needs their columns
+    key = 'restaurant_search.rowid' if match else 'r.id'
+    clauses, params, joins = [], [], []
+
+    if match:
+        clauses.append('restaurant_search MATCH ?')
+        params.append(match)
+    if location_id is not None:
+        clauses.append('r.location_id = ?')
+        params.append(location_id)
+    if cuisine_type:
+        clauses.append('r.cuisine_type = ? COLLATE NOCASE')
+        params.append(cuisine_type)
+    if veg_only is not None:
+        clauses.append('r.is_veg_only = ?')
+        params.append(1 if veg_only else 0)
+    if min_rating is not None:
+        clauses.append('s.avg_overall >= ?')
+        params.append(min_rating)
+    if party_size is not None:
+        slot = ''
+        if booking_date and start_minute is not None:
+            slot = f'''AND NOT EXISTS (
+                           SELECT 1 FROM bookings b
+                           WHERE b.table_id = t.id AND b.booking_date = ?
+                             AND b.start_minute < ? AND b.end_minute > ?
+                             AND b.status IN ({', '.join('?' * len(booking.BLOCKING_STATUSES))}))'''
+        clauses.append(f'''EXISTS (SELECT 1 FROM restaurant_tables t
+                                   WHERE t.restaurant_id = {key} AND t.is_available = 1 AND t.capacity >= ?
+                                   {slot})''')
+        params.append(party_size)
+        if slot:
+            params.extend([booking_date, start_minute + booking.DEFAULT_DURATION_MINUTES, start_minute,
+                           *booking.BLOCKING_STATUSES])
+
+    if match:
+        source = 'restaurant_search'
+        if any(clause.startswith('r.') for clause in clauses):
+            joins.append('JOIN restaurants r ON r.id = restaurant_search.rowid')
+        score, order, outer_order = _RANK, 'score, restaurant_search.rowid', 'page.score, r.id'
+    else:
+        source = 'restaurants r'
+        score, order = 'NULL', 's.avg_overall DESC NULLS LAST, r.name, r.id'
+        outer_order = order
+    if min_rating is not None or not match:
+        joins.append(f'LEFT JOIN restaurant_rating_stats s ON s.restaurant_id = {key}')
+
+    # Rank and page on the narrow join first, then fetch display columns for one page
+    rows = conn.execute(f'''
+        SELECT r.id, r.name, r.location_id, l.city_name, r.cuisine_type, r.is_veg_only, r.description,
+               s.avg_overall AS avg_rating, s.rating_count, page.score
+        FROM (
+            SELECT {key} AS id, {score} AS score
+            FROM {source} {' '.join(joins)}
+            {'WHERE ' + ' AND '.join(clauses) if clauses else ''}
+            ORDER BY {order}
+            LIMIT ? OFFSET ?
+        ) page
+        JOIN restaurants r ON r.id = page.id
+        LEFT JOIN restaurant_rating_stats s ON s.restaurant_id = r.id
+        LEFT JOIN locations l ON l.id = r.location_id
+        ORDER BY {outer_order}
+    ''', params + [limit, offset]).fetchall()
+    return [dict(row) for row in rows]
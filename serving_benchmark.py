@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Serving mode benchmark
+
+Starts the app over real HTTP in each serving mode, in its own process and
+on its own copy of the database, and drives it with many concurrent
+keep-alive connections for a fixed time. Most requests read (restaurant
+details with an availability check, listings, menus); the rest book tables,
+so readers run while writers contend for the SQLite write lock.
+
+    threaded  Werkzeug's threaded server, what ``app.run()`` in run.py uses
+    async     async_server.AsyncServer with bounded read and write pools
+
+Reports reads/s, writes/s and read and write latency percentiles for each.
+``--read-snapshots`` serves the read pages from snapshots (see snapshots.py).
+
+Usage:
+    python serving_benchmark.py [--connections 64] [--seconds 10] [--write-ratio 0.2]
+                                [--read-threads 8] [--write-threads 2] [--read-snapshots]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+from urllib.parse import urlencode
+
+import app as booking_app
+import benchmark
+
+MODES = ['threaded', 'async']
+
+def run_server(mode, path, port, read_threads, write_threads, read_snapshots, ready):
+    """Server process: serve the app on ``port`` until terminated"""
+    booking_app.app.config.update(DATABASE=path, WAITLIST_WORKER=False, READ_SNAPSHOTS=read_snapshots,
+                                  ASYNC_READ_THREADS=read_threads, ASYNC_WRITE_THREADS=write_threads)
+    if mode == 'threaded':
+        import logging
+        from werkzeug.serving import make_server
+        # Per-request access logging would slow this mode down for reasons unrelated to serving
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', port, booking_app.app, threaded=True)
+        ready.set()
+        server.serve_forever()
+    else:
+        import async_server
+        server = async_server.AsyncServer(booking_app.app, '127.0.0.1', port, read_threads, write_threads)
+
+        async def main():
+            await server.start()
+            ready.set()
+            await server.server.serve_forever()
+        asyncio.run(main())
+
+def session_cookie(target):
+    serializer = booking_app.app.session_interface.get_signing_serializer(booking_app.app)
+    return serializer.dumps({'user_id': target['user_id'], 'username': target['username']})
+
+def request_mix(target, write_ratio, seed):
+    """Endless (method, path, body) requests; writes book a fresh far-future slot each time"""
+    rng = random.Random(seed)
+    reads = ['/restaurant/%d?date=%s&time=19:00' % (target['restaurant_id'], target['today']),
+             '/restaurants/%d' % target['location_id'],
+             '/menu/%d' % target['restaurant_id']]
+    times = benchmark.BOOKING_TIMES
+    i = 0
+    while True:
+        if rng.random() < write_ratio:
+            day = date(2031, 1, 1) + timedelta(days=seed * 10000 + i // len(times))
+            body = urlencode({'restaurant_id': target['restaurant_id'], 'booking_date': day.isoformat(),
+                              'booking_time': times[i % len(times)], 'party_size': 2})
+            i += 1
+            yield 'POST', '/book-table', body
+        else:
+            yield 'GET', rng.choice(reads), None
+
+async def send(reader, writer, method, path, body, cookie):
+    lines = ['%s %s HTTP/1.1' % (method, path), 'Host: 127.0.0.1', 'Cookie: session=%s' % cookie]
+    if body is not None:
+        lines += ['Content-Type: application/x-www-form-urlencoded', 'Content-Length: %d' % len(body)]
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n' + (body or '')).encode())
+    status = int((await reader.readline()).split()[1])
+    length, keep_alive = 0, True
+    while True:
+        line = (await reader.readline()).decode('latin-1').strip()
+        if not line:
+            break
+        name, _, value = line.partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+        elif name.lower() == 'connection':
+            keep_alive = value.strip().lower() != 'close'
+    if length:
+        await reader.readexactly(length)
+    return status, keep_alive
+
+async def client(port, requests, cookie, deadline, stats):
+    connection = None
+    for method, path, body in requests:
+        if time.perf_counter() >= deadline:
+            break
+        started = time.perf_counter()
+        try:
+            if connection is None:
+                connection = await asyncio.open_connection('127.0.0.1', port)
+            status, keep_alive = await send(*connection, method, path, body, cookie)
+        except (ConnectionError, asyncio.IncompleteReadError, IndexError, ValueError):
+            stats['errors'] += 1
+            if connection:
+                connection[1].close()
+            connection = None
+            continue
+        kind = 'reads' if method == 'GET' else 'writes'
+        stats[kind].append(time.perf_counter() - started)
+        if status >= 400:
+            stats['errors'] += 1
+        if not keep_alive:
+            connection[1].close()
+            connection = None
+    if connection:
+        connection[1].close()
+
+async def drive(port, target, connections, seconds, write_ratio):
+    cookie = session_cookie(target)
+    stats = {'reads': [], 'writes': [], 'errors': 0}
+    deadline = time.perf_counter() + seconds
+    await asyncio.gather(*(client(port, request_mix(target, write_ratio, seed), cookie, deadline, stats)
+                           for seed in range(connections)))
+    return stats
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def run_mode(mode, args):
+    path = os.path.join(tempfile.mkdtemp(prefix='booking-serve-'), 'serve.db')
+    benchmark.prepare_database(path)
+    target = benchmark.load_target(path)
+
+    port = free_port()
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=run_server, daemon=True,
+                                     args=(mode, path, port, args.read_threads, args.write_threads,
+                                           args.read_snapshots, ready))
+    server.start()
+    try:
+        ready.wait(30)
+        time.sleep(0.2)
+        stats = asyncio.run(drive(port, target, args.connections, args.seconds, args.write_ratio))
+    finally:
+        server.terminate()
+        server.join()
+
+    def pct(values, fraction):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(fraction * len(values)))] * 1000 if values else 0.0
+    return {'reads_per_s': len(stats['reads']) / args.seconds, 'writes_per_s': len(stats['writes']) / args.seconds,
+            'read_p50_ms': pct(stats['reads'], 0.5), 'read_p95_ms': pct(stats['reads'], 0.95),
+            'write_p50_ms': pct(stats['writes'], 0.5), 'write_p95_ms': pct(stats['writes'], 0.95),
+            'errors': stats['errors']}
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the threaded and async serving modes')
+    parser.add_argument('--connections', type=int, default=64)
+    parser.add_argument('--seconds', type=float, default=10)
+    parser.add_argument('--write-ratio', type=float, default=0.2)
+    parser.add_argument('--read-threads', type=int, default=booking_app.app.config['ASYNC_READ_THREADS'])
+    parser.add_argument('--write-threads', type=int, default=booking_app.app.config['ASYNC_WRITE_THREADS'])
+    parser.add_argument('--modes', default=','.join(MODES))
+    parser.add_argument('--read-snapshots', action='store_true', help='serve read pages from snapshots')
+    args = parser.parse_args()
+
+    print("🍽️ Restaurant Booking System - Serving Mode Benchmark")
+    print("=" * 50)
+    print(f"{args.connections} connections, {args.seconds:g}s, {args.write_ratio:.0%} writes"
+          + (", read snapshots" if args.read_snapshots else ""))
+    print(f"{'mode':<10}{'reads/s':>9}{'writes/s':>10}{'read p50':>10}{'read p95':>10}"
+          f"{'write p50':>11}{'write p95':>11}{'errors':>8}")
+    for mode in args.modes.split(','):
+        r = run_mode(mode, args)
+        print(f"{mode:<10}{r['reads_per_s']:>9.0f}{r['writes_per_s']:>10.0f}{r['read_p50_ms']:>10.1f}"
+              f"{r['read_p95_ms']:>10.1f}{r['write_p50_ms']:>11.1f}{r['write_p95_ms']:>11.1f}{r['errors']:>8}")
+    print("latencies in ms")
+
+if __name__ == '__main__':
+    main()
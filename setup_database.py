@@ -1,126 +1,19 @@
 import sqlite3
 from datetime import datetime, timedelta
 
+import migrations
+import search
+
 def setup_complete_database():
     """Setup complete database with all tables and comprehensive sample data"""
     conn = sqlite3.connect('restaurant_booking.db')
     
-    # Drop existing tables to ensure clean setup
-    tables_to_drop = ['special_offers', 'ratings', 'menu_items', 'bookings', 'restaurant_tables', 'restaurants', 'locations', 'users']
-    for table in tables_to_drop:
-        conn.execute(f'DROP TABLE IF EXISTS {table}')
-    
-    # Users table
-    conn.execute('''
-        CREATE TABLE users (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password TEXT NOT NULL,
-            email TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Locations table
-    conn.execute('''
-        CREATE TABLE locations (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            city_name TEXT UNIQUE NOT NULL
-        )
-    ''')
-    
-    # Restaurants table
-    conn.execute('''
-        CREATE TABLE restaurants (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            location_id INTEGER,
-            cuisine_type TEXT NOT NULL,
-            is_veg_only INTEGER DEFAULT 0,
-            description TEXT,
-            image_url TEXT,
-            FOREIGN KEY (location_id) REFERENCES locations (id)
-        )
-    ''')
-    
-    # Tables in restaurants
-    conn.execute('''
-        CREATE TABLE restaurant_tables (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            restaurant_id INTEGER,
-            table_number TEXT NOT NULL,
-            capacity INTEGER NOT NULL,
-            is_available INTEGER DEFAULT 1,
-            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
-        )
-    ''')
-    
-    # Bookings table
-    conn.execute('''
-        CREATE TABLE bookings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            restaurant_id INTEGER,
-            table_id INTEGER,
-            booking_date DATE NOT NULL,
-            booking_time TIME NOT NULL,
-            party_size INTEGER NOT NULL,
-            status TEXT DEFAULT 'confirmed',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id),
-            FOREIGN KEY (table_id) REFERENCES restaurant_tables (id)
-        )
-    ''')
-    
-    # Menu items table
-    conn.execute('''
-        CREATE TABLE menu_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            restaurant_id INTEGER,
-            item_name TEXT NOT NULL,
-            description TEXT,
-            price REAL NOT NULL,
-            category TEXT NOT NULL,
-            is_veg INTEGER DEFAULT 1,
-            image_url TEXT,
-            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
-        )
-    ''')
-    
-    # Ratings table
-    conn.execute('''
-        CREATE TABLE ratings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            restaurant_id INTEGER,
-            customer_service INTEGER CHECK(customer_service >= 1 AND customer_service <= 5),
-            food_quality INTEGER CHECK(food_quality >= 1 AND food_quality <= 5),
-            respect INTEGER CHECK(respect >= 1 AND respect <= 5),
-            overall_rating REAL,
-            review_text TEXT,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (user_id) REFERENCES users (id),
-            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
-        )
-    ''')
-    
-    # Special offers table
-    conn.execute('''
-        CREATE TABLE special_offers (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            restaurant_id INTEGER,
-            title TEXT NOT NULL,
-            description TEXT NOT NULL,
-            discount_percentage REAL,
-            valid_from DATE,
-            valid_to DATE,
-            is_active INTEGER DEFAULT 1,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (restaurant_id) REFERENCES restaurants (id)
-        )
-    ''')
+    # Bring the schema up to date in place, then clear old rows for a clean setup
+    migrations.migrate(conn)
+    tables_to_clear = ['waitlist', 'restaurant_rating_stats', 'special_offers', 'ratings', 'menu_items', 'bookings', 'restaurant_tables', 'restaurants', 'locations', 'users', 'restaurant_versions', 'waitlist_pending', 'booking_hourly', 'rating_daily', 'idempotency_keys']
+    for table in tables_to_clear:
+        conn.execute(f'DELETE FROM {table}')
+    conn.execute('DELETE FROM sqlite_sequence')
     
     # Insert Tamil Nadu cities
     cities = ['Karur', 'Dindigul', 'Salem', 'Madurai', 'Chennai', 'Coimbatore', 'Trichy', 'Erode']
@@ -293,6 +186,7 @@ def setup_complete_database():
                      20, today, next_month))
     
     conn.commit()
+    search.refresh(conn)
     conn.close()
     print("Complete database setup finished successfully!")
     print("Sample restaurants created in Karur, Chennai, and Madurai")
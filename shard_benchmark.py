@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Sharding benchmark
+
+Books tables in several cities at once, one writer process per city, for a
+fixed time through app.test_client(), first against a single database file
+and then against a copy split into one shard per city (see shards.py).
+Every writer books a fresh slot each time, so the only thing they contend
+for is SQLite's write lock: one lock for all cities in single mode, one per
+city when sharded.
+
+Usage:
+    python shard_benchmark.py [--cities 4] [--seconds 5] [--synchronous NORMAL]
+"""
+
+import argparse
+import multiprocessing
+import os
+import tempfile
+import time
+from datetime import date, timedelta
+
+import app as booking_app
+import db
+import shards
+
+MODES = ['single', 'sharded']
+
+def prepare(workdir, mode, cities):
+    """A database with one restaurant and ten tables per city; return the restaurant ids"""
+    path = os.path.join(workdir, 'bench.db')
+    booking_app.app.config.update(DATABASE=path, DB_SHARD_DIR=None, WAITLIST_WORKER=False)
+    booking_app.init_db()
+    booking_app.populate_sample_data()
+    conn = booking_app.get_db_connection()
+    restaurants = [row[0] for row in conn.execute('SELECT MIN(id) FROM restaurants GROUP BY location_id '
+                                                  'ORDER BY location_id LIMIT ?', (cities,))]
+    for restaurant_id in restaurants:
+        conn.executemany('INSERT INTO restaurant_tables (restaurant_id, table_number, capacity) VALUES (?, ?, 4)',
+                         [(restaurant_id, 'B%d' % number) for number in range(1, 11)])
+    conn.execute("INSERT INTO users (username, password, email, phone) VALUES ('bench', 'pw', 'b@x.com', '0')")
+    conn.commit()
+    conn.close()
+    db.reset_pools()
+    if mode == 'sharded':
+        shards.split(path, os.path.join(workdir, 'shards'))
+    return path, restaurants
+
+def writer(path, shard_dir, synchronous, restaurant_id, seconds, start, results):
+    """Writer process: book slots at one restaurant until the time is up"""
+    booking_app.app.config.update(DATABASE=path, DB_SHARD_DIR=shard_dir, WAITLIST_WORKER=False,
+                                  SQLITE_SYNCHRONOUS=synchronous)
+    booked = 0
+    with booking_app.app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'], sess['username'] = 1, 'bench'
+        start.wait()
+        deadline = time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            day = date(2031, 1, 1) + timedelta(days=booked // 10)
+            client.post('/book-table', data={'restaurant_id': restaurant_id, 'booking_date': day.isoformat(),
+                                             'booking_time': '19:00', 'party_size': 2})
+            booked += 1
+    results.put(booked)
+
+def run_mode(mode, args):
+    workdir = tempfile.mkdtemp(prefix='booking-shards-')
+    path, restaurants = prepare(workdir, mode, args.cities)
+    shard_dir = os.path.join(workdir, 'shards') if mode == 'sharded' else None
+
+    start, results = multiprocessing.Event(), multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=writer, args=(path, shard_dir, args.synchronous, restaurant_id,
+                                                            args.seconds, start, results))
+               for restaurant_id in restaurants]
+    for worker in workers:
+        worker.start()
+    time.sleep(1)
+    start.set()
+    booked = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    return sum(booked) / args.seconds, len(restaurants)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare booking write throughput with and without sharding')
+    parser.add_argument('--cities', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--synchronous', default='NORMAL', help='SQLITE_SYNCHRONOUS for the writers')
+    args = parser.parse_args()
+
+    print("🗂️ Restaurant Booking System - Sharding Benchmark")
+    print("=" * 50)
+    for mode in MODES:
+        rate, cities = run_mode(mode, args)
+        print(f"{mode:<10}{cities} cities  {rate:>8.0f} bookings/s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Per-location database sharding
+
+In sharded mode (``DB_SHARD_DIR`` set) each city's data lives in its own
+SQLite file, ``<DB_SHARD_DIR>/location_<id>.db``, so a booking rush in one
+city never waits for another city's write lock:
+
+    catalog (DATABASE)   users, locations and a directory of every restaurant
+    one shard per city   the city's restaurants, tables, menus, offers,
+                         bookings, ratings, waitlist and search index,
+                         plus a copy of the locations
+
+Every file carries the full schema, so queries and triggers run unchanged
+on a shard. The app routes a request to a shard by the restaurant or
+location it is about, and sends everything else to the catalog. Reads that
+show usernames attach the catalog (see db.open_connection).
+
+Row ids stay unique across shards. Each shard hands out AUTOINCREMENT ids
+from its own range, starting at ``location_id << ID_BITS``, so location_of()
+finds the shard of a booking or waitlist entry from its id alone. Rows
+copied by split() keep their original ids, which are already unique.
+
+Split an existing single-file database with:
+
+    python shards.py [--database restaurant_booking.db] [--dir shards] [--keep]
+"""
+
+import argparse
+import glob
+import os
+import re
+import sqlite3
+import time
+
+import catalog_import
+import migrations
+import search
+
+ID_BITS = 32
+
+# Tables partitioned by city, in copy order, with the column naming their restaurant.
+# restaurant_versions comes last, so the copied versions replace the ones that triggers bump during the copy.
+PARTITIONED = [
+    ('restaurants', 'id'),
+    ('restaurant_tables', 'restaurant_id'),
+    ('menu_items', 'restaurant_id'),
+    ('special_offers', 'restaurant_id'),
+    ('bookings', 'restaurant_id'),
+    ('ratings', 'restaurant_id'),
+    ('restaurant_rating_stats', 'restaurant_id'),
+    ('waitlist', 'restaurant_id'),
+    ('waitlist_pending', 'restaurant_id'),
+    ('restaurant_versions', 'restaurant_id'),
+]
+
+# Tables whose new rows take ids from the shard's range; restaurant ids are handed out by the catalog
+RANGED = ['restaurant_tables', 'menu_items', 'special_offers', 'bookings', 'ratings', 'waitlist']
+
+# Partitioned rows removed from the catalog after a split, children first. Restaurants and their
+# versions stay as the directory. The analytics rollups and waitlist_pending come after the rows
+# whose deletes feed them. Shards build their own rollups through the triggers as rows are copied in.
+PRUNED = ['bookings', 'waitlist', 'ratings', 'restaurant_rating_stats', 'special_offers', 'menu_items',
+          'restaurant_tables', 'booking_hourly', 'rating_daily', 'waitlist_pending']
+
+_SHARD_FILE = re.compile(r'^location_(\d+)\.db$')
+
+
+def shard_path(directory, location_id):
+    return os.path.join(directory, 'location_%d.db' % int(location_id))
+
+
+def shard_locations(directory):
+    """Ids of the locations with a shard file in ``directory``"""
+    ids = []
+    for path in glob.glob(os.path.join(glob.escape(directory), 'location_*.db')):
+        match = _SHARD_FILE.match(os.path.basename(path))
+        if match:
+            ids.append(int(match.group(1)))
+    return sorted(ids)
+
+
+def location_of(row_id):
+    """The location whose shard created a row, or None for rows older than the split"""
+    return (int(row_id) >> ID_BITS) or None
+
+
+def columns(conn, table):
+    return [row[1] for row in conn.execute('PRAGMA table_info(%s)' % table)]
+
+
+def prepare_shard(conn, location_id):
+    """Bring a shard's schema up to date and reserve its id range"""
+    migrations.migrate(conn)
+    floor = int(location_id) << ID_BITS
+    for table in RANGED:
+        conn.execute('''INSERT INTO sqlite_sequence (name, seq)
+                        SELECT ?, 0 WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = ?)''',
+                     (table, table))
+        conn.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (floor, table))
+    conn.commit()
+
+
+def _upsert(conn, table, names, rows):
+    """Insert rows or update them in place by id; unchanged rows are left alone, so no triggers fire"""
+    updates = [name for name in names if name != 'id']
+    conn.executemany(f'''
+        INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})
+        ON CONFLICT (id) DO UPDATE SET {', '.join('%s = excluded.%s' % (name, name) for name in updates)}
+        WHERE {' OR '.join('%s IS NOT excluded.%s' % (name, name) for name in updates)}
+    ''', [tuple(row) for row in rows])
+
+
+def sync_directory(catalog, shard, location_id):
+    """Copy the locations and the city's restaurants from the catalog into its shard"""
+    names = {table: [name for name in columns(catalog, table) if name in columns(shard, table)]
+             for table in ('locations', 'restaurants')}
+    locations = catalog.execute('SELECT %s FROM locations' % ', '.join(names['locations'])).fetchall()
+    restaurants = catalog.execute('SELECT %s FROM restaurants WHERE location_id = ?'
+                                  % ', '.join(names['restaurants']), (location_id,)).fetchall()
+    shard.execute('BEGIN IMMEDIATE')
+    try:
+        _upsert(shard, 'locations', names['locations'], locations)
+        _upsert(shard, 'restaurants', names['restaurants'], restaurants)
+        search.refresh(shard)
+    except Exception:
+        shard.rollback()
+        raise
+    shard.commit()
+
+
+def import_catalog(catalog, connect_shard, restaurants=(), tables=(), menu_items=(),
+                   progress=lambda stage, done, total: None):
+    """catalog_import.import_catalog for sharded mode; return the same per-kind counts.
+
+    Restaurants are imported into the catalog first, so they get their ids
+    there. Each city's shard then receives its copy of the directory and its
+    own tables and menu items. ``connect_shard(location_id)`` opens a shard.
+    The catalog and every shard commit separately, catalog first. Rows for a
+    city the catalog does not know are counted under ``skipped``.
+    """
+    summary = catalog_import.import_catalog(catalog, restaurants=restaurants, progress=progress)
+    cities = {row[1]: row[0] for row in catalog.execute('SELECT id, city_name FROM locations')}
+
+    by_location = {}
+    for kind, rows in (('tables', tables), ('menu_items', menu_items)):
+        for row in rows:
+            location_id = cities.get(row[0])
+            if location_id is None:
+                summary[kind]['skipped'] += 1
+            else:
+                by_location.setdefault(location_id, {'tables': [], 'menu_items': []})[kind].append(row)
+    touched = set(by_location) | {cities[row[0]] for row in restaurants if row[0] in cities}
+
+    for location_id in sorted(touched):
+        shard = connect_shard(location_id)
+        try:
+            prepare_shard(shard, location_id)
+            sync_directory(catalog, shard, location_id)
+            rows = by_location.get(location_id)
+            if rows:
+                counts = catalog_import.import_catalog(shard, tables=rows['tables'], menu_items=rows['menu_items'],
+                                                       progress=progress)
+                for kind in ('tables', 'menu_items'):
+                    for label, count in counts[kind].items():
+                        summary[kind][label] += count
+        finally:
+            shard.close()
+    return summary
+
+
+def split(database, directory, keep=False, progress=lambda location_id, counts: None):
+    """Copy each city's rows out of a single-file database into a new shard.
+
+    ``database`` becomes the catalog. Unless ``keep`` is set, the copied rows
+    are then deleted from it; restaurants stay there as the directory.
+    Existing shard files are never overwritten. Returns
+    ``{location_id: {table: rows copied}}``.
+    """
+    os.makedirs(directory, exist_ok=True)
+    source = sqlite3.connect(database)
+    migrations.migrate(source)
+    locations = [row[0] for row in source.execute('SELECT id FROM locations ORDER BY id')]
+    existing = [shard_path(directory, location_id) for location_id in locations
+                if os.path.exists(shard_path(directory, location_id))]
+    if existing:
+        source.close()
+        raise FileExistsError('Shards already exist: %s' % ', '.join(existing))
+
+    copied = {}
+    for location_id in locations:
+        shard = sqlite3.connect(shard_path(directory, location_id))
+        shard.execute('PRAGMA journal_mode = WAL')
+        prepare_shard(shard, location_id)
+        shard.execute('ATTACH DATABASE ? AS source', (database,))
+        counts = copied[location_id] = {}
+        shard.execute('BEGIN IMMEDIATE')
+        try:
+            names = ', '.join(columns(shard, 'locations'))
+            shard.execute(f'INSERT INTO main.locations ({names}) SELECT {names} FROM source.locations')
+            for table, key in PARTITIONED:
+                names = ', '.join(columns(shard, table))
+                counts[table] = shard.execute(f'''
+                    INSERT OR REPLACE INTO main.{table} ({names})
+                    SELECT {names} FROM source.{table}
+                    WHERE {key} IN (SELECT id FROM source.restaurants WHERE location_id = ?)
+                ''', (location_id,)).rowcount
+        except Exception:
+            shard.rollback()
+            shard.close()
+            source.close()
+            raise
+        shard.commit()
+        shard.execute('DETACH DATABASE source')
+        search.refresh(shard)
+        shard.close()
+        progress(location_id, counts)
+
+    if not keep:
+        source.execute('BEGIN IMMEDIATE')
+        for table in PRUNED:
+            source.execute('DELETE FROM %s' % table)
+        source.commit()
+        source.execute('VACUUM')
+    source.close()
+    return copied
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Split the booking database into one shard per city')
+    parser.add_argument('--database', default='restaurant_booking.db')
+    parser.add_argument('--dir', default='shards', help='directory for the shard files')
+    parser.add_argument('--keep', action='store_true', help='leave the copied rows in the catalog too')
+    args = parser.parse_args()
+
+    print("🗂️ Restaurant Booking System - Shard Split")
+    print("=" * 50)
+
+    def progress(location_id, counts):
+        print(f"✅ location {location_id}: {counts['restaurants']} restaurants, {counts['bookings']} bookings, "
+              f"{counts['ratings']} ratings -> {shard_path(args.dir, location_id)}")
+
+    started = time.perf_counter()
+    split(args.database, args.dir, args.keep, progress)
+    print(f"⏱️  Finished in {time.perf_counter() - started:.2f}s")
+    print(f"Set DB_SHARD_DIR = {args.dir!r} in the app config to serve from the shards.")
+
+
+if __name__ == '__main__':
+    main()
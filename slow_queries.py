@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Slow-query log
+
+Instrumented connections (see db.py) hand every statement that takes at
+least ``SQL_SLOW_MS`` milliseconds, counting execution and fetching, to a
+SlowQueryLog.  The log writes one JSON line per slow statement to a
+rotating file with:
+
+    duration_ms   time spent executing and fetching
+    route         Flask endpoint, or the thread name outside a request
+    sql           the statement, whitespace collapsed
+    params        the parameters' shape (types only, never values)
+    plan          the EXPLAIN QUERY PLAN rows
+    full_scans    watched tables (bookings, ratings, menu_items) read with a full table scan
+
+Run this module to rank the logged statements:
+
+    python slow_queries.py [--log slow_queries.log] [--top 20] [--sort total|max|count]
+"""
+
+import argparse
+import glob
+import json
+import logging
+import logging.handlers
+import re
+import sqlite3
+import threading
+from datetime import datetime
+
+# Tables big enough that scanning them on a request path is always a bug
+WATCHED_TABLES = ('bookings', 'ratings', 'menu_items')
+
+_SQL_KEYWORDS = {'where', 'join', 'left', 'inner', 'cross', 'on', 'order', 'group', 'limit', 'set', 'values',
+                 'select', 'union', 'using', 'natural', 'having', 'window', 'default', 'returning'}
+
+_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS (\w+))?(.*)$')
+_TABLE_ALIAS = re.compile(r'\b(%s)\b(?:\s+(?:AS\s+)?(\w+))?' % '|'.join(WATCHED_TABLES), re.IGNORECASE)
+
+_logs = {}
+_logs_lock = threading.Lock()
+
+
+def normalize(sql):
+    return ' '.join(sql.split())
+
+
+def params_shape(parameters, many=False):
+    """Describe parameters by type only, e.g. ``(int, str)`` or ``{id: int}``"""
+    if many:
+        return 'many'
+    if isinstance(parameters, dict):
+        return '{%s}' % ', '.join('%s: %s' % (name, type(value).__name__) for name, value in parameters.items())
+    return '(%s)' % ', '.join(type(value).__name__ for value in parameters)
+
+
+def watched_aliases(sql):
+    """Map every name a watched table goes by in the statement to the table"""
+    aliases = {}
+    for table, alias in _TABLE_ALIAS.findall(sql):
+        table = table.lower()
+        aliases[table] = table
+        if alias and alias.lower() not in _SQL_KEYWORDS:
+            aliases[alias] = table
+    return aliases
+
+
+def full_scans(sql, plan):
+    """Watched tables the plan reads with a full table scan (no index)"""
+    aliases = watched_aliases(sql)
+    scanned = []
+    for detail in plan:
+        match = _SCAN.match(detail)
+        if match and 'INDEX' not in match.group(3):
+            table = aliases.get(match.group(2) or match.group(1)) or aliases.get(match.group(1))
+            if table and table not in scanned:
+                scanned.append(table)
+    return scanned
+
+
+def explain(conn, sql, parameters):
+    """EXPLAIN QUERY PLAN details for a statement, bypassing the connection's instrumentation"""
+    try:
+        rows = sqlite3.Connection.execute(conn, 'EXPLAIN QUERY PLAN ' + sql, parameters).fetchall()
+    except sqlite3.Error:
+        return []
+    return [row[3] for row in rows]
+
+
+def current_route():
+    try:
+        from flask import has_request_context, request
+        if has_request_context():
+            return request.endpoint or 'unmatched'
+    except ImportError:
+        pass
+    return threading.current_thread().name
+
+
+class SlowQueryLog:
+    """Writes slow statements as JSON lines to a size-rotated file"""
+
+    def __init__(self, path, max_bytes=10 * 1024 * 1024, backups=5):
+        self.path = path
+        self.logger = logging.getLogger('slow_queries.%s' % path)
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        if not self.logger.handlers:
+            handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups,
+                                                           delay=True)
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            self.logger.addHandler(handler)
+
+    def record(self, conn, sql, parameters, seconds, many=False):
+        plan = [] if many else explain(conn, sql, parameters)
+        entry = {
+            'at': datetime.now().isoformat(timespec='milliseconds'),
+            'duration_ms': round(seconds * 1000, 3),
+            'route': current_route(),
+            'sql': normalize(sql),
+            'params': params_shape(parameters, many),
+            'plan': plan,
+            'full_scans': full_scans(sql, plan),
+        }
+        self.logger.info(json.dumps(entry))
+        return entry
+
+
+def get_log(path, max_bytes=10 * 1024 * 1024, backups=5):
+    """The shared SlowQueryLog for a file"""
+    log = _logs.get(path)
+    if log is None:
+        with _logs_lock:
+            log = _logs.setdefault(path, SlowQueryLog(path, max_bytes, backups))
+    return log
+
+
+def read_entries(path):
+    """Entries from the log and its rotated backups, oldest file first"""
+    backups = sorted(glob.glob(glob.escape(path) + '.[0-9]*'), key=lambda name: int(name.rsplit('.', 1)[1]),
+                     reverse=True)
+    for name in backups + [path]:
+        try:
+            with open(name, encoding='utf-8') as handle:
+                for line in handle:
+                    if line.strip():
+                        yield json.loads(line)
+        except FileNotFoundError:
+            continue
+
+
+def summarize(entries, sort='total'):
+    """Group entries by statement; return rows ranked worst first"""
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry['sql'], {'sql': entry['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                                                 'routes': set(), 'full_scans': set(), 'plan': entry['plan']})
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        group['routes'].add(entry['route'])
+        group['full_scans'].update(entry['full_scans'])
+    key = {'total': 'total_ms', 'max': 'max_ms', 'count': 'count'}[sort]
+    return sorted(groups.values(), key=lambda group: group[key], reverse=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rank the statements in the slow-query log')
+    parser.add_argument('--log', default='slow_queries.log')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--sort', choices=['total', 'max', 'count'], default='total')
+    parser.add_argument('--plans', action='store_true', help='print each statement\'s query plan')
+    args = parser.parse_args()
+
+    ranked = summarize(read_entries(args.log), args.sort)
+    print("🐢 Restaurant Booking System - Slow Queries (%s)" % args.log)
+    print("=" * 50)
+    if not ranked:
+        print("No slow statements logged.")
+        return
+    print(f"{'#':>3} {'count':>6} {'total ms':>10} {'max ms':>9}  statement")
+    for rank, group in enumerate(ranked[:args.top], 1):
+        sql = group['sql'] if len(group['sql']) <= 100 else group['sql'][:97] + '...'
+        print(f"{rank:>3} {group['count']:>6} {group['total_ms']:>10.1f} {group['max_ms']:>9.1f}  {sql}")
+        print(f"{'':>32}routes: {', '.join(sorted(group['routes']))}")
+        if group['full_scans']:
+            print(f"{'':>32}⚠️  FULL SCAN of {', '.join(sorted(group['full_scans']))}")
+        if args.plans:
+            for detail in group['plan']:
+                print(f"{'':>32}| {detail}")
+
+
+if __name__ == '__main__':
+    main()
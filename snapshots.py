@@ -0,0 +1,200 @@
+"""Read snapshots of the database, refreshed in the background.
+
+In read-snapshot mode (``READ_SNAPSHOTS``) routes that tolerate stale data
+read from a copy of the database instead of the primary file that bookings
+and ratings write to. A SnapshotManager thread takes a fresh copy with the
+sqlite3 online backup API every ``READ_SNAPSHOT_INTERVAL`` seconds; the
+backup runs as one read transaction, so WAL writers are never blocked.
+
+Each refresh copies into a new file and then swaps it in with a single
+reference assignment. Readers that already hold a connection keep reading
+the snapshot they started with, and its file is deleted when the last of
+them hands its connection back. Connections idling in any thread's pool
+are closed as soon as their snapshot is retired, so a deleted file never
+keeps its disk space waiting for a thread's next request. Snapshot files never change after the
+copy, so they are opened ``immutable``: no locking, no WAL, no -shm.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.request import pathname2url
+
+import db
+
+REFRESH_SECONDS = 2.0
+
+
+class SnapshotPool(db.ConnectionPool):
+    """Connection pool for one snapshot; counts connections out so the file can go once retired.
+
+    Idle connections are also tracked across threads so drain() can close
+    them all. They are opened with ``check_same_thread=False`` for that
+    close only; each is otherwise used by the thread that opened it.
+    """
+
+    def __init__(self, snapshot, settings):
+        super().__init__('file:%s?immutable=1' % pathname2url(snapshot.path), settings)
+        self.snapshot = snapshot
+        self._all_idle = set()
+
+    def acquire(self):
+        """A connection, or None if the snapshot was retired in the meantime"""
+        snapshot = self.snapshot
+        with snapshot.lock:
+            if snapshot.retired:
+                return None
+            snapshot.in_use += 1
+            idle = self._idle()
+            conn = idle.pop() if idle else None
+            self._all_idle.discard(conn)
+        if conn is None:
+            try:
+                conn = db.open_connection(self.database, self.settings, check_same_thread=False)
+            except Exception:
+                self.release_count()
+                raise
+        conn.pool = self
+        conn.checked_out = True
+        return conn
+
+    def release_count(self):
+        snapshot = self.snapshot
+        with snapshot.lock:
+            snapshot.in_use -= 1
+            last = snapshot.retired and not snapshot.in_use
+        if last:
+            snapshot.remove()
+
+    def release(self, conn):
+        snapshot = self.snapshot
+        with snapshot.lock:
+            idle = self._idle()
+            keep = not snapshot.retired and len(idle) < self.settings['DB_POOL_SIZE']
+            if keep:
+                idle.append(conn)
+                self._all_idle.add(conn)
+        if not keep:
+            conn.dispose()
+        self.release_count()
+
+    def drain(self):
+        """Close the idle connections of every thread; call once the snapshot is retired"""
+        with self.snapshot.lock:
+            idle, self._all_idle = self._all_idle, set()
+        for conn in idle:
+            conn.dispose()
+
+
+class Snapshot:
+    """One copy of the database and the pool of connections reading it"""
+
+    def __init__(self, path, generation, taken_at, settings):
+        self.path = path
+        self.generation = generation
+        self.taken_at = taken_at
+        self.retired = False
+        self.in_use = 0
+        self.lock = threading.Lock()
+        self.pool = SnapshotPool(self, settings)
+
+    def age(self):
+        return time.monotonic() - self.taken_at
+
+    def retire(self):
+        """Stop handing out connections; delete the file once none are in use"""
+        with self.lock:
+            self.retired = True
+            idle = not self.in_use
+        self.pool.drain()
+        if idle:
+            self.remove()
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class SnapshotManager:
+    """Keeps a recent snapshot of ``source``, refreshed every ``interval`` seconds on a daemon thread"""
+
+    def __init__(self, source, settings, interval=REFRESH_SECONDS, directory=None):
+        self.source = source
+        # Snapshots are read-only copies: keep their journal mode, never try to switch it to WAL
+        self.settings = dict(settings, SQLITE_JOURNAL_MODE='DELETE')
+        self.interval = interval
+        self.directory = tempfile.mkdtemp(prefix='booking-snapshots-', dir=directory)
+        self.current = None
+        self.refreshes = 0
+        self.last_seconds = None
+        self.last_error = None
+        self._generation = 0
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def refresh(self):
+        """Copy the primary into a new snapshot and make it current; return it"""
+        with self._refresh_lock:
+            self._generation += 1
+            path = os.path.join(self.directory, 'snapshot-%d.db' % self._generation)
+            started = time.monotonic()
+            source = sqlite3.connect(self.source, timeout=self.settings['SQLITE_BUSY_TIMEOUT'])
+            target = sqlite3.connect(path)
+            try:
+                # One step: a stepped backup restarts whenever a writer commits in between
+                source.backup(target)
+                target.execute('PRAGMA journal_mode = DELETE')
+            finally:
+                target.close()
+                source.close()
+            snapshot = Snapshot(path, self._generation, started, self.settings)
+            previous, self.current = self.current, snapshot
+            self.refreshes += 1
+            self.last_seconds = time.monotonic() - started
+        if previous is not None:
+            previous.retire()
+        return snapshot
+
+    def connect(self, max_age):
+        """A connection to the current snapshot, or None if it is more than ``max_age`` seconds old"""
+        while True:
+            snapshot = self.current
+            if snapshot is None or snapshot.age() > max_age:
+                return None
+            conn = snapshot.pool.acquire()
+            if conn is not None:
+                return conn
+            # Rotated between reading current and checking out; take the new one
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='read-snapshots', daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def close(self):
+        """Stop refreshing and delete every snapshot"""
+        self.stop()
+        if self.current is not None:
+            self.current.retire()
+            self.current = None
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.refresh()
+            except sqlite3.Error as error:
+                # Keep serving the last snapshot; routes fall back to the primary once it is too old
+                self.last_error = str(error)
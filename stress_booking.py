@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Concurrent booking stress harness
+
+Fires thousands of /book-table posts at a handful of contested slots from
+many threads and processes, all through app.test_client(), against a
+throwaway copy of the database. Reports throughput, latency percentiles and
+the number of double-bookings left behind (which must be zero).
+
+With --group N every request is a /book-group post for N random tables at
+once instead. The report then adds the success and conflict rates and the
+number of groups left holding only some of their tables (which must be zero).
+
+Usage:
+    python stress_booking.py [--requests 4000] [--threads 16] [--processes 4] [--group 3]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app as booking_app
+import booking
+import db
+
+BOOKING_DATE = '2030-01-05'
+SLOT_TIMES = ['18:00', '18:30', '19:00', '19:30', '20:00']
+
+def prepare_database(path, tables=10, users=50):
+    """Create a fresh database with one restaurant, its tables and some users"""
+    booking_app.app.config['DATABASE'] = path
+    booking_app.init_db()
+    booking_app.populate_sample_data()
+
+    conn = sqlite3.connect(path)
+    for number in range(1, tables + 1):
+        conn.execute('INSERT INTO restaurant_tables (restaurant_id, table_number, capacity) VALUES (1, ?, 4)',
+                     ('S%d' % number,))
+    for number in range(1, users + 1):
+        conn.execute('INSERT INTO users (username, password, email, phone) VALUES (?, ?, ?, ?)',
+                     ('stress%d' % number, 'password123', 'stress%d@email.com' % number, '0000000000'))
+    conn.commit()
+    table_ids = [row[0] for row in conn.execute('SELECT id FROM restaurant_tables WHERE restaurant_id = 1')]
+    user_ids = [row[0] for row in conn.execute('SELECT id FROM users')]
+    conn.close()
+
+    # Never carry open SQLite connections into forked workers
+    db.reset_pools()
+    return table_ids, user_ids
+
+def run_worker(count, table_ids, user_ids, seed, group=0):
+    """Post ``count`` bookings (groups of ``group`` tables if set) from one logged-in client; return latencies"""
+    rng = random.Random(seed)
+    latencies = []
+    errors = 0
+
+    with booking_app.app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = rng.choice(user_ids)
+            sess['username'] = 'stress'
+
+        for _ in range(count):
+            form = {
+                'restaurant_id': 1,
+                'booking_date': BOOKING_DATE,
+                'booking_time': rng.choice(SLOT_TIMES),
+                'party_size': 2,
+            }
+            if group:
+                form['table_ids'] = rng.sample(table_ids, group)
+            else:
+                form['table_id'] = rng.choice(table_ids)
+            started = time.perf_counter()
+            response = client.post('/book-group' if group else '/book-table', data=form)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 302:
+                errors += 1
+
+    return latencies, errors
+
+def run_process(args):
+    """Entry point of one worker process: a thread pool of clients"""
+    path, count, threads, table_ids, user_ids, seed, group = args
+    booking_app.app.config['DATABASE'] = path
+
+    per_thread = [count // threads + (1 if i < count % threads else 0) for i in range(threads)]
+    latencies, errors = [], 0
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        futures = [pool.submit(run_worker, n, table_ids, user_ids, seed * 1000 + i, group)
+                   for i, n in enumerate(per_thread) if n]
+        for future in futures:
+            worker_latencies, worker_errors = future.result()
+            latencies.extend(worker_latencies)
+            errors += worker_errors
+    return latencies, errors
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def run_stress(requests=4000, threads=16, processes=4, tables=10, group=0):
+    """Run the harness and return a summary dict"""
+    workdir = tempfile.mkdtemp(prefix='booking-stress-')
+    path = os.path.join(workdir, 'stress.db')
+    table_ids, user_ids = prepare_database(path, tables=tables)
+
+    per_process = [requests // processes + (1 if i < requests % processes else 0) for i in range(processes)]
+    jobs = [(path, n, threads, table_ids, user_ids, i, group) for i, n in enumerate(per_process) if n]
+
+    started = time.perf_counter()
+    if processes > 1:
+        with multiprocessing.Pool(len(jobs)) as pool:
+            results = pool.map(run_process, jobs)
+    else:
+        results = [run_process(job) for job in jobs]
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for worker_latencies, _ in results for latency in worker_latencies]
+    errors = sum(worker_errors for _, worker_errors in results)
+
+    conn = sqlite3.connect(path)
+    # Parties, so a group of tables counts once
+    booked = conn.execute('SELECT COUNT(*) FROM bookings WHERE parent_id IS NULL').fetchone()[0]
+    double_bookings = booking.count_double_bookings(conn)
+    partial_groups = conn.execute('''
+        SELECT COUNT(*) FROM bookings b
+        WHERE b.parent_id IS NULL AND 1 + (SELECT COUNT(*) FROM bookings c WHERE c.parent_id = b.id) != ?
+    ''', (group or 1,)).fetchone()[0]
+    conn.close()
+
+    return {
+        'requests': len(latencies),
+        'booked': booked,
+        'taken': len(latencies) - booked - errors,
+        'errors': errors,
+        'double_bookings': double_bookings,
+        'partial_groups': partial_groups,
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        'database': path,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description='Concurrent /book-table stress harness')
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--threads', type=int, default=16, help='client threads per process')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--tables', type=int, default=10)
+    parser.add_argument('--group', type=int, default=0, help='book this many tables per request via /book-group')
+    args = parser.parse_args()
+
+    print("🍽️ Restaurant Booking System - Booking Stress Test")
+    print("=" * 50)
+    print(f"{args.requests} {'groups of %d tables' % args.group if args.group else 'bookings'} from "
+          f"{args.processes} processes x {args.threads} threads on {args.tables} tables x {len(SLOT_TIMES)} slots")
+
+    result = run_stress(args.requests, args.threads, args.processes, args.tables, args.group)
+
+    print(f"✅ Requests:        {result['requests']} ({result['errors']} errors)")
+    print(f"✅ Booked:          {result['booked']} ({result['booked'] / result['requests']:.1%})")
+    print(f"✅ Rejected taken:  {result['taken']} ({result['taken'] / result['requests']:.1%})")
+    print(f"⏱️  Throughput:      {result['throughput']:.0f} req/s")
+    print(f"⏱️  Latency p50/p99: {result['p50_ms']:.2f} ms / {result['p99_ms']:.2f} ms")
+    print(f"📁 Database:        {result['database']}")
+
+    if result['double_bookings'] or result['partial_groups']:
+        print(f"❌ Double-bookings: {result['double_bookings']}, partial groups: {result['partial_groups']}")
+        raise SystemExit(1)
+    print("🎉 Double-bookings: 0, partial groups: 0")
+
+if __name__ == '__main__':
+    main()
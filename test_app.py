@@ -3,8 +3,22 @@
 Simple test script to verify the restaurant booking system
 """
 
+import contextlib
 import sqlite3
 import os
+import pytest
+import app as booking_app
+import benchmark
+import booking
+import cache
+import catalog_import
+import generate_data
+import init_data
+import migrations
+import ratings
+import search
+import setup_database
+import waitlist
 from app import app
 
 def test_database():
@@ -62,6 +76,1012 @@ def test_routes():
         response = client.get('/admin-login')
         print(f"✅ Admin login page: Status {response.status_code}")
 
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """Logged-in test client backed by a throwaway copy of the schema"""
+    monkeypatch.setitem(app.config, 'DATABASE', str(tmp_path / 'test.db'))
+    # Tests drive waitlist promotion themselves
+    monkeypatch.setitem(app.config, 'WAITLIST_WORKER', False)
+    monkeypatch.setitem(app.config, 'SQL_SLOW_LOG', str(tmp_path / 'slow_queries.log'))
+    app.extensions.pop('catalog_cache', None)
+    app.extensions.pop('page_cache', None)
+    booking_app.init_db()
+    booking_app.populate_sample_data()
+    
+    conn = booking_app.get_db_connection()
+    conn.execute("INSERT INTO users (username, password, email, phone) VALUES ('tester', 'pw', 't@x.com', '1')")
+    for table_number, capacity in [('T1', 2), ('T2', 4)]:
+        conn.execute('INSERT INTO restaurant_tables (restaurant_id, table_number, capacity) VALUES (1, ?, ?)',
+                     (table_number, capacity))
+    conn.commit()
+    conn.close()
+    
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+            sess['username'] = 'tester'
+        yield client
+
+def book(client, table_id, date='2030-01-05', time='19:00', party_size=2):
+    return client.post('/book-table', data={'restaurant_id': 1, 'table_id': table_id, 'booking_date': date,
+                                            'booking_time': time, 'party_size': party_size})
+
+def count_bookings(table_id):
+    conn = booking_app.get_db_connection()
+    count = conn.execute('SELECT COUNT(*) FROM bookings WHERE table_id = ?', (table_id,)).fetchone()[0]
+    conn.close()
+    return count
+
+def test_slot_booking(client):
+    """A table can be rebooked for a later slot but never for an overlapping one"""
+    book(client, 1, time='19:00')
+    book(client, 1, time='19:30')
+    assert count_bookings(1) == 1
+    
+    book(client, 1, time='20:30')
+    book(client, 1, date='2030-01-06', time='19:00')
+    assert count_bookings(1) == 3
+
+def test_slot_availability(client):
+    """Restaurant details only lists tables free for the requested slot"""
+    book(client, 1, time='19:00')
+    
+    page = client.get('/restaurant/1?date=2030-01-05&time=19:30').get_data(as_text=True)
+    assert 'Table T1' not in page and 'Table T2' in page
+    
+    page = client.get('/restaurant/1?date=2030-01-05&time=21:00').get_data(as_text=True)
+    assert 'Table T1' in page
+
+def test_slot_lookup_uses_index(client):
+    """Overlap checks seek the (table, date, slot) index instead of scanning bookings"""
+    conn = booking_app.get_db_connection()
+    plan = conn.execute('EXPLAIN QUERY PLAN SELECT id FROM bookings WHERE table_id = 1 AND booking_date = ? '
+                        'AND start_minute < 100 AND end_minute > 10', ('2030-01-05',)).fetchall()
+    conn.close()
+    assert 'idx_bookings_table_slot' in ' '.join(row['detail'] for row in plan)
+
+def test_concurrent_booking_is_atomic(client):
+    """Many clients racing for one slot produce exactly one booking"""
+    from concurrent.futures import ThreadPoolExecutor
+    
+    def race(_):
+        with app.test_client() as racer:
+            with racer.session_transaction() as sess:
+                sess['user_id'] = 1
+            return book(racer, 2).status_code
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        statuses = list(pool.map(race, range(40)))
+    
+    assert statuses == [302] * 40
+    assert count_bookings(2) == 1
+
+def test_connection_pool(client):
+    """Closed connections go back to the pool and come out tuned"""
+    conn = booking_app.get_db_connection()
+    conn.close()
+    again = booking_app.get_db_connection()
+    assert again is conn
+    assert again.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    assert again.execute('PRAGMA synchronous').fetchone()[0] == 1  # NORMAL
+    again.close()
+
+def test_migrations_upgrade_in_place(tmp_path):
+    """An unversioned database keeps its rows and gains the new columns and indexes"""
+    path = str(tmp_path / 'legacy.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE bookings (id INTEGER PRIMARY KEY AUTOINCREMENT, user_id INTEGER, restaurant_id INTEGER, '
+                 'table_id INTEGER, booking_date DATE NOT NULL, booking_time TIME NOT NULL, '
+                 "party_size INTEGER NOT NULL, status TEXT DEFAULT 'confirmed')")
+    conn.execute("INSERT INTO bookings (user_id, restaurant_id, table_id, booking_date, booking_time, party_size) "
+                 "VALUES (1, 1, 1, '2025-08-31', '18:30', 4)")
+    conn.commit()
+    
+    assert migrations.migrate(conn) == migrations.SCHEMA_VERSION
+    assert migrations.schema_version(conn) == migrations.SCHEMA_VERSION
+    assert conn.execute('SELECT start_minute, end_minute FROM bookings').fetchone() == (1110, 1200)
+    
+    # A current database runs no DDL at all
+    assert migrations.migrate(conn) == 0
+    plan = conn.execute('EXPLAIN QUERY PLAN SELECT * FROM menu_items WHERE restaurant_id = 1 ORDER BY category').fetchall()
+    assert 'idx_menu_items_restaurant_category' in plan[0][3]
+    conn.close()
+
+def test_rating_aggregates(client):
+    """Ratings update the per-restaurant aggregates the listing reads"""
+    for scores in [(5, 5, 5), (2, 3, 4)]:
+        client.post('/rate-restaurant/1', data=dict(zip(['customer_service', 'food_quality', 'respect'], scores),
+                                                    review_text='ok'))
+    
+    conn = booking_app.get_db_connection()
+    stats = dict(conn.execute('SELECT * FROM restaurant_rating_stats WHERE restaurant_id = 1').fetchone())
+    assert stats['rating_count'] == 2 and stats['avg_overall'] == 4.0 and stats['avg_respect'] == 4.5
+    
+    ratings.rebuild_rating_stats(conn)
+    assert dict(conn.execute('SELECT * FROM restaurant_rating_stats WHERE restaurant_id = 1').fetchone()) == stats
+    conn.close()
+    
+    page = client.get('/restaurants/1').get_data(as_text=True)
+    assert '(4.0)' in page
+
+def test_catalog_cache_invalidation(client):
+    """Cached restaurant pages pick up a new offer as soon as the admin adds it"""
+    client.get('/restaurant/1')
+    client.get('/restaurant/1')
+    stats = booking_app.get_catalog_cache().stats()
+    assert stats['hits'] >= 2 and stats['entries'] == 2
+    
+    with client.session_transaction() as sess:
+        sess['admin_restaurant_id'] = 1
+    client.post('/admin-add-offer', data={'title': 'Flash Sale', 'description': 'Half price dosa',
+                                          'discount_percentage': 50, 'valid_from': '2020-01-01',
+                                          'valid_to': '2099-12-31'})
+    assert 'Flash Sale' in client.get('/restaurant/1').get_data(as_text=True)
+    assert client.get('/admin-cache-stats').get_json()['invalidations'] == 2
+
+def test_cache_lru_and_shared_store(tmp_path):
+    """The cache stays bounded and a shared store serves other workers"""
+    lru = cache.Cache(max_entries=2)
+    for key in 'abc':
+        lru.get_or_load(key, lambda: key.upper(), tags=('t',))
+    assert lru.stats()['entries'] == 2 and lru.stats()['evictions'] == 1
+    
+    store_path = str(tmp_path / 'cache.db')
+    first = cache.Cache(store=cache.SQLiteStore(store_path))
+    second = cache.Cache(store=cache.SQLiteStore(store_path))
+    first.get_or_load('menu', lambda: [{'item_name': 'Dosa'}], tags=('restaurant:1',))
+    assert second.get_or_load('menu', lambda: None) == [{'item_name': 'Dosa'}]
+    first.invalidate('restaurant:1')
+    assert cache.Cache(store=cache.SQLiteStore(store_path)).get_or_load('menu', lambda: 'fresh') == 'fresh'
+
+def test_admin_dashboard_keyset_pages(client):
+    """Dashboard pages walk every booking once, in order, via index range scans"""
+    conn = booking_app.get_db_connection()
+    for day in range(1, 31):
+        for time in ['12:00', '19:00']:
+            booking.create_booking(conn, 1, 1, 1 + day % 2, '2030-02-%02d' % day, booking.parse_time(time), 2)
+            conn.commit()
+    
+    seen, cursor = [], None
+    while True:
+        rows, cursor = booking.page_bookings(conn, 1, date_from='2030-02-01', after=cursor)
+        seen.extend((row['booking_date'], row['booking_time']) for row in rows)
+        if not cursor:
+            break
+    assert len(seen) == 60 and seen == sorted(seen)
+    
+    plan = ' '.join(row['detail'] for row in conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM bookings b WHERE b.restaurant_id = 1 "
+        "AND (b.booking_date, b.booking_time, b.id) > ('2030-02-03', '12:00', 5) "
+        "ORDER BY b.booking_date, b.booking_time, b.id LIMIT 26"))
+    assert 'idx_bookings_restaurant_date' in plan and 'TEMP B-TREE' not in plan
+    conn.close()
+    
+    with client.session_transaction() as sess:
+        sess['admin_restaurant_id'] = 1
+    page = client.get('/admin-dashboard?view=all').get_data(as_text=True)
+    assert page.count('<td>2030-02-') == booking.ADMIN_PAGE_SIZE and 'Next Page' in page
+
+def test_admin_exports_stream(client):
+    """Bookings and reviews export as CSV and NDJSON, honouring the date range"""
+    book(client, 1, date='2030-03-01')
+    book(client, 2, date='2030-04-01')
+    client.post('/rate-restaurant/1', data={'customer_service': 5, 'food_quality': 4, 'respect': 3,
+                                            'review_text': 'Crispy, "hot" dosa'})
+    with client.session_transaction() as sess:
+        sess['admin_restaurant_id'] = 1
+    
+    response = client.get('/admin-export/bookings.csv?date_from=2030-03-15')
+    assert response.is_streamed and response.mimetype == 'text/csv'
+    lines = response.get_data(as_text=True).splitlines()
+    assert lines[0].startswith('id,booking_date') and len(lines) == 2 and '2030-04-01' in lines[1]
+    
+    import json
+    reviews = [json.loads(line) for line in client.get('/admin-export/ratings.ndjson').get_data(as_text=True).splitlines()]
+    assert reviews[0]['review_text'] == 'Crispy, "hot" dosa' and reviews[0]['username'] == 'tester'
+    
+    assert client.get('/admin-export/users.csv').status_code == 404
+
+def test_catalog_import_is_idempotent(client):
+    """Re-importing the same files updates rows in place instead of duplicating them"""
+    import io
+    with client.session_transaction() as sess:
+        sess['admin_restaurant_id'] = 1
+    files = lambda: {
+        'restaurants': (io.BytesIO(b'city,name,cuisine_type,is_veg_only,description\n'
+                                   b'Trichy,Banana Leaf,South Indian,1,Meals on a leaf\n'), 'restaurants.csv'),
+        'menu_items': (io.BytesIO(b'[{"city": "Trichy", "restaurant": "Banana Leaf", "item_name": "Meals", '
+                                  b'"price": 150, "category": "Lunch"}]'), 'menu.json'),
+    }
+    first = client.post('/admin-import', data=files(), headers={'Accept': 'application/json'}).get_json()
+    again = client.post('/admin-import', data=files(), headers={'Accept': 'application/json'}).get_json()
+    assert first['restaurants'] == {'inserted': 1, 'updated': 0}
+    assert again['restaurants'] == {'inserted': 0, 'updated': 1}
+    assert again['menu_items'] == {'inserted': 0, 'updated': 1, 'skipped': 0}
+
+def test_catalog_import_rejects_bad_rows(client):
+    """Values are converted to their column types; a bad row fails the import with its row number"""
+    import io
+    rows = catalog_import.parse_rows('tables', 'city,restaurant,table_number,capacity\nKarur,A,5,4\n', 'csv')
+    assert rows == [('Karur', 'A', '5', 4, None)]
+    rows = catalog_import.parse_rows('menu_items', '[{"city": "Karur", "restaurant": "A", "item_name": "Dosa", '
+                                     '"price": "60", "category": "Main", "is_veg": false}]', 'json')
+    assert rows == [('Karur', 'A', 'Dosa', None, 60.0, 'Main', 0, None)]
+    
+    for kind, text, fmt, error in [
+        ('tables', 'city,restaurant,table_number,capacity\nKarur,A,1,4\nKarur,A,2,four\n', 'csv',
+         "tables row 2 has an invalid capacity: 'four'"),
+        ('tables', '[{"city": "Karur", "restaurant": "A", "table_number": "1", "capacity": 0}]', 'json',
+         'tables row 1 has an invalid capacity: 0'),
+        ('menu_items', 'city,restaurant,item_name,price,category\nKarur,A,Dosa,-5,Main\n', 'csv',
+         "menu_items row 1 has an invalid price: '-5'"),
+        ('restaurants', 'city,name,cuisine_type,is_veg_only\nKarur,A,Tamil,maybe\n', 'csv',
+         "restaurants row 1 has an invalid is_veg_only: 'maybe'"),
+        ('tables', '[1, 2]', 'json', 'tables row 1 is not an object'),
+        ('tables', '{"tables": 3}', 'json', 'tables must be a list of objects'),
+    ]:
+        with pytest.raises(catalog_import.CatalogImportError, match=error):
+            catalog_import.parse_rows(kind, text, fmt)
+    
+    with client.session_transaction() as sess:
+        sess['admin_restaurant_id'] = 1
+    response = client.post('/admin-import', data={'tables': (io.BytesIO(b'[1, 2]'), 'tables.json')},
+                           headers={'Accept': 'application/json'})
+    assert response.status_code == 400 and 'row 1' in response.get_json()['error']
+
+def test_catalog_import_bulk_speed(client):
+    """Fifty thousand menu items load in one transaction within seconds"""
+    import time
+    restaurants = [('Karur', 'Bulk %d' % n, 'South Indian', 0, None, None) for n in range(500)]
+    items = [('Karur', 'Bulk %d' % (n % 500), 'Dish %d' % n, None, 99.0, 'Main Course', 1, None) for n in range(50000)]
+    conn = booking_app.get_db_connection()
+    started = time.perf_counter()
+    summary = catalog_import.import_catalog(conn, restaurants=restaurants, menu_items=items)
+    assert time.perf_counter() - started < 10
+    assert summary['menu_items']['inserted'] == 50000
+    conn.close()
+
+def test_generated_dataset_and_benchmark(tmp_path):
+    """The generator is deterministic and every route benchmarks without errors"""
+    import datetime
+    first = generate_data.generate(str(tmp_path / 'a.db'), scale=0.002, seed=7, today=datetime.date(2030, 1, 1))
+    second = generate_data.generate(str(tmp_path / 'b.db'), scale=0.002, seed=7, today=datetime.date(2030, 1, 1))
+    assert first == second
+    assert first['restaurant_tables'] == first['restaurants'] * 50
+    assert first['bookings'] > 0 and first['ratings'] == 2000
+
+    def dump(name):
+        conn = sqlite3.connect(str(tmp_path / name))
+        rows = conn.execute('SELECT * FROM bookings ORDER BY id').fetchall()
+        conn.close()
+        return rows
+    assert dump('a.db') == dump('b.db')
+
+    results = benchmark.run_benchmark(str(tmp_path / 'a.db'), requests=3)
+    assert set(results) == {route[0] for route in benchmark.ROUTES}
+    for name, stats in results.items():
+        assert stats['errors'] == 0, name
+        assert stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms']
+
+def test_api_etags_and_fields(client):
+    """API responses revalidate with 304 until a write bumps the restaurant's version"""
+    response = client.get('/api/v1/restaurants/1/menu?fields=item_name,price')
+    etag = response.headers['ETag']
+    assert response.status_code == 200 and response.get_json() == {'data': []}
+    assert client.get('/api/v1/restaurants/1/menu?fields=item_name,price',
+                      headers={'If-None-Match': etag}).status_code == 304
+    
+    conn = booking_app.get_db_connection()
+    conn.execute("""INSERT INTO menu_items (restaurant_id, item_name, description, price, category, is_veg)
+                    VALUES (1, 'Dosa', 'Crisp', 60, 'Breakfast', 1)""")
+    conn.commit()
+    conn.close()
+    response = client.get('/api/v1/restaurants/1/menu?fields=item_name,price', headers={'If-None-Match': etag})
+    assert response.status_code == 200
+    assert response.get_json() == {'data': [{'item_name': 'Dosa', 'price': 60}]}
+    
+    listing = client.get('/api/v1/locations/1/restaurants').headers['ETag']
+    client.post('/rate-restaurant/1', data={'customer_service': 5, 'food_quality': 5, 'respect': 5,
+                                            'review_text': 'Great'})
+    response = client.get('/api/v1/locations/1/restaurants?fields=name,avg_rating',
+                          headers={'If-None-Match': listing})
+    assert {'name': 'Valluvar Restaurant', 'avg_rating': 5.0} in response.get_json()['data']
+    
+    url = '/api/v1/restaurants/1/availability?date=2030-01-05&time=19:00&party_size=3'
+    response = client.get(url)
+    assert [table['table_number'] for table in response.get_json()['data']] == ['T2']
+    book(client, 2)
+    assert client.get(url, headers={'If-None-Match': response.headers['ETag']}).get_json()['data'] == []
+    assert client.get('/api/v1/restaurants/99').status_code == 404
+    assert client.get('/api/v1/restaurants/1/availability?date=tomorrow').status_code == 400
+
+def test_search_filters_and_sync(client):
+    """Search sees menu and catalog edits through the triggers and honours every filter"""
+    conn = booking_app.get_db_connection()
+    conn.execute("""INSERT INTO menu_items (restaurant_id, item_name, description, price, category, is_veg)
+                    VALUES (2, 'Mutton Chukka', 'Pepper fry', 220, 'Starters', 0)""")
+    conn.commit()
+    assert search.search_restaurants(conn, text='chukka')[0] == [] and not conn.in_transaction
+    assert search.refresh(conn) == 1
+    rows, has_more = search.search_restaurants(conn, text='chukka')
+    assert [row['name'] for row in rows] == ['Thalapakatti Hotel'] and not has_more
+    conn.execute("UPDATE restaurants SET name = 'Thalapakatti Biryani' WHERE id = 2")
+    conn.execute("DELETE FROM menu_items WHERE restaurant_id = 2")
+    conn.commit()
+    search.refresh(conn)
+    assert search.search_restaurants(conn, text='chukka')[0] == []
+    assert search.search_restaurants(conn, text='thalapakatti biry')[0][0]['id'] == 2
+    conn.close()
+    
+    names = lambda url: [row['name'] for row in client.get(url).get_json()['data']]
+    assert sorted(names('/api/v1/search?q=bhavan&veg=1')) == ['Meenakshi Bhavan', 'Saravana Bhavan']
+    assert names('/api/v1/search?location_id=1&cuisine=south indian') == ['Valluvar Restaurant']
+    assert names('/api/v1/search?party_size=3') == ['Valluvar Restaurant']
+    book(client, 2)
+    assert names('/api/v1/search?party_size=3&date=2030-01-05&time=19:00') == []
+    client.post('/rate-restaurant/3', data={'customer_service': 5, 'food_quality': 5, 'respect': 4,
+                                            'review_text': 'Lovely'})
+    assert names('/api/v1/search?min_rating=4') == ['Saravana Bhavan']
+    
+    first = client.get('/api/v1/search?per_page=3').get_json()
+    second = client.get('/api/v1/search?per_page=3&page=2').get_json()
+    assert first['meta']['has_more'] and len(first['data']) == 3
+    assert not {row['id'] for row in first['data']} & {row['id'] for row in second['data']}
+    assert 'Saravana Bhavan' in client.get('/search?q=saravana').get_data(as_text=True)
+
+def test_setup_scripts_index_search(tmp_path, monkeypatch):
+    """The setup scripts leave their restaurants searchable without waiting for a lifecycle tick"""
+    monkeypatch.chdir(tmp_path)
+    found = lambda conn, text: [row['name'] for row in search.search_restaurants(conn, text=text)[0]]
+    setup_database.setup_complete_database()
+    conn = sqlite3.connect('restaurant_booking.db')
+    conn.row_factory = sqlite3.Row
+    assert conn.execute('SELECT COUNT(*) FROM search_pending').fetchone()[0] == 0
+    assert sorted(found(conn, 'biryani')) == ['Buhari Hotel', 'Thalapakatti Hotel']
+    assert found(conn, 'thali') == []
+    init_data.populate_sample_data()
+    assert found(conn, 'thali') == ['Valluvar Restaurant']
+    conn.close()
+
+def test_best_fit_allocation(client):
+    """Parties get the smallest table that fits, or a combination when no single table does"""
+    tables = [{'id': 1, 'capacity': 8, 'combine_group': None},
+              {'id': 2, 'capacity': 2, 'combine_group': None},
+              {'id': 3, 'capacity': 4, 'combine_group': 'hall'},
+              {'id': 4, 'capacity': 4, 'combine_group': 'hall'},
+              {'id': 5, 'capacity': 6, 'combine_group': 'hall'}]
+    assert [t['id'] for t in booking.choose_tables(tables, 2)] == [2]
+    assert [t['id'] for t in booking.choose_tables(tables, 3)] == [3]
+    assert [t['id'] for t in booking.choose_tables(tables, 10)] == [3, 5]
+    assert [t['id'] for t in booking.choose_tables(tables, 14)] == [3, 4, 5]
+    assert booking.choose_tables(tables, 15) == []
+    
+    conn = booking_app.get_db_connection()
+    conn.execute("UPDATE restaurant_tables SET combine_group = 'front' WHERE restaurant_id = 1")
+    conn.commit()
+    conn.close()
+    form = {'restaurant_id': 1, 'booking_date': '2030-01-05', 'booking_time': '19:00'}
+    response = client.post('/book-table', data=dict(form, party_size=5), follow_redirects=True)
+    assert 'Tables T1 + T2 are booked together' in response.get_data(as_text=True)
+    response = client.post('/book-table', data=dict(form, party_size=2), follow_redirects=True)
+    assert 'no table for 2 is free' in response.get_data(as_text=True)
+    response = client.post('/book-table', data=dict(form, booking_time='21:00', party_size=2), follow_redirects=True)
+    assert 'Table T1 booked' in response.get_data(as_text=True)
+    
+    with client.session_transaction() as sess:
+        sess['admin_restaurant_id'] = 1
+    page = client.get('/admin-dashboard?view=all').get_data(as_text=True)
+    assert 'T1 + T2' in page and page.count('<td>2030-01-05') == 2
+
+def test_waitlist_promotion(client):
+    """Freed tables go to the first waiting party that fits, from the queue or the background worker"""
+    import time
+    form = {'restaurant_id': 1, 'booking_date': '2030-01-05', 'booking_time': '19:00'}
+    client.post('/book-table', data=dict(form, party_size=2))
+    client.post('/book-table', data=dict(form, party_size=4))
+    response = client.post('/book-table', data=dict(form, party_size=2), follow_redirects=True)
+    assert 'Join Waitlist' in response.get_data(as_text=True)
+    
+    conn = booking_app.get_db_connection()
+    for name in ('second', 'third'):
+        conn.execute("INSERT INTO users (username, password, email, phone) VALUES (?, 'pw', 'x@x.com', '1')", (name,))
+    conn.commit()
+    client.post('/join-waitlist', data=dict(form, party_size=4))
+    assert waitlist.join(conn, 2, 1, '2030-01-05', 19 * 60, 2)
+    assert waitlist.join(conn, 3, 1, '2030-01-05', 19 * 60, 2)
+    assert waitlist.join(conn, 3, 1, '2030-01-05', 19 * 60, 2) is None
+    conn.commit()
+    
+    # T1 (2 seats) frees up: the party of 4 at the head is skipped, the first party of 2 gets it
+    small = conn.execute("SELECT id FROM bookings WHERE table_id = 1").fetchone()[0]
+    client.post('/cancel-booking/%d' % small)
+    assert waitlist.process_pending(conn, today='2030-01-01') == 1
+    statuses = conn.execute('SELECT user_id, status FROM waitlist ORDER BY id').fetchall()
+    assert [tuple(row) for row in statuses] == [(1, 'waiting'), (2, 'promoted'), (3, 'waiting')]
+    assert conn.execute('SELECT COUNT(*) FROM waitlist_pending').fetchone()[0] == 0
+    assert waitlist.process_pending(conn, today='2030-01-01') == 0
+    
+    worker = waitlist.PromotionWorker(booking_app.get_db_connection, interval=0.05)
+    worker.start()
+    try:
+        large = conn.execute("SELECT id FROM bookings WHERE table_id = 2").fetchone()[0]
+        booking.cancel_booking(conn, large)
+        conn.commit()
+        worker.wake()
+        deadline = time.time() + 5
+        while worker.promoted == 0 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        worker.stop()
+    assert worker.promoted == 1 and worker.last_error is None
+    row = conn.execute('SELECT w.status, b.table_id FROM waitlist w JOIN bookings b ON b.id = w.booking_id '
+                       'WHERE w.id = 1').fetchone()
+    conn.close()
+    assert tuple(row) == ('promoted', 2)
+    assert booking.count_double_bookings(booking_app.get_db_connection()) == 0
+    
+    page = client.get('/my-bookings').get_data(as_text=True)
+    assert 'Booked' in page and 'T2' in page
+
+def test_waitlist_expires_once_a_day(client):
+    """The promotion worker expires past entries on its first run of the day, not on every poll"""
+    conn = booking_app.get_db_connection()
+    waitlist.join(conn, 1, 1, '2000-01-05', 19 * 60, 2)
+    conn.commit()
+    worker = waitlist.PromotionWorker(booking_app.get_db_connection)
+    worker.run_once()
+    assert worker.expired == 1
+    
+    waitlist.join(conn, 1, 1, '2000-01-06', 19 * 60, 2)
+    conn.commit()
+    worker.run_once()
+    assert worker.expired == 1
+    assert conn.execute("SELECT COUNT(*) FROM waitlist WHERE status = 'waiting'").fetchone()[0] == 1
+    worker.expired_on = None
+    worker.run_once()
+    assert worker.expired == 2
+    conn.close()
+
+@contextlib.contextmanager
+def running_async_server(wsgi_app, **options):
+    """An AsyncServer for ``wsgi_app`` on a free port, with its event loop on a background thread"""
+    import asyncio
+    import threading
+    import async_server
+    
+    server = async_server.AsyncServer(wsgi_app, '127.0.0.1', 0, **options)
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    
+    def run():
+        loop.run_until_complete(server.start())
+        started.set()
+        loop.run_forever()
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    assert started.wait(5)
+    try:
+        yield server
+    finally:
+        asyncio.run_coroutine_threadsafe(server.shutdown(), loop).result(5)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join(5)
+        loop.close()
+
+def test_async_server(client):
+    """The async mode serves reads, writes and streamed responses over keep-alive HTTP"""
+    import http.client
+    
+    serializer = app.session_interface.get_signing_serializer(app)
+    cookie = 'session=' + serializer.dumps({'user_id': 1, 'username': 'tester', 'admin_restaurant_id': 1})
+    with running_async_server(app, read_threads=2, write_threads=1) as server:
+        http = http.client.HTTPConnection('127.0.0.1', server.port, timeout=5)
+        try:
+            http.request('GET', '/restaurant/1?date=2030-01-05&time=19:00', headers={'Cookie': cookie})
+            response = http.getresponse()
+            assert response.status == 200 and 'Table T2' in response.read().decode()
+            sock = http.sock
+            
+            http.request('POST', '/book-table', body='restaurant_id=1&booking_date=2030-01-05&booking_time=19:00'
+                                                     '&party_size=3',
+                         headers={'Cookie': cookie, 'Content-Type': 'application/x-www-form-urlencoded'})
+            response = http.getresponse()
+            response.read()
+            assert response.status == 302 and http.sock is sock
+            
+            http.request('GET', '/admin-export/bookings.csv', headers={'Cookie': cookie})
+            response = http.getresponse()
+            assert response.getheader('Transfer-Encoding') == 'chunked'
+            rows = response.read().decode().splitlines()
+            assert rows[0].startswith('id,booking_date') and len(rows) == 2 and ',T2,' in rows[1]
+        finally:
+            http.close()
+
+def test_async_server_slow_clients(monkeypatch):
+    """Stalled and vanished clients give their pool thread back; chunked request bodies get a 411"""
+    import socket
+    import time
+    import async_server
+    monkeypatch.setattr(async_server, 'SEND_TIMEOUT', 0.5)
+    closed = []
+    
+    def endless(environ, start_response):
+        if environ['PATH_INFO'] == '/ping':
+            start_response('200 OK', [('Content-Length', '4')])
+            return [b'pong']
+        start_response('200 OK', [('Content-Type', 'text/plain')])
+        def chunks():
+            try:
+                while True:
+                    yield b'x' * 65536
+            finally:
+                closed.append(environ['PATH_INFO'])
+        return chunks()
+    
+    def send(port, request):
+        sock = socket.socket()
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+        sock.settimeout(5)
+        sock.connect(('127.0.0.1', port))
+        sock.sendall(request)
+        return sock
+    
+    def wait_closed(path):
+        deadline = time.monotonic() + 5
+        while path not in closed and time.monotonic() < deadline:
+            time.sleep(0.05)
+        return path in closed
+    
+    # One read thread, so a client holding it on to it would block the next request
+    with running_async_server(endless, read_threads=1, write_threads=1) as server:
+        stalled = send(server.port, b'GET /stalled HTTP/1.1\r\nHost: test\r\n\r\n')
+        assert wait_closed('/stalled')
+        # ...and the server hangs up on it rather than waiting to write the rest
+        while stalled.recv(65536):
+            pass
+        ping = send(server.port, b'GET /ping HTTP/1.1\r\nHost: test\r\nConnection: close\r\n\r\n')
+        reply = b''
+        while b'pong' not in reply:
+            data = ping.recv(4096)
+            assert data
+            reply += data
+        assert reply.startswith(b'HTTP/1.1 200')
+        
+        dropped = send(server.port, b'GET /dropped HTTP/1.1\r\nHost: test\r\n\r\n')
+        assert dropped.recv(4096).startswith(b'HTTP/1.1 200')
+        dropped.close()
+        assert wait_closed('/dropped')
+        
+        chunked = send(server.port, b'POST /ping HTTP/1.1\r\nHost: test\r\nTransfer-Encoding: chunked\r\n\r\n'
+                                    b'4\r\ntest\r\n0\r\n\r\n')
+        assert chunked.recv(4096).startswith(b'HTTP/1.1 411 Length Required')
+        for sock in (stalled, ping, chunked):
+            sock.close()
+
+def test_metrics_endpoint(client):
+    """/metrics reports per-endpoint counts, latency buckets, in-flight requests and SQL work"""
+    app.extensions.pop('metrics', None)
+    client.get('/restaurant/1?date=2030-01-05&time=19:00')
+    client.get('/restaurant/1')
+    client.get('/no-such-page')
+    
+    text = client.get('/metrics').get_data(as_text=True)
+    lines = dict(line.rsplit(' ', 1) for line in text.splitlines() if not line.startswith('#'))
+    assert lines['http_requests_total{endpoint="restaurant_details",method="GET",status="200"}'] == '2'
+    assert lines['http_requests_total{endpoint="unmatched",method="GET",status="404"}'] == '1'
+    assert lines['http_request_duration_seconds_bucket{endpoint="restaurant_details",le="+Inf"}'] == '2'
+    assert lines['http_request_duration_seconds_count{endpoint="restaurant_details"}'] == '2'
+    assert lines['http_requests_in_flight{endpoint="restaurant_details"}'] == '0'
+    assert int(lines['sql_queries_total{endpoint="restaurant_details"}']) >= 2
+    # T1 and T2 are listed on both pages
+    assert int(lines['sql_rows_total{endpoint="restaurant_details"}']) >= 4
+    assert float(lines['sql_query_seconds_total{endpoint="restaurant_details"}']) > 0
+    
+    snapshot = booking_app.get_metrics().snapshot()
+    assert snapshot['metrics_endpoint']['count'] == 1 and snapshot['metrics_endpoint']['in_flight'] == 0
+    assert sum(snapshot['restaurant_details']['buckets']) == 2
+
+def test_slow_query_log(client, monkeypatch):
+    """Slow statements are logged with their route, parameter shape, plan and full-scan flags"""
+    import threading
+    import slow_queries
+    assert slow_queries.full_scans('SELECT * FROM ratings r JOIN bookings AS b ON b.user_id = r.user_id',
+                                   ['SCAN r', 'SEARCH b USING INDEX idx_bookings_user_date (user_id=?)']) == ['ratings']
+    assert slow_queries.full_scans('SELECT COUNT(*) FROM menu_items', ['SCAN menu_items USING COVERING INDEX x']) == []
+    
+    # A zero threshold logs every statement
+    monkeypatch.setitem(app.config, 'SQL_SLOW_MS', 0)
+    with client.session_transaction() as sess:
+        sess['admin_restaurant_id'] = 1
+    client.get('/admin-dashboard')
+    
+    def report():
+        conn = booking_app.get_db_connection()
+        conn.execute('SELECT COUNT(*) FROM bookings b WHERE b.party_size > ? AND b.status = ?',
+                     (2, 'confirmed')).fetchall()
+        conn.close()
+    job = threading.Thread(target=report, name='nightly-report')
+    job.start()
+    job.join()
+    
+    path = app.config['SQL_SLOW_LOG']
+    entries = list(slow_queries.read_entries(path))
+    dashboard = [entry for entry in entries if entry['route'] == 'admin_dashboard']
+    assert dashboard and all(entry['plan'] for entry in dashboard if entry['sql'].startswith('SELECT'))
+    assert not any(entry['full_scans'] for entry in dashboard)
+    scan = [entry for entry in entries if 'party_size >' in entry['sql']]
+    assert scan[0]['full_scans'] == ['bookings'] and scan[0]['params'] == '(int, str)'
+    assert scan[0]['route'] == 'nightly-report'
+    
+    ranked = slow_queries.summarize(entries, sort='count')
+    assert ranked[0]['count'] >= ranked[-1]['count']
+    monkeypatch.setattr('sys.argv', ['slow_queries.py', '--log', path, '--top', '3'])
+    slow_queries.main()
+
+def test_page_cache(client):
+    """Listing and menu pages are served from the page cache until the data behind them changes"""
+    _, pages = booking_app.get_page_cache()
+    first = client.get('/menu/1').get_data(as_text=True)
+    assert client.get('/menu/1').get_data(as_text=True) == first
+    assert client.get('/restaurants/1').status_code == 200
+    client.get('/restaurants/1')
+    assert pages.stats()['hits'] == 2
+    assert 'Welcome, tester!' in first
+    
+    # Another user gets the same cached page with their own name in it
+    with client.session_transaction() as sess:
+        sess['user_id'], sess['username'] = 2, '<b>bob</b>'
+    page = client.get('/menu/1').get_data(as_text=True)
+    assert 'Welcome, &lt;b&gt;bob&lt;/b&gt;!' in page and 'tester' not in page
+    assert pages.stats()['hits'] == 3
+    
+    # A write anywhere (here straight to SQLite) changes the data version and with it the cache key
+    conn = booking_app.get_db_connection()
+    conn.execute("INSERT INTO menu_items (restaurant_id, item_name, description, price, is_veg, category) "
+                 "VALUES (1, 'Page Cache Pie', '', 9.5, 1, 'Desserts')")
+    conn.commit()
+    conn.close()
+    booking_app.invalidate_restaurant(1)
+    assert 'Page Cache Pie' in client.get('/menu/1').get_data(as_text=True)
+    
+    # Pages with flashed messages are rendered for the request alone
+    with client.session_transaction() as sess:
+        sess['_flashes'] = [('message', 'Hello once')]
+    assert 'Hello once' in client.get('/menu/1').get_data(as_text=True)
+    assert 'Hello once' not in client.get('/menu/1').get_data(as_text=True)
+
+def test_sharding(client, tmp_path, monkeypatch):
+    """After a split each city is served from its own file, with ids that name their shard"""
+    import db
+    import shards
+    
+    book(client, 1)
+    database, shard_dir = app.config['DATABASE'], str(tmp_path / 'shards')
+    db.reset_pools()
+    copied = shards.split(database, shard_dir)
+    assert copied[1]['bookings'] == 1 and copied[1]['restaurant_tables'] == 2
+    monkeypatch.setitem(app.config, 'DB_SHARD_DIR', shard_dir)
+    app.extensions.pop('catalog_cache', None)
+    app.extensions.pop('page_cache', None)
+    
+    catalog = booking_app.get_db_connection()
+    assert catalog.execute('SELECT COUNT(*) FROM bookings').fetchone()[0] == 0
+    assert catalog.execute('SELECT COUNT(*) FROM restaurants').fetchone()[0] == 8
+    catalog.close()
+    
+    # New rows take ids from their shard's range; the copied booking keeps its id
+    book(client, 2, time='20:00', party_size=3)
+    shard = booking_app.get_db_connection(restaurant_id=1)
+    ids = [row[0] for row in shard.execute('SELECT id FROM bookings ORDER BY id')]
+    shard.close()
+    assert ids[0] == 1 and shards.location_of(ids[1]) == 1
+    assert shards.location_of(ids[0]) is None
+    
+    page = client.get('/my-bookings').get_data(as_text=True)
+    assert page.count('Valluvar Restaurant') == 2
+    with client.session_transaction() as sess:
+        sess['admin_restaurant_id'] = 1
+    assert 'tester' in client.get('/admin-dashboard').get_data(as_text=True)
+    
+    client.post('/cancel-booking/%d' % ids[1])
+    client.post('/cancel-booking/%d' % ids[0])
+    shard = booking_app.get_db_connection(location_id=1)
+    assert {row[0] for row in shard.execute('SELECT status FROM bookings')} == {'cancelled'}
+    shard.close()
+    
+    # Other cities' menus come from their own shards; a city-less search covers them all
+    assert client.get('/menu/3').status_code == 200
+    results = client.get('/api/v1/search?per_page=5&page=2').get_json()
+    assert len(results['data']) == 3 and not results['meta']['has_more']
+    assert len({row['city_name'] for row in client.get('/api/v1/search').get_json()['data']}) == 4
+
+def test_read_snapshots(client, monkeypatch):
+    """Marked routes read a snapshot that rotates without disturbing readers still on the old one"""
+    import os
+    import threading
+    monkeypatch.setitem(app.config, 'READ_SNAPSHOTS', True)
+    monkeypatch.setitem(app.config, 'READ_SNAPSHOT_INTERVAL', 3600)
+    monkeypatch.setitem(app.config, 'PAGE_CACHE_ENABLED', False)
+    manager = booking_app.get_snapshots()
+    try:
+        conn = booking_app.get_db_connection()
+        conn.execute("INSERT INTO restaurant_tables (restaurant_id, table_number, capacity) VALUES (1, 'T3', 6)")
+        conn.commit()
+        conn.close()
+        assert 'T3' not in client.get('/restaurant/1').get_data(as_text=True)
+        
+        # Writes go to the primary, so a booking is never lost to a snapshot
+        book(client, 1)
+        conn = booking_app.get_db_connection(fresh=True)
+        assert conn.execute('SELECT COUNT(*) FROM bookings').fetchone()[0] == 1
+        conn.close()
+        
+        # A reader keeps its snapshot through a rotation; the old file goes when it is done
+        with app.app_context():
+            from flask import g
+            g.snapshot_max_age = 60
+            reader = booking_app.get_db_connection()
+            old = manager.current
+            manager.refresh()
+            assert reader.execute("SELECT COUNT(*) FROM restaurant_tables WHERE table_number = 'T3'").fetchone()[0] == 0
+            assert os.path.exists(old.path)
+            reader.close()
+            assert not os.path.exists(old.path)
+        
+        # Connections idling in other threads are closed with their snapshot, not on those threads' next read
+        idle = []
+        def read():
+            conn = manager.connect(60)
+            conn.execute('SELECT 1')
+            conn.close()
+            idle.append(conn)
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        manager.refresh()
+        with pytest.raises(sqlite3.ProgrammingError, match='closed'):
+            idle[0].execute('SELECT 1')
+        assert 'T3' in client.get('/restaurant/1').get_data(as_text=True)
+        
+        # Past a route's tolerance it reads the primary instead
+        # (fresh: the test client keeps the last request's context, and with it the snapshot marker)
+        conn = booking_app.get_db_connection(fresh=True)
+        conn.execute("INSERT INTO restaurant_tables (restaurant_id, table_number, capacity) VALUES (1, 'T4', 6)")
+        conn.commit()
+        conn.close()
+        assert 'T4' not in client.get('/restaurant/1').get_data(as_text=True)
+        manager.current.taken_at -= 10
+        assert 'T4' in client.get('/restaurant/1').get_data(as_text=True)
+    finally:
+        app.extensions.pop('read_snapshots').close()
+    assert not os.path.exists(manager.directory)
+
+def test_booking_lifecycle(client):
+    """Timed ticks seat, complete and no-show parties through the due-time indexes; staff can move them too"""
+    from datetime import datetime
+    import lifecycle
+    form = {'restaurant_id': 1, 'booking_date': '2030-01-05'}
+    client.post('/book-table', data=dict(form, booking_time='19:00', party_size=2))
+    client.post('/book-table', data=dict(form, booking_time='20:00', party_size=4))
+    
+    conn = booking_app.get_db_connection(fresh=True)
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT id FROM bookings WHERE status = 'confirmed' "
+                        "AND parent_id IS NULL AND (booking_date, start_minute) <= ('2030-01-05', 1140)").fetchall()
+    assert 'idx_bookings_due_start' in ' '.join(row['detail'] for row in plan)
+    
+    def statuses():
+        return [row[0] for row in conn.execute('SELECT status FROM bookings ORDER BY id')]
+    
+    assert lifecycle.tick(conn, datetime(2030, 1, 5, 18, 59)) == {'seated': 0, 'completed': 0}
+    assert lifecycle.tick(conn, datetime(2030, 1, 5, 19, 0)) == {'seated': 1, 'completed': 0}
+    # The first slot ends at 20:30: its table is released in the same tick that seats the second party
+    assert lifecycle.tick(conn, datetime(2030, 1, 5, 20, 31), batch=1) == {'seated': 1, 'completed': 1}
+    assert statuses() == ['completed', 'seated']
+    assert booking.find_conflict(conn, 1, '2030-01-05', 19 * 60, 20 * 60 + 30) is None
+    
+    # With check-in on, parties not seated by staff become no-shows after the grace period
+    client.post('/book-table', data=dict(form, booking_date='2030-01-06', booking_time='19:00', party_size=2))
+    assert lifecycle.tick(conn, datetime(2030, 1, 6, 19, 14), no_show_minutes=15) == {'no_show': 0, 'completed': 1}
+    assert lifecycle.tick(conn, datetime(2030, 1, 6, 19, 15), no_show_minutes=15) == {'no_show': 1, 'completed': 0}
+    
+    client.post('/book-table', data=dict(form, booking_date='2030-01-07', booking_time='19:00', party_size=2))
+    latest = conn.execute('SELECT MAX(id) FROM bookings').fetchone()[0]
+    with client.session_transaction() as sess:
+        sess['admin_restaurant_id'] = 1
+    page = client.get('/admin-dashboard?view=all').get_data(as_text=True)
+    assert 'Seat' in page and 'name="page_view" value="all"' in page
+    assert client.post('/admin-booking/%d/status' % latest, data={'status': 'bogus'}).status_code == 400
+    # Staff go back to the dashboard page they were on, never to wherever the Referer points
+    response = client.post('/admin-booking/%d/status' % latest, data={'status': 'seated', 'page_view': 'all'},
+                           headers={'Referer': 'https://evil.example/'})
+    assert response.headers['Location'] == '/admin-dashboard?view=all'
+    client.post('/admin-booking/%d/status' % latest, data={'status': 'completed'})
+    response = client.post('/admin-booking/%d/status' % latest, data={'status': 'no_show'}, follow_redirects=True)
+    assert 'can no longer be changed' in response.get_data(as_text=True)
+    assert statuses() == ['completed', 'completed', 'no_show', 'completed']
+    conn.close()
+    
+    client.post('/book-table', data=dict(form, booking_date='2030-01-08', booking_time='12:00', party_size=2))
+    scheduler = lifecycle.LifecycleScheduler(lambda: booking_app.get_db_connection(fresh=True))
+    assert scheduler.run_once(datetime(2030, 1, 9)) == {'seated': 1, 'completed': 1, 'offers_activated': 0,
+                                                         'offers_expired': 0, 'keys_expired': 0,
+                                                         'search_refreshed': 0}
+
+def test_background_workers_start_once_under_reloader(client, monkeypatch):
+    """Under the reloader only the serving process starts the promotion worker and the lifecycle scheduler"""
+    monkeypatch.setitem(app.config, 'WAITLIST_WORKER', True)
+    for name in ('waitlist_worker', 'lifecycle_scheduler'):
+        monkeypatch.delitem(app.extensions, name, raising=False)
+    monkeypatch.delenv('WERKZEUG_RUN_MAIN', raising=False)
+    booking_app.start_background_workers(reloader=True)
+    assert 'waitlist_worker' not in app.extensions and 'lifecycle_scheduler' not in app.extensions
+    
+    monkeypatch.setenv('WERKZEUG_RUN_MAIN', 'true')
+    booking_app.start_background_workers(reloader=True)
+    workers = [app.extensions.pop('waitlist_worker'), app.extensions.pop('lifecycle_scheduler')]
+    try:
+        assert all(worker._thread.is_alive() for worker in workers)
+    finally:
+        for worker in workers:
+            worker.stop()
+
+def test_offer_windows(client):
+    """Offers show only inside their validity window, on detail pages, listing badges and the API"""
+    import offers
+    conn = booking_app.get_db_connection(fresh=True)
+    conn.executemany('INSERT INTO special_offers (restaurant_id, title, description, discount_percentage, '
+                     'valid_from, valid_to, is_active) VALUES (1, ?, ?, 10, ?, ?, ?)',
+                     [('Old Deal', 'ended', '2020-01-01', '2020-12-31', 1),
+                      ('Forever Deal', 'open', None, None, 1),
+                      ('Spring Deal', 'upcoming', '2030-03-01', '2030-03-31', 0)])
+    conn.commit()
+    
+    titles = lambda day: [offer['title'] for offer in offers.active_offers(conn, [1, 2], day).get(1, [])]
+    assert titles('2020-06-01') == ['Old Deal', 'Forever Deal']
+    assert titles('2030-03-31') == ['Forever Deal', 'Spring Deal']
+    plan = conn.execute(f"EXPLAIN QUERY PLAN SELECT * FROM special_offers WHERE restaurant_id IN (1, 2) "
+                        f"AND {offers.STARTS} <= '2030-01-01' AND {offers.ENDS} >= '2030-01-01'").fetchall()
+    assert 'idx_special_offers_window' in ' '.join(row['detail'] for row in plan)
+    
+    assert offers.refresh_flags(conn, '2030-03-15') == (1, 1)
+    assert offers.refresh_flags(conn, '2030-03-15') == (0, 0)
+    active = [row[0] for row in conn.execute('SELECT title FROM special_offers WHERE is_active = 1 ORDER BY id')]
+    assert active == ['Forever Deal', 'Spring Deal']
+    conn.close()
+    
+    page = client.get('/restaurant/1').get_data(as_text=True)
+    assert 'Forever Deal' in page and 'Old Deal' not in page and 'Spring Deal' not in page
+    listing = client.get('/restaurants/1').get_data(as_text=True)
+    assert 'offer-badge' in listing and 'Forever Deal' in listing
+    assert booking_app.get_location_offers(1, '2030-03-15')[1][1]['title'] == 'Spring Deal'
+    
+    data = client.get('/api/v1/restaurants/1/offers?date=2020-06-01').get_json()['data']
+    assert [offer['title'] for offer in data] == ['Old Deal', 'Forever Deal']
+    assert client.get('/api/v1/restaurants/1/offers?date=soon').status_code == 400
+
+def test_analytics_rollups(client):
+    """Triggers keep the hourly rollups in step with bookings and ratings; the NumPy rebuild agrees"""
+    import analytics
+    form = {'restaurant_id': 1, 'booking_date': '2030-01-05'}
+    client.post('/book-table', data=dict(form, booking_time='19:00', party_size=2))
+    client.post('/book-table', data=dict(form, booking_time='19:30', party_size=4))
+    conn = booking_app.get_db_connection(fresh=True)
+    hourly = lambda: [tuple(row) for row in conn.execute(
+        'SELECT hour, parties, covers, table_minutes FROM booking_hourly ORDER BY hour')]
+    assert hourly() == [(19, 2, 6, 90), (20, 0, 0, 90)]
+    
+    second = conn.execute('SELECT MAX(id) FROM bookings').fetchone()[0]
+    client.post('/cancel-booking/%d' % second)
+    conn.execute("UPDATE bookings SET status = 'seated' WHERE id < ?", (second,))
+    ratings.record_rating(conn, 1, 1, 5, 4, 3, 'Good')
+    conn.commit()
+    assert hourly() == [(19, 1, 2, 60), (20, 0, 0, 30)]
+    assert conn.execute('SELECT rating_count, overall_sum FROM rating_daily').fetchone()[:] == (1, 4.0)
+    
+    pytest.importorskip('numpy')
+    rollups = lambda: [tuple(row) for table in ('booking_hourly', 'rating_daily')
+                       for row in conn.execute('SELECT * FROM %s ORDER BY 1, 2, 3' % table)]
+    triggered = rollups()
+    assert analytics.rebuild(conn) == (2, 1)
+    conn.commit()
+    assert rollups() == triggered
+    conn.close()
+    
+    with client.session_transaction() as sess:
+        sess['admin_restaurant_id'] = 1
+    page = client.get('/admin-analytics?date_from=2030-01-05&date_to=2030-01-05').get_data(as_text=True)
+    assert '19:00' in page and '50%' in page
+    response = client.get('/admin-analytics?date_from=2030-02-01&date_to=2030-01-01')
+    assert response.status_code == 302
+
+def test_group_booking(client):
+    """A group gets all its tables in one transaction or none of them, even when racing other groups"""
+    from concurrent.futures import ThreadPoolExecutor
+    conn = booking_app.get_db_connection(fresh=True)
+    conn.executemany('INSERT INTO restaurant_tables (restaurant_id, table_number, capacity) VALUES (1, ?, ?)',
+                     [('T3', 4), ('T4', 6)])
+    conn.commit()
+    assert [table['capacity'] for table in booking.spread_seats(
+        [{'id': n, 'capacity': c} for n, c in enumerate([2, 4, 4, 6, 8])], 9)] == [8, 2]
+    
+    form = {'restaurant_id': 1, 'booking_date': '2030-01-05', 'booking_time': '19:00'}
+    response = client.post('/book-group', data=dict(form, party_size=6, table_ids=[1, 2]), follow_redirects=True)
+    assert 'Tables T1 + T2 are booked for your group of 6!' in response.get_data(as_text=True)
+    response = client.post('/book-group', data=dict(form, party_size=8, table_ids=[2, 3]), follow_redirects=True)
+    assert 'T2 is no longer free' in response.get_data(as_text=True)
+    assert conn.execute('SELECT COUNT(*) FROM bookings WHERE table_id = 3').fetchone()[0] == 0
+    response = client.post('/book-group', data=dict(form, party_size=9, table_ids=[3]), follow_redirects=True)
+    assert 'Those tables seat 4, not 9.' in response.get_data(as_text=True)
+    
+    # No tables ticked: the system spreads the seats, largest table first
+    response = client.post('/book-group', data=dict(form, party_size=10), follow_redirects=True)
+    assert 'Tables T4 + T3 are booked for your group of 10!' in response.get_data(as_text=True)
+    response = client.post('/book-group', data=dict(form, party_size=2), follow_redirects=True)
+    assert 'not enough free tables' in response.get_data(as_text=True)
+    
+    group = conn.execute('SELECT id FROM bookings WHERE table_id = 1').fetchone()[0]
+    client.post('/cancel-booking/%d' % group)
+    assert conn.execute("SELECT COUNT(*) FROM bookings WHERE status = 'confirmed'").fetchone()[0] == 2
+    
+    # Overlapping groups race for the same evening: winners hold every table they asked for, losers none
+    def race(tables):
+        with app.test_client() as racer:
+            with racer.session_transaction() as sess:
+                sess['user_id'] = 1
+            racer.post('/book-group', data=dict(form, booking_time='21:00', party_size=4, table_ids=tables))
+    
+    with ThreadPoolExecutor(max_workers=6) as pool:
+        list(pool.map(race, [[1, 2], [2, 3], [3, 4], [4, 1], [1, 3], [2, 4]] * 3))
+    sizes = [row[0] for row in conn.execute(
+        "SELECT 1 + (SELECT COUNT(*) FROM bookings c WHERE c.parent_id = b.id) FROM bookings b "
+        "WHERE b.start_minute = 1260 AND b.parent_id IS NULL AND b.status = 'confirmed'")]
+    assert sizes == [2, 2] and booking.count_double_bookings(conn) == 0
+    conn.close()
+
+def test_idempotency_keys(client):
+    """A repeated key returns the first response without writing again, even when the repeats race"""
+    from concurrent.futures import ThreadPoolExecutor
+    import time
+    import idempotency
+    conn = booking_app.get_db_connection(fresh=True)
+    assert 'name="idempotency_key"' in client.get('/restaurant/1').get_data(as_text=True)
+    
+    form = {'restaurant_id': 1, 'booking_date': '2030-01-05', 'booking_time': '19:00', 'party_size': 2}
+    first = client.post('/book-table', data=dict(form, idempotency_key='tap'), follow_redirects=True)
+    again = client.post('/book-table', data=dict(form, idempotency_key='tap'), follow_redirects=True)
+    assert 'Table T1 booked successfully!' in first.get_data(as_text=True)
+    assert 'Table T1 booked successfully!' in again.get_data(as_text=True)
+    assert conn.execute('SELECT COUNT(*) FROM bookings').fetchone()[0] == 1
+    
+    # Nothing written, nothing remembered: a retry of a failed post tries again
+    response = client.post('/book-table', data=dict(form, table_id=1), headers={'Idempotency-Key': 'busy'},
+                           follow_redirects=True)
+    assert 'no longer available' in response.get_data(as_text=True)
+    assert [row[0] for row in conn.execute('SELECT idem_key FROM idempotency_keys')] == ['tap']
+    assert client.post('/book-table', data=dict(form, idempotency_key='x' * 129)).status_code == 400
+    
+    rating = {'customer_service': 5, 'food_quality': 4, 'respect': 3, 'review_text': 'Good'}
+    for key in ['r1', 'r1', 'r2']:
+        client.post('/rate-restaurant/1', data=rating, headers={'Idempotency-Key': key})
+    assert conn.execute('SELECT rating_count FROM restaurant_rating_stats').fetchone()[0] == 2
+    
+    # Unkeyed, racing taps of the allocator form would book both T1 and T2 at 21:00
+    def tap(_):
+        with app.test_client() as racer:
+            with racer.session_transaction() as sess:
+                sess['user_id'] = 1
+            racer.post('/book-table', data=dict(form, booking_time='21:00', idempotency_key='race'))
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(tap, range(16)))
+    assert conn.execute('SELECT COUNT(*) FROM bookings WHERE start_minute = 1260').fetchone()[0] == 1
+    
+    later = time.time() + idempotency.TTL_SECONDS + 1
+    assert idempotency.lookup(conn, 1, 'book_table', 'tap', now=later) is None
+    conn.rollback()
+    assert idempotency.purge(conn, later) == 4
+    conn.close()
+
 def main():
     print("🍽️ Restaurant Booking System - Test Suite")
     print("=" * 50)
@@ -0,0 +1,38 @@
+"""Per-restaurant data versions and the ETags derived from them.
+
+Triggers (migration ``data_versions``) bump a restaurant's
+``catalog_version`` on any write to the restaurant, its tables, menu,
+offers or rating aggregates, and its ``booking_version`` on any booking
+write.  Reading a version is a primary-key lookup, so a response's ETag can
+be computed, and a 304 answered, without building the payload.  Writes made
+outside the app (imports, CLI scripts, another process) bump versions too.
+"""
+
+import hashlib
+
+
+def restaurant_version(conn, restaurant_id):
+    """``(catalog_version, booking_version)`` of a restaurant, or None if it does not exist"""
+    row = conn.execute('''
+        SELECT COALESCE(v.catalog_version, 0), COALESCE(v.booking_version, 0)
+        FROM restaurants r
+        LEFT JOIN restaurant_versions v ON v.restaurant_id = r.id
+        WHERE r.id = ?
+    ''', (restaurant_id,)).fetchone()
+    return tuple(row) if row else None
+
+
+def location_version(conn, location_id):
+    """A value that changes whenever any restaurant in the city changes, is added or is removed"""
+    row = conn.execute('''
+        SELECT COUNT(*), MAX(r.id), TOTAL(v.catalog_version)
+        FROM restaurants r
+        LEFT JOIN restaurant_versions v ON v.restaurant_id = r.id
+        WHERE r.location_id = ?
+    ''', (location_id,)).fetchone()
+    return tuple(row)
+
+
+def make_etag(*parts):
+    """Short, stable ETag value for any repr-able parts"""
+    return hashlib.sha1(repr(parts).encode('utf-8')).hexdigest()[:20]
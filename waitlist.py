@@ -0,0 +1,186 @@
+"""Waitlist for fully booked slots, with automatic promotion.
+
+A party that finds no free table can join the waitlist for its restaurant,
+date, time and party size.  Whenever capacity may have come back (a booking
+is cancelled or deleted, a table is added or put back in service) triggers
+queue that restaurant and date in ``waitlist_pending``.
+
+process_pending() drains the queue: for each queued date it walks the
+waiting parties first come, first served and books every one that now fits,
+using the same allocator as a normal booking.  A larger party at the head of
+the list does not hold up a smaller one behind it that fits.  It runs on a
+PromotionWorker thread, so a cancellation costs a request one trigger insert
+however long the waitlist is.
+
+expire() closes entries whose date has passed.  The worker runs it once a
+day, on its first run after the date changes, so an idle poll takes no write
+lock.
+"""
+
+import sqlite3
+import threading
+from datetime import date
+
+import booking
+
+WAITLIST_STATUSES = ('waiting', 'promoted', 'expired', 'left')
+
+# Queued (restaurant, date) pairs handled per run
+PENDING_BATCH = 100
+
+POLL_SECONDS = 2.0
+
+
+def join(conn, user_id, restaurant_id, booking_date, start_minute, party_size,
+         duration=booking.DEFAULT_DURATION_MINUTES):
+    """Put a party on the waitlist; return the entry id, or ``None`` if already waiting for that slot"""
+    cursor = conn.execute('''
+        INSERT OR IGNORE INTO waitlist
+            (user_id, restaurant_id, booking_date, booking_time, start_minute, duration_minutes, party_size)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (user_id, restaurant_id, booking_date, booking.format_time(start_minute), start_minute, duration,
+          party_size))
+    return cursor.lastrowid if cursor.rowcount else None
+
+
+def leave(conn, entry_id, user_id):
+    """Take a user's waiting entry off the list; return True if it was still waiting"""
+    cursor = conn.execute("UPDATE waitlist SET status = 'left' WHERE id = ? AND user_id = ? AND status = 'waiting'",
+                          (entry_id, user_id))
+    return cursor.rowcount > 0
+
+
+def user_entries(conn, user_id, date_from):
+    """A user's waitlist entries from ``date_from`` on, with the restaurant name"""
+    return conn.execute('''
+        SELECT w.*, r.name AS restaurant_name
+        FROM waitlist w
+        JOIN restaurants r ON r.id = w.restaurant_id
+        WHERE w.user_id = ? AND w.booking_date >= ? AND w.status IN ('waiting', 'promoted')
+        ORDER BY w.booking_date, w.start_minute, w.id
+    ''', (user_id, date_from)).fetchall()
+
+
+def promote(conn, restaurant_id, booking_date):
+    """Book every waiting party for the date that now fits, in FIFO order.
+
+    Must run inside the caller's write transaction.  Returns the ids of the
+    promoted entries.
+    """
+    waiting = conn.execute('''
+        SELECT id, user_id, start_minute, duration_minutes, party_size FROM waitlist
+        WHERE restaurant_id = ? AND booking_date = ? AND status = 'waiting'
+        ORDER BY id
+    ''', (restaurant_id, booking_date)).fetchall()
+
+    promoted = []
+    # Smallest party that could not be seated per slot; tables only get
+    # taken during a pass, so anyone as large for that slot is skipped
+    no_room = {}
+    for entry in waiting:
+        slot = (entry['start_minute'], entry['duration_minutes'])
+        if entry['party_size'] >= no_room.get(slot, float('inf')):
+            continue
+        booking_id, _ = booking.book_party(conn, entry['user_id'], restaurant_id, booking_date,
+                                           entry['start_minute'], entry['party_size'], entry['duration_minutes'])
+        if booking_id is None:
+            no_room[slot] = entry['party_size']
+            continue
+        conn.execute('''UPDATE waitlist SET status = 'promoted', booking_id = ?, promoted_at = CURRENT_TIMESTAMP
+                        WHERE id = ?''', (booking_id, entry['id']))
+        promoted.append(entry['id'])
+    return promoted
+
+
+def expire(conn, today):
+    """Close entries for dates that have passed; return how many"""
+    cursor = conn.execute("UPDATE waitlist SET status = 'expired' WHERE status = 'waiting' AND booking_date < ?",
+                          (today,))
+    conn.commit()
+    return cursor.rowcount
+
+
+def process_pending(conn, today=None, limit=PENDING_BATCH):
+    """Promote waiting parties for up to ``limit`` queued dates; return how many were promoted.
+
+    Each date is dequeued and promoted in one ``BEGIN IMMEDIATE``
+    transaction, so a promotion is never half-applied and two workers never
+    promote the same entry.
+    """
+    today = today or date.today().isoformat()
+    promoted = 0
+    queued = conn.execute('SELECT restaurant_id, booking_date FROM waitlist_pending LIMIT ?', (limit,)).fetchall()
+    for restaurant_id, booking_date in queued:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM waitlist_pending WHERE restaurant_id = ? AND booking_date = ?',
+                         (restaurant_id, booking_date))
+            if booking_date >= today:
+                promoted += len(promote(conn, restaurant_id, booking_date))
+        except Exception:
+            conn.rollback()
+            raise
+        conn.commit()
+    return promoted
+
+
+class PromotionWorker:
+    """Daemon thread that runs process_pending() every ``interval`` seconds, or at once when woken"""
+
+    def __init__(self, connect, interval=POLL_SECONDS):
+        self.connect = connect
+        self.interval = interval
+        self.runs = self.promoted = self.expired = 0
+        self.expired_on = None
+        self.last_error = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='waitlist-promotion', daemon=True)
+                self._thread.start()
+
+    def wake(self):
+        """Ask for a run now instead of at the next poll"""
+        self._wake.set()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def run_once(self):
+        # connect() returns a connection, or a list of them (one per shard) processed in turn
+        connections = self.connect()
+        if not isinstance(connections, list):
+            connections = [connections]
+        today = date.today().isoformat()
+        promoted = 0
+        try:
+            for conn in connections:
+                if self.expired_on != today:
+                    self.expired += expire(conn, today)
+                promoted += process_pending(conn, today)
+        finally:
+            for conn in connections:
+                conn.close()
+        self.expired_on = today
+        self.runs += 1
+        self.promoted += promoted
+        return promoted
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except sqlite3.Error as error:
+                # Busy or locked: the queue is still there, retry on the next round
+                self.last_error = str(error)
+            self._wake.wait(self.interval)
+            self._wake.clear()